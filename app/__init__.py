@@ -4,16 +4,20 @@ Flask application factory for H2 System
 import os
 from flask import Flask, redirect
 from config import config
-from .extensions import db, login_manager
+from .extensions import db, login_manager, cache
 from flask import redirect, url_for
 
 
-def create_app(config_name=None):
+def create_app(config_name=None, load_routes=True, overrides=None):
     """
     Application factory function
     
     Args:
         config_name: Configuration name (development, testing, production)
+        load_routes: Import and register the blueprints. CLI commands that only
+            need the database pass False to skip importing every route module.
+        overrides: Config values set on top of the configuration (e.g. by
+            ``cli.py serve`` for settings that depend on the worker count)
     
     Returns:
         Flask application instance
@@ -26,24 +30,53 @@ def create_app(config_name=None):
     
     # Load configuration
     app.config.from_object(config[config_name])
+    app.config.update(overrides or {})
     
     # Initialize extensions
     db.init_app(app)
     login_manager.init_app(app)
+    cache.init_app(app)
+    
+    # Import models so every table is registered, even when routes aren't loaded
+    from app import models  # noqa: F401
     
     # Register user loader for Flask-Login
-    from app.models import User
+    from app.auth.utils import init_user_cache, load_cached_user
+    from app.auth.ratelimit import init_login_limiter
+    init_user_cache(app)
+    init_login_limiter(app)
     
     @login_manager.user_loader
     def load_user(user_id):
         """Load user by ID for Flask-Login"""
-        return User.query.get(int(user_id))
+        return load_cached_user(int(user_id))
+    
+    # Serve fingerprinted static files from the last build
+    from app.static_build import init_static
+    init_static(app)
+    
+    # Compress responses and answer conditional GETs with 304
+    from app.responses import init_responses
+    init_responses(app)
+    
+    # Broker for live dashboard updates
+    from app.live.broker import init_live
+    init_live(app)
+    
+    # Deliver domain events recorded in the outbox
+    from app.outbox import init_outbox
+    init_outbox(app)
+    
+    # Scope hostel-partitioned tables to the current hostel
+    from app.tenancy import init_tenancy
+    init_tenancy(app)
     
     # Register error handlers
     register_error_handlers(app)
     
     # Register blueprints
-    register_blueprints(app)
+    if load_routes:
+        register_blueprints(app)
     
     # Create database tables
     # with app.app_context():
@@ -66,6 +99,10 @@ def register_blueprints(app):
     from app.dashboards.routes import dashboards_bp
     from app.main.routes import main_bp
     from app.equipment import equipment_bp
+    from app.exports.routes import exports_bp
+    from app.api.routes import api_bp
+    from app.live.routes import live_bp
+    from app.analytics.routes import analytics_bp
     
     app.register_blueprint(main_bp)
     app.register_blueprint(auth_bp)
@@ -76,6 +113,10 @@ def register_blueprints(app):
     app.register_blueprint(sickleave_bp, url_prefix='/sickleave')
     app.register_blueprint(dashboards_bp, url_prefix='/dashboard')
     app.register_blueprint(equipment_bp)
+    app.register_blueprint(exports_bp, url_prefix='/exports')
+    app.register_blueprint(api_bp, url_prefix='/api/v1')
+    app.register_blueprint(live_bp, url_prefix='/live')
+    app.register_blueprint(analytics_bp, url_prefix='/analytics')
 
 
 def register_error_handlers(app):
@@ -0,0 +1,232 @@
+"""
+Daily rollup tables for trend reporting
+
+Trend reports read small daily aggregates instead of scanning the workflow
+tables. Each total is kept per hostel, so reading the rollups (a hostel-scoped
+table) gives the current hostel's trends, or the sum of every hostel when
+working across all of them. ``refresh_rollups`` folds in only what is new
+since the last run (rows recorded, or decisions stamped, more than
+ROLLUP_SETTLE_SECONDS ago):
+
+    visits            doctor visits per day (by when they were recorded)
+    diagnosis         visits per day per diagnosis, normalised to lower case
+    equipment_issued  issues per day per equipment category; total = units
+    stage_turnaround  sick leave decisions per day per stage; total = hours the
+                      stage took (by decision timestamp, since decisions are
+                      stamped on existing requests)
+
+Dispensing volume comes from the ``medicine_consumption`` series maintained
+for reorder forecasting. Visits are rolled up with the diagnosis recorded when
+they are first processed; ``rebuild_rollups`` recomputes everything.
+"""
+from collections import defaultdict
+from datetime import date, timedelta
+
+from flask import current_app
+from sqlalchemy import bindparam, func, insert, select
+
+from app.extensions import db, cache
+from app.models import (DailyRollup, DoctorVisit, EquipmentIssue, MedicalEquipment, Medicine,
+                        MedicineConsumption, SickLeaveRequest)
+from app.stock.forecast import rebuild_consumption, refresh_consumption
+from app.tenancy import all_hostels
+from app.watermarks import advance_window, in_window, pending_window, reset
+from .workflow import STAGES
+
+DIMENSION_LENGTH = 100
+ROLLUP_METRICS = ('visits', 'diagnosis', 'equipment_issued', 'stage_turnaround')
+
+
+def _as_date(value):
+    # SQLite returns date() as text, other databases as a date
+    return value if isinstance(value, date) else date.fromisoformat(str(value))
+
+
+def merge_totals(metric, totals):
+    """Add {(day, dimension, hostel_id): (count, total)} to the rollup rows of one metric (every hostel)"""
+    if not totals:
+        return 0
+    rollups = DailyRollup.__table__
+    existing = {tuple(row) for row in db.session.execute(
+        select(rollups.c.day, rollups.c.dimension, rollups.c.hostel_id)
+        .where(rollups.c.metric == metric, rollups.c.day.in_({key[0] for key in totals}))
+    )}
+
+    updates = [{'key_day': day, 'key_dimension': dimension, 'key_hostel': hostel_id,
+                'add_count': count, 'add_total': total}
+               for (day, dimension, hostel_id), (count, total) in totals.items()
+               if (day, dimension, hostel_id) in existing]
+    if updates:
+        db.session.execute(
+            rollups.update()
+            .where(rollups.c.metric == metric, rollups.c.day == bindparam('key_day'),
+                   rollups.c.dimension == bindparam('key_dimension'),
+                   rollups.c.hostel_id.is_not_distinct_from(bindparam('key_hostel')))
+            .values(count=rollups.c.count + bindparam('add_count'), total=rollups.c.total + bindparam('add_total')),
+            updates
+        )
+    inserts = [{'metric': metric, 'day': day, 'dimension': dimension, 'hostel_id': hostel_id,
+                'count': count, 'total': total}
+               for (day, dimension, hostel_id), (count, total) in totals.items()
+               if (day, dimension, hostel_id) not in existing]
+    if inserts:
+        db.session.execute(insert(DailyRollup), inserts)
+    return len(totals)
+
+
+def _settled_window(name):
+    return pending_window(name, current_app.config['ROLLUP_SETTLE_SECONDS'])
+
+
+def _roll_up_visits():
+    last_at, high = _settled_window('rollup_visits')
+
+    day = func.date(DoctorVisit.visit_date)
+    diagnosis = func.lower(func.trim(func.coalesce(DoctorVisit.diagnosis, '')))
+    visits, diagnoses = defaultdict(lambda: [0, 0.0]), {}
+    for hostel_id, day_value, diagnosis_text, count in db.session.execute(
+            select(DoctorVisit.hostel_id, day, diagnosis, func.count(DoctorVisit.id))
+            .where(in_window(DoctorVisit.created_at, last_at, high))
+            .group_by(DoctorVisit.hostel_id, day, diagnosis)):
+        day_value = _as_date(day_value)
+        visits[(day_value, '', hostel_id)][0] += count
+        if diagnosis_text:
+            key = (day_value, diagnosis_text[:DIMENSION_LENGTH], hostel_id)
+            diagnoses[key] = (diagnoses.get(key, (0, 0.0))[0] + count, 0.0)
+
+    changed = merge_totals('visits', {key: tuple(value) for key, value in visits.items()})
+    changed += merge_totals('diagnosis', diagnoses)
+    advance_window('rollup_visits', last_at, high)
+    return changed
+
+
+def _roll_up_equipment_issues():
+    last_at, high = _settled_window('rollup_equipment_issues')
+
+    day = func.date(EquipmentIssue.issued_date)
+    category = func.coalesce(MedicalEquipment.category, '')
+    totals = {
+        (_as_date(day_value), (category_name or '')[:DIMENSION_LENGTH], hostel_id): (count, float(units or 0))
+        for hostel_id, day_value, category_name, count, units in db.session.execute(
+            select(EquipmentIssue.hostel_id, day, category, func.count(EquipmentIssue.id),
+                   func.sum(EquipmentIssue.quantity))
+            .join(MedicalEquipment, EquipmentIssue.equipment_id == MedicalEquipment.id)
+            .where(in_window(EquipmentIssue.created_at, last_at, high))
+            .group_by(EquipmentIssue.hostel_id, day, category))
+    }
+
+    changed = merge_totals('equipment_issued', totals)
+    advance_window('rollup_equipment_issues', last_at, high)
+    return changed
+
+
+def _roll_up_stage_turnaround():
+    last_at, high = _settled_window('rollup_stage_turnaround')
+
+    totals = defaultdict(lambda: [0, 0.0])
+    for stage, definition in STAGES.items():
+        decided, started = definition.decided, definition.started
+        query = select(SickLeaveRequest.hostel_id, decided, started) \
+            .where(decided.is_not(None), started.is_not(None), in_window(decided, last_at, high))
+        for hostel_id, decided_at, started_at in db.session.execute(query):
+            bucket = totals[(decided_at.date(), stage, hostel_id)]
+            bucket[0] += 1
+            bucket[1] += max((decided_at - started_at).total_seconds(), 0) / 3600
+
+    changed = merge_totals('stage_turnaround', {key: tuple(value) for key, value in totals.items()})
+    advance_window('rollup_stage_turnaround', last_at, high)
+    return changed
+
+
+@all_hostels()
+def refresh_rollups():
+    """
+    Fold new visits, equipment issues, sick leave decisions and dispensing into the rollups
+
+    Runs across every hostel, whichever one the caller works in. Nothing is
+    committed; the caller commits (or rolls back on WatermarkConflict).
+
+    Returns:
+        Number of daily totals changed
+    """
+    return (_roll_up_visits() + _roll_up_equipment_issues() + _roll_up_stage_turnaround()
+            + refresh_consumption())
+
+
+@all_hostels()
+def rebuild_rollups():
+    """Discard every rollup and recompute it from the source tables (caller commits)"""
+    db.session.execute(DailyRollup.__table__.delete().where(DailyRollup.metric.in_(ROLLUP_METRICS)))
+    for name in ('rollup_visits', 'rollup_equipment_issues', 'rollup_stage_turnaround'):
+        reset(name)
+    return _roll_up_visits() + _roll_up_equipment_issues() + _roll_up_stage_turnaround() + rebuild_consumption()
+
+
+def _week_start(day):
+    return day - timedelta(days=day.weekday())
+
+
+def _weekly(rows, weeks, today):
+    """Fold (day, count, total) rows into per-week [count, total] buckets, oldest week first"""
+    first = _week_start(today) - timedelta(weeks=weeks - 1)
+    buckets = [{'week': first + timedelta(weeks=offset), 'count': 0, 'total': 0.0} for offset in range(weeks)]
+    for day, count, total in rows:
+        index = (_week_start(day) - first).days // 7
+        if 0 <= index < weeks:
+            buckets[index]['count'] += count or 0
+            buckets[index]['total'] += total or 0.0
+    return buckets
+
+
+def _metric_by_day(metric, start, dimension=None):
+    query = db.session.query(DailyRollup.day, func.sum(DailyRollup.count), func.sum(DailyRollup.total)) \
+        .filter(DailyRollup.metric == metric, DailyRollup.day >= start)
+    if dimension is not None:
+        query = query.filter(DailyRollup.dimension == dimension)
+    return query.group_by(DailyRollup.day).all()
+
+
+def _compute_trends(weeks, today):
+    start = _week_start(today) - timedelta(weeks=weeks - 1)
+
+    top_diagnoses = db.session.query(DailyRollup.dimension, func.sum(DailyRollup.count).label('visits')) \
+        .filter(DailyRollup.metric == 'diagnosis', DailyRollup.day >= start) \
+        .group_by(DailyRollup.dimension).order_by(func.sum(DailyRollup.count).desc()).limit(10).all()
+
+    dispensed = db.session.query(MedicineConsumption.day, func.sum(MedicineConsumption.quantity)) \
+        .join(Medicine, MedicineConsumption.medicine_id == Medicine.id) \
+        .filter(MedicineConsumption.day >= start).group_by(MedicineConsumption.day).all()
+    top_medicines = db.session.query(Medicine.name, func.sum(MedicineConsumption.quantity).label('units')) \
+        .join(Medicine, MedicineConsumption.medicine_id == Medicine.id) \
+        .filter(MedicineConsumption.day >= start) \
+        .group_by(Medicine.name).order_by(func.sum(MedicineConsumption.quantity).desc()).limit(10).all()
+
+    turnaround = {}
+    for stage in STAGES:
+        buckets = _weekly(_metric_by_day('stage_turnaround', start, stage), weeks, today)
+        turnaround[stage] = [bucket['total'] / bucket['count'] if bucket['count'] else None for bucket in buckets]
+
+    return {
+        'visits': _weekly(_metric_by_day('visits', start), weeks, today),
+        'top_diagnoses': [(name, visits) for name, visits in top_diagnoses],
+        'dispensed': _weekly([(day, 0, float(units)) for day, units in dispensed], weeks, today),
+        'top_medicines': [(name, units) for name, units in top_medicines],
+        'equipment_issued': _weekly(_metric_by_day('equipment_issued', start), weeks, today),
+        'turnaround': turnaround,
+    }
+
+
+def weekly_trends(weeks, today=None):
+    """
+    Weekly series and top lists for the trends view
+
+    For the current hostel (every hostel when working across all of them).
+    Cached until the rollups change (and per day and hostel).
+
+    Returns:
+        Dict of weekly buckets (``week``, ``count``, ``total``), top-10 lists and
+        average turnaround hours per stage per week
+    """
+    today = today or date.today()
+    return cache.cached('analytics.weekly_trends', ['daily_rollups', 'medicine_consumption'],
+                        lambda: _compute_trends(weeks, today), key_parts=[weeks, today])
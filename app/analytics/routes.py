@@ -0,0 +1,54 @@
+"""
+Analytics blueprint routes - trend reports for the Director
+"""
+from flask import Blueprint, render_template, request
+
+from app.auth.utils import role_required
+from .rollups import weekly_trends
+from .sla import sla_metrics
+from .surveillance import outbreak_alerts, recent_symptoms
+from .workflow import STAGES
+
+analytics_bp = Blueprint('analytics', __name__)
+
+TREND_WINDOWS = (12, 26, 52)  # Weeks
+SLA_WINDOWS = (7, 30, 90, 365)  # Days
+
+
+@analytics_bp.route('/trends')
+@role_required('Director')
+def trends():
+    """
+    Weekly trends of visits, diagnoses, dispensing, equipment issues and approval turnaround
+
+    Read-only: the rollups are brought up to date by python cli.py refresh-rollups.
+    """
+    weeks = request.args.get('weeks', 12, type=int)
+    if weeks not in TREND_WINDOWS:
+        weeks = 12
+    
+    return render_template('analytics/trends.html', trends=weekly_trends(weeks), weeks=weeks,
+                           windows=TREND_WINDOWS, stages=STAGES)
+
+
+@analytics_bp.route('/sla')
+@role_required('Director')
+def sla():
+    """Sick leave approval turnaround per stage, current queues and approver throughput"""
+    days = request.args.get('days', 30, type=int)
+    if days not in SLA_WINDOWS:
+        days = 30
+    
+    return render_template('analytics/sla.html', metrics=sla_metrics(days), days=days, windows=SLA_WINDOWS,
+                           stages=STAGES)
+
+
+@analytics_bp.route('/outbreaks')
+@role_required('Director', 'Doctor', 'H2')
+def outbreaks():
+    """
+    Symptom clusters among recent doctor visits, hostel-wide and per hostel block
+
+    Read-only: new visits are counted by python cli.py surveillance.
+    """
+    return render_template('analytics/outbreaks.html', alerts=outbreak_alerts(), symptoms=recent_symptoms(7))
@@ -0,0 +1,118 @@
+"""
+Sick leave approval SLA metrics
+
+Three set-based queries over the workflow timestamp columns, one row per
+stage (or per stage and approver) each:
+
+* latency - decisions in the window with count, mean, p50 and p95 hours
+  (nearest-rank percentiles from ROW_NUMBER over each stage) and the share
+  decided within SICKLEAVE_STAGE_TARGET_HOURS
+* queue - requests waiting at each stage now, with their mean and oldest age
+* throughput - decisions per approver per stage, approved and rejected
+
+Stages are defined once in ``workflow.STAGES``.
+"""
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import case, func, literal, select, union_all
+
+from app.extensions import db, cache
+from app.models import User
+from .workflow import STAGES
+
+
+def _hours(later, earlier):
+    """Hours between two timestamp expressions, in SQL"""
+    if db.engine.dialect.name == 'sqlite':
+        return (func.julianday(later) - func.julianday(earlier)) * 24
+    return func.extract('epoch', later - earlier) / 3600
+
+
+def _decisions(since):
+    """Every stage decision since ``since``: stage, approver, status, hours taken"""
+    return union_all(*[
+        select(literal(name).label('stage'), stage.approver.label('approver_id'), stage.status.label('status'),
+               _hours(stage.decided, stage.started).label('hours'))
+        .where(stage.decided >= since, stage.started.is_not(None))
+        for name, stage in STAGES.items()
+    ]).subquery()
+
+
+def stage_latency(since, target_hours):
+    """Per-stage decision latency in hours: count, mean, p50, p95 and decisions within target"""
+    decisions = _decisions(since)
+    ranked = select(
+        decisions.c.stage, decisions.c.hours,
+        func.row_number().over(partition_by=decisions.c.stage, order_by=decisions.c.hours).label('position'),
+        func.count().over(partition_by=decisions.c.stage).label('decided'),
+    ).subquery()
+
+    def percentile(fraction):
+        return func.min(case((ranked.c.position >= ranked.c.decided * fraction, ranked.c.hours)))
+
+    rows = db.session.execute(select(
+        ranked.c.stage,
+        func.count().label('decided'),
+        func.avg(ranked.c.hours).label('mean'),
+        percentile(0.5).label('p50'),
+        percentile(0.95).label('p95'),
+        func.sum(case((ranked.c.hours <= target_hours, 1), else_=0)).label('within_target'),
+    ).group_by(ranked.c.stage))
+    return {row.stage: row._asdict() for row in rows}
+
+
+def queue_age(now):
+    """Requests currently waiting at each stage, with mean and oldest wait in hours"""
+    waiting = union_all(*[
+        select(literal(name).label('stage'), _hours(literal(now), stage.started).label('age'))
+        .where(stage.pending, stage.started.is_not(None))
+        for name, stage in STAGES.items()
+    ]).subquery()
+    rows = db.session.execute(
+        select(waiting.c.stage, func.count().label('waiting'), func.avg(waiting.c.age).label('mean'),
+               func.max(waiting.c.age).label('oldest'))
+        .group_by(waiting.c.stage)
+    )
+    return {row.stage: row._asdict() for row in rows}
+
+
+def approver_throughput(since):
+    """Decisions per approver per stage since ``since``, busiest first"""
+    decisions = _decisions(since)
+    rows = db.session.execute(
+        select(decisions.c.stage, User.first_name, User.last_name, User.username,
+               func.count().label('decided'),
+               func.sum(case((decisions.c.status == 'Approved', 1), else_=0)).label('approved'),
+               func.sum(case((decisions.c.status == 'Rejected', 1), else_=0)).label('rejected'),
+               func.avg(decisions.c.hours).label('mean'))
+        .join(User, User.id == decisions.c.approver_id)
+        .group_by(decisions.c.stage, User.id, User.first_name, User.last_name, User.username)
+        .order_by(func.count().desc())
+    )
+    return [row._asdict() for row in rows]
+
+
+def _compute_metrics(days, target_hours):
+    now = datetime.utcnow()
+    since = now - timedelta(days=days)
+    return {
+        'latency': stage_latency(since, target_hours),
+        'queue': queue_age(now),
+        'throughput': approver_throughput(since),
+        'computed_at': now,
+    }
+
+
+def sla_metrics(days):
+    """
+    Latency, queue and throughput metrics over the last ``days`` days
+
+    Cached until sick leave requests change; queue ages are refreshed every
+    SLA_CACHE_SECONDS even without changes, since they grow with time.
+    """
+    target_hours = current_app.config['SICKLEAVE_STAGE_TARGET_HOURS']
+    period = int(time.time() // current_app.config['SLA_CACHE_SECONDS'])
+    return cache.cached('analytics.sla_metrics', ['sickleave_requests', 'users'],
+                        lambda: _compute_metrics(days, target_hours), key_parts=[days, target_hours, period])
@@ -0,0 +1,209 @@
+"""
+Outbreak surveillance over doctor visits
+
+New visits are tokenised as they come in (by when they were recorded,
+streamed with ``yield_per`` so a backfill of several years is a single pass):
+the symptoms and diagnosis text is lower-cased, split into words and mapped
+onto a small vocabulary of tracked symptoms, skipping negated mentions ("no
+fever", "denies cough"). Each visit counts once per symptom, per day,
+both hostel-wide and for the student's hostel block, in the daily rollup
+table (metrics ``symptom`` and ``symptom_block``) under the visit's hostel, so
+block B of one hostel and block B of another are separate series. Alerts
+are read for the current hostel (each hostel's series separately when working
+across all of them); symptom counts are summed over the hostels in view.
+
+Detection loads the last OUTBREAK_WINDOW_DAYS + OUTBREAK_BASELINE_DAYS of
+those counts into one fixed-size array per series and flags a series whose
+recent cases exceed the baseline by OUTBREAK_Z_THRESHOLD standard deviations
+(with a Poisson floor, so a quiet baseline doesn't flag every second case)
+and reach OUTBREAK_MIN_CASES.
+"""
+import math
+import re
+from array import array
+from collections import defaultdict
+from datetime import date, timedelta
+from statistics import fmean, pstdev
+
+from flask import current_app
+from sqlalchemy import func
+
+from app.extensions import db, cache
+from app.models import DailyRollup, DoctorVisit, Student
+from app.tenancy import all_hostels, hostel_choices
+from app.watermarks import advance_window, in_window, pending_window, reset
+from .rollups import DIMENSION_LENGTH, merge_totals
+
+WATERMARK = 'surveillance_visits'
+SURVEILLANCE_METRICS = ('symptom', 'symptom_block')
+
+# Word -> tracked symptom
+SYMPTOM_TERMS = {
+    'fever': 'fever', 'febrile': 'fever', 'pyrexia': 'fever',
+    'cough': 'cough', 'coughing': 'cough',
+    'cold': 'cold', 'coryza': 'cold', 'runny': 'cold', 'sneezing': 'cold',
+    'throat': 'sore throat', 'pharyngitis': 'sore throat', 'tonsillitis': 'sore throat',
+    'headache': 'headache', 'migraine': 'headache',
+    'vomit': 'vomiting', 'vomiting': 'vomiting', 'vomited': 'vomiting', 'nausea': 'vomiting',
+    'diarrhea': 'diarrhoea', 'diarrhoea': 'diarrhoea', 'loose': 'diarrhoea', 'dysentery': 'diarrhoea',
+    'stomach': 'abdominal pain', 'abdominal': 'abdominal pain', 'gastritis': 'abdominal pain',
+    'rash': 'rash', 'rashes': 'rash', 'itching': 'rash',
+    'conjunctivitis': 'conjunctivitis',
+    'chickenpox': 'chickenpox', 'varicella': 'chickenpox',
+    'jaundice': 'jaundice', 'hepatitis': 'jaundice',
+    'flu': 'influenza', 'influenza': 'influenza',
+    'dengue': 'dengue', 'malaria': 'malaria', 'typhoid': 'typhoid',
+}
+
+# Words that negate a term shortly after them in the same clause ("no fever", "denies cough")
+NEGATIONS = {'no', 'not', 'denies', 'denied', 'without', 'nil'}
+NEGATION_WINDOW = 3  # Words before a term that are checked for a negation
+
+_WORD = re.compile(r'[a-z]+')
+_CLAUSE = re.compile(r'[.,;:!?()\n]|\bbut\b')
+_BLOCK = re.compile(r'[A-Za-z]+|[^-/\s]+')
+
+
+def symptoms_in(*texts):
+    """
+    Tracked symptoms mentioned in free text, skipping negated mentions
+
+    A term counts unless one of the NEGATION_WINDOW words before it, in the
+    same clause, is a negation:
+
+    >>> for note in ('no fever', 'denies cough', 'temperature normal', 'Fever, no cough',
+    ...              'no fever or vomiting', 'not vomiting but loose stools', 'without rash; febrile'):
+    ...     print(f'{note}: {sorted(symptoms_in(note))}')
+    no fever: []
+    denies cough: []
+    temperature normal: []
+    Fever, no cough: ['fever']
+    no fever or vomiting: []
+    not vomiting but loose stools: ['diarrhoea']
+    without rash; febrile: ['fever']
+    """
+    found = set()
+    for text in texts:
+        for clause in _CLAUSE.split((text or '').lower()):
+            words = _WORD.findall(clause)
+            for index, word in enumerate(words):
+                symptom = SYMPTOM_TERMS.get(word)
+                if symptom and not NEGATIONS.intersection(words[max(index - NEGATION_WINDOW, 0):index]):
+                    found.add(symptom)
+    return found
+
+
+def hostel_block(room):
+    """Block of a hostel room ('B-204' and 'B204' are both block B)"""
+    match = _BLOCK.match((room or '').strip())
+    return match.group(0).upper()[:20] if match else 'Unknown'
+
+
+@all_hostels()
+def refresh_surveillance():
+    """
+    Tokenise visits recorded since the last run into daily symptom counts
+
+    Runs across every hostel, whichever one the caller works in. Nothing is
+    committed; the caller commits (or rolls back on WatermarkConflict).
+
+    Returns:
+        Number of daily counts changed
+    """
+    last_at, high = pending_window(WATERMARK, current_app.config['ROLLUP_SETTLE_SECONDS'])
+
+    hostel, blocks = defaultdict(int), defaultdict(int)
+    visits = db.session.query(DoctorVisit.hostel_id, DoctorVisit.visit_date, DoctorVisit.symptoms,
+                              DoctorVisit.diagnosis, Student.hostel_room) \
+        .join(Student, DoctorVisit.student_id == Student.id) \
+        .filter(in_window(DoctorVisit.created_at, last_at, high)) \
+        .yield_per(current_app.config['SURVEILLANCE_BATCH_SIZE'])
+    for hostel_id, visit_date, symptoms, diagnosis, room in visits:
+        if visit_date is None:
+            continue
+        day, block = visit_date.date(), hostel_block(room)
+        for symptom in symptoms_in(symptoms, diagnosis):
+            hostel[(day, symptom, hostel_id)] += 1
+            blocks[(day, f'{block}:{symptom}'[:DIMENSION_LENGTH], hostel_id)] += 1
+
+    changed = merge_totals('symptom', {key: (count, 0.0) for key, count in hostel.items()})
+    changed += merge_totals('symptom_block', {key: (count, 0.0) for key, count in blocks.items()})
+    advance_window(WATERMARK, last_at, high)
+    return changed
+
+
+@all_hostels()
+def rebuild_surveillance():
+    """Discard the symptom counts and tokenise every visit again (caller commits)"""
+    db.session.execute(DailyRollup.__table__.delete().where(DailyRollup.metric.in_(SURVEILLANCE_METRICS)))
+    reset(WATERMARK)
+    return refresh_surveillance()
+
+
+def _compute_alerts(today, window, baseline, min_cases, threshold):
+    length = baseline + window
+    start = today - timedelta(days=length - 1)
+    # One series per hostel: across every hostel, block B of one hostel isn't block B of another
+    series = {}
+    for metric, hostel_id, dimension, day, count in db.session.query(
+            DailyRollup.metric, DailyRollup.hostel_id, DailyRollup.dimension, DailyRollup.day, DailyRollup.count
+    ).filter(DailyRollup.metric.in_(SURVEILLANCE_METRICS), DailyRollup.day >= start, DailyRollup.day <= today):
+        counts = series.get((metric, hostel_id, dimension))
+        if counts is None:
+            counts = series[(metric, hostel_id, dimension)] = array('i', [0]) * length
+        counts[(day - start).days] += count
+
+    hostels = dict(hostel_choices())
+    alerts = []
+    for (metric, hostel_id, dimension), counts in series.items():
+        observed = sum(counts[baseline:])
+        if observed < min_cases:
+            continue
+        history = counts[:baseline]
+        expected = fmean(history) * window
+        spread = max(pstdev(history) * math.sqrt(window), math.sqrt(expected), 1.0)
+        score = (observed - expected) / spread
+        if score < threshold:
+            continue
+        block, _, symptom = dimension.rpartition(':') if metric == 'symptom_block' else ('', '', dimension)
+        alerts.append({
+            'hostel_id': hostel_id,
+            'hostel': hostels.get(hostel_id),
+            'symptom': symptom,
+            'block': block or None,
+            'observed': observed,
+            'expected': expected,
+            'score': score,
+            'daily': counts[baseline:].tolist(),
+        })
+    return sorted(alerts, key=lambda alert: alert['score'], reverse=True)
+
+
+def outbreak_alerts(today=None):
+    """
+    Symptom series (hostel-wide and per block) spiking in the recent window
+
+    For the current hostel (every hostel when working across all of them,
+    each hostel's series detected on its own). Cached until the daily counts
+    change (and per day and hostel).
+
+    Returns:
+        List of dicts with ``hostel_id`` and ``hostel`` (name), ``symptom``, ``block``
+        (None hostel-wide), ``observed``, ``expected``, ``score`` and the ``daily``
+        counts of the window, highest score first
+    """
+    today = today or date.today()
+    config = current_app.config
+    params = (config['OUTBREAK_WINDOW_DAYS'], config['OUTBREAK_BASELINE_DAYS'],
+              config['OUTBREAK_MIN_CASES'], config['OUTBREAK_Z_THRESHOLD'])
+    return cache.cached('analytics.outbreak_alerts', ['daily_rollups'],
+                        lambda: _compute_alerts(today, *params), key_parts=[today, *params])
+
+
+def recent_symptoms(days, today=None):
+    """Hostel-wide visits per tracked symptom over the last ``days`` days, most frequent first"""
+    today = today or date.today()
+    return db.session.query(DailyRollup.dimension, func.sum(DailyRollup.count).label('visits')) \
+        .filter(DailyRollup.metric == 'symptom', DailyRollup.day > today - timedelta(days=days),
+                DailyRollup.day <= today) \
+        .group_by(DailyRollup.dimension).order_by(func.sum(DailyRollup.count).desc()).all()
@@ -0,0 +1,31 @@
+"""
+Stages of the sick leave approval workflow, as columns of SickLeaveRequest
+
+Shared by the turnaround rollup and the SLA report so both measure a stage
+the same way: from the moment it was reached to its decision.
+"""
+from collections import namedtuple
+
+from app.models import SickLeaveRequest
+
+Stage = namedtuple('Stage', 'label decided started approver status pending')
+
+STAGES = {
+    'h2': Stage(
+        'H2', SickLeaveRequest.h2_approved_date, SickLeaveRequest.created_at,
+        SickLeaveRequest.h2_approved_by, SickLeaveRequest.h2_status,
+        SickLeaveRequest.h2_status == 'Pending'),
+    'warden': Stage(
+        'Warden', SickLeaveRequest.warden_verified_date, SickLeaveRequest.h2_approved_date,
+        SickLeaveRequest.warden_verified_by, SickLeaveRequest.warden_status,
+        (SickLeaveRequest.warden_status == 'Pending') & (SickLeaveRequest.h2_status == 'Approved')),
+    'office': Stage(
+        'Office', SickLeaveRequest.office_approved_date, SickLeaveRequest.warden_verified_date,
+        SickLeaveRequest.office_approved_by, SickLeaveRequest.office_status,
+        (SickLeaveRequest.office_status == 'Pending') & (SickLeaveRequest.warden_status == 'Approved')),
+    # The Director's review is optional and can happen at any point, so it is timed from submission
+    'director': Stage(
+        'Director', SickLeaveRequest.director_approved_date, SickLeaveRequest.created_at,
+        SickLeaveRequest.director_approved_by, SickLeaveRequest.director_status,
+        SickLeaveRequest.director_status == 'Pending'),
+}
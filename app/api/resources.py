@@ -0,0 +1,137 @@
+"""
+Resource definitions for the read-only JSON API
+
+Each resource lists the columns it exposes (``fields``), the subset returned
+when ``?fields=`` is not given (``default_fields``), the query-string filters
+it accepts - each mapped onto an indexed column - and the roles allowed to
+read it. ``field_roles`` narrows individual fields (medical details) to fewer
+roles than the resource. Rows are selected as plain tuples of the requested columns only, so
+no ORM objects are built.
+"""
+import operator
+
+from app.models import (Student, User, DoctorVisit, Prescription, Medicine, MedicineBatch,
+                        EquipmentIssue, SickLeaveRequest, Asset)
+
+STAFF_ROLES = ('H2', 'Warden', 'Office', 'Director', 'Doctor')
+MEDICAL_ROLES = ('H2', 'Doctor', 'Director')
+
+# Filter operators accepted in resource filter definitions
+OPERATORS = {'eq': operator.eq, 'lte': operator.le, 'gte': operator.ge}
+
+
+def _columns(model, *names):
+    return {name: getattr(model, name) for name in names}
+
+
+API_RESOURCES = {
+    'students': {
+        'model': Student,
+        'joins': [(User, Student.user_id == User.id)],
+        'fields': {
+            **_columns(Student, 'id', 'user_id', 'roll_number', 'date_of_birth', 'gender', 'blood_group',
+                       'hostel_room', 'phone_number', 'allergies', 'medical_conditions', 'created_at',
+                       'updated_at'),
+            'username': User.username,
+            'first_name': User.first_name,
+            'last_name': User.last_name,
+            'email': User.email,
+        },
+        'default_fields': ('id', 'roll_number', 'first_name', 'last_name', 'hostel_room'),
+        'filters': {
+            'roll_number': (Student.roll_number, 'eq'),
+            'hostel_room': (Student.hostel_room, 'eq'),
+            'user_id': (Student.user_id, 'eq'),
+        },
+        'roles': STAFF_ROLES,
+        'field_roles': {
+            'allergies': MEDICAL_ROLES,
+            'medical_conditions': MEDICAL_ROLES,
+        },
+    },
+    'visits': {
+        'model': DoctorVisit,
+        'fields': _columns(DoctorVisit, 'id', 'student_id', 'doctor_id', 'visit_date', 'symptoms',
+                           'diagnosis', 'treatment', 'notes', 'created_at'),
+        'default_fields': ('id', 'student_id', 'doctor_id', 'visit_date', 'diagnosis'),
+        'filters': {
+            'student_id': (DoctorVisit.student_id, 'eq'),
+        },
+        'roles': MEDICAL_ROLES,
+    },
+    'prescriptions': {
+        'model': Prescription,
+        'fields': {
+            **_columns(Prescription, 'id', 'student_id', 'visit_id', 'created_by_id', 'notes',
+                       'created_at', 'updated_at'),
+            'status': Prescription.overall_status_expression(),
+        },
+        'default_fields': ('id', 'student_id', 'visit_id', 'status', 'created_at'),
+        'filters': {
+            'student_id': (Prescription.student_id, 'eq'),
+        },
+        'roles': MEDICAL_ROLES,
+    },
+    'medicines': {
+        'model': Medicine,
+        'fields': _columns(Medicine, 'id', 'name', 'generic_name', 'dosage', 'quantity', 'min_stock_level',
+                           'unit', 'supplier', 'cost_per_unit', 'location', 'updated_at'),
+        'default_fields': ('id', 'name', 'dosage', 'quantity', 'unit'),
+        'filters': {
+            'name': (Medicine.name, 'eq'),
+        },
+        'roles': MEDICAL_ROLES,
+    },
+    'batches': {
+        'model': MedicineBatch,
+        'fields': _columns(MedicineBatch, 'id', 'medicine_id', 'batch_number', 'quantity',
+                           'available_quantity', 'expiry_date', 'shelf_location', 'cost_per_unit',
+                           'date_added', 'updated_at'),
+        'default_fields': ('id', 'medicine_id', 'batch_number', 'available_quantity', 'expiry_date'),
+        'filters': {
+            'medicine_id': (MedicineBatch.medicine_id, 'eq'),
+            'batch_number': (MedicineBatch.batch_number, 'eq'),
+            'expires_before': (MedicineBatch.expiry_date, 'lte'),
+            'expires_after': (MedicineBatch.expiry_date, 'gte'),
+        },
+        'roles': MEDICAL_ROLES,
+    },
+    'equipment-issues': {
+        'model': EquipmentIssue,
+        'fields': _columns(EquipmentIssue, 'id', 'equipment_id', 'student_id', 'issued_by_id',
+                           'verified_by_id', 'quantity', 'issued_date', 'expected_return_date',
+                           'actual_return_date', 'return_condition', 'is_overdue', 'days_overdue',
+                           'penalty_amount', 'penalty_paid', 'status', 'updated_at'),
+        'default_fields': ('id', 'equipment_id', 'student_id', 'quantity', 'expected_return_date', 'status'),
+        'filters': {
+            'student_id': (EquipmentIssue.student_id, 'eq'),
+            'equipment_id': (EquipmentIssue.equipment_id, 'eq'),
+            'status': (EquipmentIssue.status, 'eq'),
+        },
+        'roles': ('H2', 'Doctor', 'Director', 'Warden'),
+    },
+    'sickleave-requests': {
+        'model': SickLeaveRequest,
+        'fields': _columns(SickLeaveRequest, 'id', 'student_id', 'created_by_id', 'request_type',
+                           'start_date', 'end_date', 'reason', 'h2_status', 'warden_status',
+                           'office_status', 'director_status', 'overall_status', 'created_at',
+                           'updated_at'),
+        'default_fields': ('id', 'student_id', 'request_type', 'start_date', 'end_date', 'overall_status'),
+        'filters': {
+            'student_id': (SickLeaveRequest.student_id, 'eq'),
+            'overall_status': (SickLeaveRequest.overall_status, 'eq'),
+        },
+        'roles': ('H2', 'Warden', 'Office', 'Director'),
+    },
+    'assets': {
+        'model': Asset,
+        'fields': _columns(Asset, 'id', 'asset_code', 'name', 'category', 'description', 'location',
+                           'quantity', 'condition', 'purchase_date', 'cost', 'warranty_expiry', 'updated_at'),
+        'default_fields': ('id', 'asset_code', 'name', 'category', 'location', 'condition'),
+        'filters': {
+            'asset_code': (Asset.asset_code, 'eq'),
+            'condition': (Asset.condition, 'eq'),
+        },
+        'roles': ('H2', 'Warden', 'Director'),
+    },
+}
@@ -0,0 +1,171 @@
+"""
+Read-only JSON API (/api/v1)
+
+GET /api/v1/<resource>?fields=id,name&<filter>=<value>&after=<id>&limit=50
+GET /api/v1/<resource>/<id>?fields=...
+
+Lists use keyset pagination on the primary key: each page returns ``next``
+(the URL of the following page, or null) instead of page numbers, so reading
+deep pages costs the same as the first one.
+"""
+from datetime import date, datetime
+
+from flask import Blueprint, current_app, jsonify, request, url_for
+from flask_login import current_user
+from sqlalchemy import select
+
+from ..extensions import db
+from .resources import API_RESOURCES, OPERATORS
+
+api_bp = Blueprint('api', __name__)
+
+
+def _error(status, message):
+    return jsonify({'error': message}), status
+
+
+def _json_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _parse_value(column, raw):
+    """Convert a query-string value to the column's Python type"""
+    python_type = column.type.python_type
+    if python_type is date:
+        return date.fromisoformat(raw)
+    if python_type is datetime:
+        return datetime.fromisoformat(raw)
+    if python_type is bool:
+        return raw.lower() in ('1', 'true', 'yes')
+    return python_type(raw)
+
+
+def _get_resource(name):
+    """Look up a resource and check access; returns (resource, error_response)"""
+    resource = API_RESOURCES.get(name)
+    if resource is None:
+        return None, _error(404, f'Unknown resource: {name}')
+    if not current_user.is_authenticated:
+        return None, _error(401, 'Authentication required')
+    if not current_user.has_role(*resource['roles']):
+        return None, _error(403, 'Insufficient permissions')
+    return resource, None
+
+
+def _readable_fields(resource):
+    """Fields of a resource the current user's role may read"""
+    field_roles = resource.get('field_roles', {})
+    return [name for name in resource['fields']
+            if name not in field_roles or current_user.has_role(*field_roles[name])]
+
+
+def _selected_fields(resource):
+    """Fields requested with ?fields= (id is always included for pagination)"""
+    requested = request.args.get('fields')
+    if not requested:
+        names = list(resource['default_fields'])
+    else:
+        names = [name.strip() for name in requested.split(',') if name.strip()]
+        readable = _readable_fields(resource)
+        unknown = [name for name in names if name not in readable]
+        if unknown:
+            raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+    if 'id' not in names:
+        names.insert(0, 'id')
+    return names
+
+
+def _base_query(resource, names):
+    statement = select(*[resource['fields'][name].label(name) for name in names]).select_from(resource['model'])
+    for target, onclause in resource.get('joins', ()):
+        statement = statement.join(target, onclause)
+    return statement
+
+
+def _serialize(names, rows):
+    """Build dicts straight from row tuples"""
+    return [{name: _json_value(value) for name, value in zip(names, row)} for row in rows]
+
+
+@api_bp.route('/')
+def index():
+    """List the available resources"""
+    if not current_user.is_authenticated:
+        return _error(401, 'Authentication required')
+
+    return jsonify({
+        'resources': {
+            name: {
+                'url': url_for('api.list_resource', resource=name),
+                'fields': _readable_fields(resource),
+                'default_fields': list(resource['default_fields']),
+                'filters': list(resource['filters']),
+            }
+            for name, resource in API_RESOURCES.items()
+            if current_user.has_role(*resource['roles'])
+        }
+    })
+
+
+@api_bp.route('/<resource>')
+def list_resource(resource):
+    """List a resource with sparse fields, filters and keyset pagination"""
+    resource_name = resource
+    resource, error = _get_resource(resource_name)
+    if error:
+        return error
+
+    model = resource['model']
+    try:
+        names = _selected_fields(resource)
+        limit = request.args.get('limit', current_app.config['API_PAGE_SIZE'], type=int)
+        limit = max(1, min(limit, current_app.config['API_MAX_PAGE_SIZE']))
+        after = request.args.get('after', type=int)
+
+        statement = _base_query(resource, names)
+        for key, raw in request.args.items():
+            if key in ('fields', 'limit', 'after'):
+                continue
+            if key not in resource['filters']:
+                raise ValueError(f'Unknown filter: {key}')
+            column, op = resource['filters'][key]
+            statement = statement.where(OPERATORS[op](column, _parse_value(column, raw)))
+    except ValueError as e:
+        return _error(400, str(e))
+
+    if after is not None:
+        statement = statement.where(model.id > after)
+
+    # Fetch one extra row to know whether another page exists
+    rows = db.session.execute(statement.order_by(model.id).limit(limit + 1)).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    next_url = None
+    if has_more and rows:
+        args = request.args.to_dict()
+        args['after'] = rows[-1][names.index('id')]
+        next_url = url_for('api.list_resource', resource=resource_name, **args)
+
+    return jsonify({'data': _serialize(names, rows), 'next': next_url})
+
+
+@api_bp.route('/<resource>/<int:item_id>')
+def get_resource(resource, item_id):
+    """Fetch one item by id"""
+    resource, error = _get_resource(resource)
+    if error:
+        return error
+
+    try:
+        names = _selected_fields(resource)
+    except ValueError as e:
+        return _error(400, str(e))
+
+    row = db.session.execute(_base_query(resource, names).where(resource['model'].id == item_id)).first()
+    if row is None:
+        return _error(404, 'Not found')
+
+    return jsonify({'data': _serialize(names, [row])[0]})
@@ -4,9 +4,12 @@ Hostel asset management blueprint routes
 from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import current_user, login_required
 from datetime import datetime
-from ..extensions import db
+from sqlalchemy import func
+from ..extensions import db, cache
 from app.models import Asset, MaintenanceLog
 from app.auth.utils import role_required
+from app.exports.utils import export_report
+from app.facets import get_facets
 
 assets_bp = Blueprint('assets', __name__, template_folder='../templates/assets')
 
@@ -33,16 +36,12 @@ def assets_list():
     
     assets = query.order_by(Asset.asset_code).paginate(page=page, per_page=20)
     
-    # Get unique values for filters
-    categories = db.session.query(Asset.category).distinct().all()
-    locations = db.session.query(Asset.location).distinct().all()
-    conditions = db.session.query(Asset.condition).distinct().all()
+    # Filter values with counts (cached until assets change)
+    facets = get_facets('assets')
     
     return render_template('assets/list.html', 
                           assets=assets,
-                          categories=[c[0] for c in categories],
-                          locations=[l[0] for l in locations],
-                          conditions=[c[0] for c in conditions],
+                          facets=facets,
                           selected_category=category,
                           selected_location=location,
                           selected_condition=condition)
@@ -181,17 +180,97 @@ def delete_asset(asset_id):
     return redirect(url_for('assets.assets_list'))
 
 
+# Known conditions are listed first, in this order; any other value follows alphabetically
+CONDITION_ORDER = ['Good', 'Fair', 'Poor', 'Damaged']
+NO_CONDITION = '(none)'  # Query value selecting assets without a condition
+
+
+def _filter_condition(query, condition):
+    """Filter a query by condition, treating NO_CONDITION as NULL/empty"""
+    if condition == NO_CONDITION:
+        return query.filter((Asset.condition.is_(None)) | (Asset.condition == ''))
+    return query.filter(Asset.condition == condition)
+
+
+def _condition_summary():
+    """
+    Aggregate assets by condition, category and location in one grouped query
+    
+    Returns:
+        List of dicts (condition, count, quantity, breakdown) in report order
+    """
+    rows = db.session.query(
+        Asset.condition, Asset.category, Asset.location,
+        func.count(Asset.id), func.coalesce(func.sum(Asset.quantity), 0)
+    ).group_by(Asset.condition, Asset.category, Asset.location).all()
+    
+    summary = {}
+    for condition, category, location, count, quantity in rows:
+        condition = condition or NO_CONDITION
+        entry = summary.setdefault(condition, {'condition': condition, 'count': 0, 'quantity': 0, 'breakdown': []})
+        entry['count'] += count
+        entry['quantity'] += quantity
+        entry['breakdown'].append({'category': category, 'location': location, 'count': count, 'quantity': quantity})
+    
+    for condition in CONDITION_ORDER:
+        summary.setdefault(condition, {'condition': condition, 'count': 0, 'quantity': 0, 'breakdown': []})
+    
+    def sort_key(entry):
+        condition = entry['condition']
+        if condition in CONDITION_ORDER:
+            return (0, CONDITION_ORDER.index(condition), '')
+        return (1, 0, condition)
+    
+    for entry in summary.values():
+        entry['breakdown'].sort(key=lambda b: (b['category'] or '', b['location'] or ''))
+    
+    return sorted(summary.values(), key=sort_key)
+
+
+def _condition_report_export(args):
+    """Export builder for the asset condition report"""
+    headers = ['Condition', 'Asset Code', 'Name', 'Category', 'Location', 'Quantity', 'Purchase Date',
+               'Cost', 'Warranty Expiry']
+    query = db.session.query(
+        Asset.condition, Asset.asset_code, Asset.name, Asset.category, Asset.location, Asset.quantity,
+        Asset.purchase_date, Asset.cost, Asset.warranty_expiry
+    )
+    
+    condition = args.get('condition', '')
+    if condition:
+        query = _filter_condition(query, condition)
+    
+    return headers, query.order_by(Asset.condition, Asset.asset_code)
+
+
 @assets_bp.route('/condition-report')
 @role_required('Warden', 'H2', 'Director')
 def condition_report():
-    """View assets grouped by condition"""
-    assets_by_condition = {}
-    conditions = ['Good', 'Fair', 'Poor', 'Damaged']
+    """View asset counts by condition, with a paginated asset list for the selected condition"""
+    if request.args.get('format'):
+        return export_report('asset-condition-report', _condition_report_export)
+    
+    condition = request.args.get('condition', '')
+    page = request.args.get('page', 1, type=int)
+    
+    def render_content():
+        summary = _condition_summary()
+        
+        # Only the expanded condition loads asset rows, one page at a time
+        assets = None
+        if condition:
+            assets = _filter_condition(Asset.query, condition).order_by(Asset.asset_code) \
+                .paginate(page=page, per_page=50, error_out=False)
+        
+        return render_template('assets/_condition_report_content.html',
+                               summary=summary,
+                               selected_condition=condition,
+                               assets=assets)
     
-    for condition in conditions:
-        assets_by_condition[condition] = Asset.query.filter_by(condition=condition).all()
+    content = cache.fragment('assets.condition_report', ['assets'], render_content,
+                             key_parts=[condition, page])
     
-    return render_template('assets/condition_report.html', assets_by_condition=assets_by_condition)
+    return render_template('assets/condition_report.html', content=content)
 
 
 @assets_bp.route('/maintenance-logs')
@@ -0,0 +1,90 @@
+"""
+Password hashing for H2 System
+
+Hash parameters come from PASSWORD_HASH_METHOD / PASSWORD_SALT_LENGTH so they
+can be tuned per deployment. Login verification runs in a small bounded pool:
+at most PASSWORD_HASH_WORKERS hashes run at once and at most
+PASSWORD_HASH_QUEUE more may wait, so a login storm can't tie up every request
+worker on CPU-heavy hashing. Requests beyond that are turned away immediately.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from functools import lru_cache
+
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing pool is full or a hash took too long"""
+
+
+_executor = None
+_slots = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool(app):
+    """Lazily create the shared hashing pool and its admission semaphore"""
+    global _executor, _slots
+    with _pool_lock:
+        if _executor is None:
+            workers = app.config.get('PASSWORD_HASH_WORKERS', 4)
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='h2-hash')
+            _slots = threading.BoundedSemaphore(workers + app.config.get('PASSWORD_HASH_QUEUE', 16))
+    return _executor, _slots
+
+
+def _run_in_pool(func, *args):
+    """Run a hashing function in the pool and wait for its result"""
+    app = current_app._get_current_object()
+    executor, slots = _get_pool(app)
+
+    if not slots.acquire(blocking=False):
+        raise PasswordHasherBusy()
+
+    future = executor.submit(func, *args)
+    future.add_done_callback(lambda f: slots.release())
+    try:
+        return future.result(timeout=app.config.get('PASSWORD_HASH_TIMEOUT', 10))
+    except TimeoutError:
+        raise PasswordHasherBusy()
+
+
+def hash_password(password):
+    """Hash a password with the configured method and salt length"""
+    return generate_password_hash(password,
+                                  method=current_app.config['PASSWORD_HASH_METHOD'],
+                                  salt_length=current_app.config['PASSWORD_SALT_LENGTH'])
+
+
+@lru_cache(maxsize=8)
+def _method_prefix(method, salt_length):
+    """Full method string werkzeug stores for a configured method (e.g. 'scrypt' -> 'scrypt:32768:8:1')"""
+    return generate_password_hash('', method=method, salt_length=salt_length).split('$', 1)[0]
+
+
+def needs_rehash(password_hash):
+    """Check whether a stored hash was made with different parameters than configured"""
+    method, _, rest = password_hash.partition('$')
+    salt = rest.split('$', 1)[0]
+    expected = _method_prefix(current_app.config['PASSWORD_HASH_METHOD'],
+                              current_app.config['PASSWORD_SALT_LENGTH'])
+    return method != expected or len(salt) != current_app.config['PASSWORD_SALT_LENGTH']
+
+
+def verify_password(password_hash, password):
+    """
+    Verify a password in the hashing pool
+
+    Raises:
+        PasswordHasherBusy: If the pool is saturated or verification timed out
+    """
+    return _run_in_pool(check_password_hash, password_hash, password)
+
+
+def rehash_password(password):
+    """Hash a password in the hashing pool (used to upgrade hashes on login)"""
+    return _run_in_pool(generate_password_hash, password,
+                        current_app.config['PASSWORD_HASH_METHOD'],
+                        current_app.config['PASSWORD_SALT_LENGTH'])
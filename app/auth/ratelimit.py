@@ -0,0 +1,63 @@
+"""
+In-memory token bucket rate limiting for login attempts
+
+Buckets are kept per worker process. Each login attempt takes one token from
+the bucket for the username and one from the bucket for the client IP; tokens
+refill continuously at a fixed rate up to the bucket capacity.
+"""
+import threading
+import time
+
+from flask import current_app
+
+
+class TokenBucketLimiter:
+    """Thread-safe collection of token buckets keyed by an arbitrary string"""
+
+    def __init__(self, capacity, refill_per_second, max_keys=10000):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _level(self, key, now):
+        tokens, updated = self._buckets.get(key, (self.capacity, now))
+        return min(self.capacity, tokens + (now - updated) * self.refill_per_second)
+
+    def allow(self, key):
+        """Take a token for key; return False if the bucket is empty"""
+        now = time.monotonic()
+        with self._lock:
+            tokens = self._level(key, now)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now)
+                return False
+            self._buckets[key] = (tokens - 1, now)
+            if len(self._buckets) > self.max_keys:
+                self._prune(now)
+            return True
+
+    def _prune(self, now):
+        """Forget buckets that have refilled completely"""
+        for key in [k for k in self._buckets if self._level(k, now) >= self.capacity]:
+            del self._buckets[key]
+
+
+def init_login_limiter(app):
+    """Create the per-username and per-IP login limiters"""
+    window = app.config.get('LOGIN_RATE_LIMIT_WINDOW', 60)
+    user_attempts = app.config.get('LOGIN_RATE_LIMIT_PER_USER', 5)
+    ip_attempts = app.config.get('LOGIN_RATE_LIMIT_PER_IP', 100)
+    app.extensions['login_limiter'] = {
+        'user': TokenBucketLimiter(user_attempts, user_attempts / window),
+        'ip': TokenBucketLimiter(ip_attempts, ip_attempts / window),
+    }
+
+
+def login_allowed(username, ip):
+    """Take a token from both the username and IP buckets for a login attempt"""
+    limiters = current_app.extensions['login_limiter']
+    ip_ok = limiters['ip'].allow(ip or 'unknown')
+    user_ok = limiters['user'].allow((username or '').lower())
+    return ip_ok and user_ok
@@ -5,7 +5,9 @@ from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_user, logout_user, current_user
 from ..extensions import db
 from app.models import User
-from app.auth.utils import role_required
+from app.auth.utils import role_required, invalidate_user
+from app.auth.passwords import PasswordHasherBusy, needs_rehash, rehash_password, verify_password
+from app.auth.ratelimit import login_allowed
 
 auth_bp = Blueprint('auth', __name__, template_folder='../templates/auth')
 
@@ -21,9 +23,19 @@ def login():
         password = request.form.get('password')
         remember = request.form.get('remember', False)
         
+        if not login_allowed(username, request.remote_addr):
+            flash('Too many login attempts. Please wait a minute and try again.', 'danger')
+            return redirect(url_for('auth.login'))
+        
         user = User.query.filter_by(username=username).first()
         
-        if user is None or not user.check_password(password):
+        try:
+            valid = user is not None and verify_password(user.password_hash, password or '')
+        except PasswordHasherBusy:
+            flash('The server is busy. Please try logging in again in a moment.', 'warning')
+            return redirect(url_for('auth.login'))
+        
+        if not valid:
             flash('Invalid username or password.', 'danger')
             return redirect(url_for('auth.login'))
         
@@ -31,6 +43,15 @@ def login():
             flash('Your account has been deactivated.', 'danger')
             return redirect(url_for('auth.login'))
         
+        # Upgrade hashes made with older parameters while we have the plain password
+        if needs_rehash(user.password_hash):
+            try:
+                user.password_hash = rehash_password(password)
+                db.session.commit()
+                invalidate_user(user.id)
+            except PasswordHasherBusy:
+                pass
+        
         login_user(user, remember=remember)
         next_page = request.args.get('next')
         
@@ -62,6 +83,7 @@ def register():
         first_name = request.form.get('first_name')
         last_name = request.form.get('last_name')
         role = request.form.get('role')
+        hostel_id = request.form.get('hostel_id', type=int)
         
         # Validation
         if not all([username, email, password, role]):
@@ -86,7 +108,8 @@ def register():
             email=email,
             first_name=first_name,
             last_name=last_name,
-            role=role
+            role=role,
+            hostel_id=hostel_id
         )
         user.set_password(password)
         
@@ -120,9 +143,11 @@ def edit_user(user_id):
         user.last_name = request.form.get('last_name')
         user.email = request.form.get('email')
         user.role = request.form.get('role')
+        user.hostel_id = request.form.get('hostel_id', type=int)
         user.is_active = request.form.get('is_active') == 'on'
         
         db.session.commit()
+        invalidate_user(user.id)
         flash('User updated successfully.', 'success')
         return redirect(url_for('auth.users_list'))
     
@@ -141,6 +166,7 @@ def delete_user(user_id):
     
     db.session.delete(user)
     db.session.commit()
+    invalidate_user(user_id)
     
     flash(f'User {user.username} has been deleted.', 'success')
     return redirect(url_for('auth.users_list'))
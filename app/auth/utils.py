@@ -2,8 +2,11 @@
 Authentication utilities and decorators
 """
 from functools import wraps
-from flask import abort
+from flask import abort, current_app
 from flask_login import current_user
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+from app.cache import LRUCache
 
 
 def role_required(*roles):
@@ -48,3 +51,44 @@ def h2_required(f):
             abort(403)
         return f(*args, **kwargs)
     return decorated_function
+
+
+def init_user_cache(app):
+    """Create the per-process user cache used by load_cached_user"""
+    app.extensions['user_cache'] = LRUCache(max_entries=app.config.get('USER_CACHE_MAX_ENTRIES', 1024))
+
+
+def load_cached_user(user_id):
+    """
+    Load a user for Flask-Login, served from the user cache when possible
+    
+    The cache holds plain column values rather than ORM instances, so a hit
+    rebuilds the user and attaches it to the current session without a query.
+    Relationships (e.g. ``current_user.student``) still lazy-load on access.
+    
+    Args:
+        user_id: User primary key
+    
+    Returns:
+        User instance or None
+    """
+    from app.extensions import db
+    from app.models import User
+    
+    user_cache = current_app.extensions['user_cache']
+    values = user_cache.get(user_id)
+    if values is not None:
+        user = User(**values)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+    
+    user = db.session.get(User, user_id)
+    if user is not None:
+        values = {attr.key: getattr(user, attr.key) for attr in inspect(User).column_attrs}
+        user_cache.set(user_id, values, timeout=current_app.config.get('USER_CACHE_TTL', 60))
+    return user
+
+
+def invalidate_user(user_id):
+    """Drop a user from the user cache after their account changes"""
+    current_app.extensions['user_cache'].delete(user_id)
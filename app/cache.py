@@ -0,0 +1,263 @@
+"""
+Rendered fragment cache for H2 System
+
+Fragments are cached under keys that include a version token for every table
+they were rendered from. SQLAlchemy session hooks replace a table's version
+token whenever rows in it are inserted, updated or deleted and the transaction
+commits, so stale fragments are simply never looked up again and age out of
+the backend.
+
+Backends:
+    lru         In-process LRU (single-process servers and tests)
+    filesystem  Directory shared by all gunicorn workers on the host
+    null        Caching disabled
+"""
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from flask import current_app, has_app_context
+from markupsafe import Markup
+from sqlalchemy import event
+
+
+class NullCache:
+    """Backend that never stores anything"""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, timeout=None):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+
+class LRUCache:
+    """Thread-safe in-process LRU cache with optional per-entry timeout"""
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires and expires < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        expires = time.time() + timeout if timeout else None
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class FileSystemCache:
+    """Cache stored as one pickle file per key, safe to share between processes"""
+
+    def __init__(self, directory, max_entries=2048):
+        self.directory = directory
+        self.max_entries = max_entries
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                expires, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if expires and expires < time.time():
+            self.delete(key)
+            return None
+        return value
+
+    def set(self, key, value, timeout=None):
+        expires = time.time() + timeout if timeout else None
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((expires, value), f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self._prune()
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+    def _prune(self):
+        """Drop the oldest entries once the directory grows past max_entries"""
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        if len(names) <= self.max_entries:
+            return
+        paths = [os.path.join(self.directory, name) for name in names]
+        paths.sort(key=lambda p: os.path.getmtime(p) if os.path.exists(p) else 0)
+        for path in paths[:len(paths) - self.max_entries]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _create_backend(app):
+    """Build the backend selected by FRAGMENT_CACHE_BACKEND"""
+    backend = app.config.get('FRAGMENT_CACHE_BACKEND', 'lru')
+    max_entries = app.config.get('FRAGMENT_CACHE_MAX_ENTRIES', 512)
+
+    if backend == 'filesystem':
+        return FileSystemCache(app.config['FRAGMENT_CACHE_DIR'], max_entries=max_entries)
+    if backend == 'lru':
+        return LRUCache(max_entries=max_entries)
+    return NullCache()
+
+
+class FragmentCache:
+    """Versioned fragment cache extension"""
+
+    def __init__(self, app=None):
+        self._hooks_installed = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['fragment_cache'] = _create_backend(app)
+        if not self._hooks_installed:
+            _install_write_hooks()
+            self._hooks_installed = True
+
+    @property
+    def backend(self):
+        return current_app.extensions['fragment_cache']
+
+    def table_version(self, table):
+        """Current version token for a table (created on first use)"""
+        key = f'version:{table}'
+        version = self.backend.get(key)
+        if version is None:
+            version = uuid.uuid4().hex
+            self.backend.set(key, version)
+        return version
+
+    def bump(self, tables):
+        """Invalidate every fragment rendered from the given tables"""
+        for table in tables:
+            self.backend.set(f'version:{table}', uuid.uuid4().hex)
+
+    def make_key(self, name, tables, key_parts=()):
+        """Build a fragment key from its name, table versions, the current hostel and extra parts"""
+        from app.tenancy import current_hostel_id
+        versions = ','.join(f'{table}={self.table_version(table)}' for table in sorted(tables))
+        parts = '|'.join(str(part) for part in key_parts)
+        return f'fragment:{name}:{versions}:{current_hostel_id()}:{parts}'
+
+    def cached(self, name, tables, compute, key_parts=()):
+        """
+        Return a cached value, computing and storing it on a miss
+
+        Args:
+            name: Cache entry name (usually the endpoint or service)
+            tables: Table names the value is computed from
+            compute: Callable that runs the queries; its result must be picklable
+            key_parts: Extra values the result depends on (filters, page, date)
+        """
+        key = self.make_key(name, tables, key_parts)
+        value = self.backend.get(key)
+        if value is None:
+            value = compute()
+            self.backend.set(key, value, timeout=current_app.config.get('FRAGMENT_CACHE_TIMEOUT'))
+        return value
+
+    def fragment(self, name, tables, render, key_parts=()):
+        """
+        Return a rendered fragment, rendering and caching it on a miss
+
+        Args:
+            name: Fragment name (usually the endpoint)
+            tables: Table names the fragment is rendered from
+            render: Callable that runs the queries and renders the HTML
+            key_parts: Extra values the output depends on (filters, page, date)
+
+        Returns:
+            Markup safe to embed in the page template
+        """
+        return Markup(self.cached(name, tables, lambda: str(render()), key_parts))
+
+
+def _changed_tables(session):
+    return session.info.setdefault('fragment_cache_tables', set())
+
+
+def _install_write_hooks():
+    """Track written tables on every session and bump their versions on commit"""
+    from sqlalchemy.orm import Session
+
+    @event.listens_for(Session, 'after_flush')
+    def _record_flush(session, flush_context):
+        tables = _changed_tables(session)
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            table = getattr(obj, '__tablename__', None)
+            if table:
+                tables.add(table)
+
+    @event.listens_for(Session, 'do_orm_execute')
+    def _record_bulk_write(orm_execute_state):
+        if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+            table = getattr(orm_execute_state.statement, 'table', None)
+            if table is not None:
+                _changed_tables(orm_execute_state.session).add(table.name)
+
+    @event.listens_for(Session, 'after_commit')
+    def _bump_versions(session):
+        tables = session.info.pop('fragment_cache_tables', None)
+        if tables and has_app_context() and 'fragment_cache' in current_app.extensions:
+            from app.extensions import cache
+            cache.bump(tables)
+
+    @event.listens_for(Session, 'after_rollback')
+    def _discard_versions(session):
+        session.info.pop('fragment_cache_tables', None)
@@ -38,20 +38,26 @@ def student_dashboard():
     if not student:
         return render_template('dashboards/student_dashboard.html', student=None)
     
-    # Get student's recent doctor visits
-    recent_visits = student.doctor_visits[-5:] if student.doctor_visits else []
+    # Get student's recent doctor visits (newest first)
+    recent_visits = student.doctor_visits.order_by(
+        DoctorVisit.visit_date.desc(), DoctorVisit.id.desc()
+    ).limit(5).all()
     
     # Get student's pending/partial prescriptions (not fully dispensed)
-    all_prescriptions = Prescription.query.filter_by(student_id=student.id).all()
-    pending_prescriptions = [p for p in all_prescriptions if p.overall_status != 'DISPENSED']
+    pending_query = student.prescriptions.filter(Prescription.undispensed_filter())
+    pending_prescriptions = pending_query.order_by(
+        Prescription.created_at.desc(), Prescription.id.desc()
+    ).limit(5).all()
     
-    # Get student's sick leave requests
-    sick_requests = student.sickleave_requests[-3:] if student.sickleave_requests else []
+    # Get student's sick leave requests (newest first)
+    sick_requests = student.sickleave_requests.order_by(
+        SickLeaveRequest.created_at.desc(), SickLeaveRequest.id.desc()
+    ).limit(3).all()
     
     stats = {
-        'total_visits': len(student.doctor_visits),
-        'pending_prescriptions': len(pending_prescriptions),
-        'total_requests': len(student.sickleave_requests)
+        'total_visits': student.doctor_visits.count(),
+        'pending_prescriptions': pending_query.count(),
+        'total_requests': student.sickleave_requests.count()
     }
     
     return render_template('dashboards/student_dashboard.html',
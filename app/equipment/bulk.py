@@ -0,0 +1,312 @@
+"""
+Bulk equipment issue and return (sports events, camps)
+
+Issuing to a team or taking a team's returns is a fixed number of statements
+however many students are involved:
+
+* issue - one UPDATE locks every equipment row, three queries check free
+  stock the same way a single issue does (the per-day peak of reservations
+  and issues still out, ``committed_peaks``), one guarded UPDATE moves all
+  the counters (it only succeeds if every item still has the units, so a
+  partial issue never happens), one INSERT writes the issues
+* return - one query loads the issues with their costs, one UPDATE claims
+  them, one executemany UPDATE records condition and penalty, and one
+  guarded UPDATE moves the counters
+
+Lines come from the bulk forms or from a CSV sheet (``parse_issue_sheet``,
+``parse_return_sheet``). Nothing is committed here; the caller commits once,
+or rolls back on LedgerError.
+"""
+import csv
+import io
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import bindparam, case, insert, select, update
+
+from app.extensions import db
+from app.models import EquipmentIssue, MedicalEquipment, Student
+from app.outbox import emit
+from .ledger import RETURN_COUNTERS, LedgerError, committed_peaks
+from .penalties import price
+
+ISSUE_SHEET_COLUMNS = ('roll_number', 'equipment_code')
+RETURN_SHEET_COLUMNS = ('roll_number', 'equipment_code')
+
+
+def issue_many(lines, issued_by_id, expected_return_date):
+    """
+    Issue equipment to many students at once
+
+    Args:
+        lines: Dicts with ``student_id``, ``equipment_id`` and ``quantity``
+        issued_by_id: User recorded as issuing
+        expected_return_date: When everything is due back (datetime)
+
+    Returns:
+        Ids of the new issues, in line order
+
+    Raises:
+        LedgerError: Listing every item short of stock (or unknown); nothing is issued
+    """
+    if not lines:
+        raise LedgerError('Nothing to issue.')
+    if any(not line['quantity'] or line['quantity'] < 1 for line in lines):
+        raise LedgerError('Every quantity must be at least 1.')
+
+    now = datetime.utcnow()
+    start, end = now.date(), expected_return_date.date()
+    demand = defaultdict(int)
+    for line in lines:
+        demand[line['equipment_id']] += line['quantity']
+
+    student_ids = {line['student_id'] for line in lines}
+    known = set(db.session.scalars(select(Student.id).where(Student.id.in_(student_ids))))
+    if known != student_ids:
+        raise LedgerError(f'Unknown student id(s): {", ".join(str(i) for i in sorted(student_ids - known))}.')
+
+    # Lock the rows, then check each item like a single issue: free on every day of the loan
+    db.session.execute(
+        update(MedicalEquipment).where(MedicalEquipment.id.in_(demand)).values(updated_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    stock = {row.id: row for row in db.session.execute(
+        select(MedicalEquipment.id, MedicalEquipment.name, MedicalEquipment.hostel_id,
+               (MedicalEquipment.quantity_available + MedicalEquipment.quantity_issued).label('capacity'))
+        .where(MedicalEquipment.id.in_(demand))
+    )}
+    peaks = committed_peaks(list(demand), start, max(end, start), today=start)
+    problems = []
+    for equipment_id, units in demand.items():
+        row = stock.get(equipment_id)
+        if row is None:
+            problems.append(f'unknown equipment id {equipment_id}')
+            continue
+        free = (row.capacity or 0) - peaks[equipment_id]
+        if free < units:
+            problems.append(f'{row.name}: {units} requested, {max(free, 0)} available')
+    if problems:
+        raise LedgerError(f'Insufficient stock - {"; ".join(problems)}.')
+
+    units = case(dict(demand), value=MedicalEquipment.id)
+    result = db.session.execute(
+        update(MedicalEquipment)
+        .where(MedicalEquipment.id.in_(demand), MedicalEquipment.quantity_available >= units)
+        .values(quantity_available=MedicalEquipment.quantity_available - units,
+                quantity_issued=MedicalEquipment.quantity_issued + units, updated_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != len(demand):
+        raise LedgerError('Stock changed while issuing; nothing was issued. Please try again.')
+
+    issue_ids = db.session.scalars(
+        insert(EquipmentIssue).returning(EquipmentIssue.id, sort_by_parameter_order=True),
+        [{
+            'equipment_id': line['equipment_id'],
+            'student_id': line['student_id'],
+            'hostel_id': stock[line['equipment_id']].hostel_id,
+            'issued_by_id': issued_by_id,
+            'quantity': line['quantity'],
+            'issued_date': now,
+            'expected_return_date': expected_return_date,
+            'status': 'Issued',
+            'created_at': now,
+            'updated_at': now,
+        } for line in lines]
+    ).all()
+
+    emit('equipment', 'bulk_issued', issue_ids=issue_ids, equipment_ids=sorted(demand),
+         quantity=sum(demand.values()))
+    return issue_ids
+
+
+def return_many(items, verified_by_id):
+    """
+    Return many issues at once, each in its own condition
+
+    Args:
+        items: Dicts with ``issue_id``, ``condition`` (normal, damaged, lost) and optional ``notes``
+        verified_by_id: User recorded as verifying the returns
+
+    Returns:
+        (issues returned, total penalty charged)
+
+    Raises:
+        LedgerError: Listing every issue that can't be returned; nothing is returned
+    """
+    if not items:
+        raise LedgerError('Nothing to return.')
+    by_id = {item['issue_id']: item for item in items}
+    if len(by_id) != len(items):
+        raise LedgerError('An issue is listed more than once.')
+    unknown_conditions = {item['condition'] for item in items} - set(RETURN_COUNTERS)
+    if unknown_conditions:
+        raise LedgerError(f'Unknown return condition(s): {", ".join(sorted(map(str, unknown_conditions)))}.')
+
+    issues = {row.id: row for row in db.session.execute(
+        select(EquipmentIssue.id, EquipmentIssue.equipment_id, EquipmentIssue.quantity,
+               EquipmentIssue.expected_return_date, EquipmentIssue.actual_return_date,
+               MedicalEquipment.unit_cost, MedicalEquipment.daily_penalty, MedicalEquipment.category)
+        .join(MedicalEquipment, EquipmentIssue.equipment_id == MedicalEquipment.id)
+        .where(EquipmentIssue.id.in_(by_id))
+    )}
+    problems = [f'issue {issue_id} not found' for issue_id in by_id if issue_id not in issues]
+    problems += [f'issue {row.id} already returned' for row in issues.values() if row.actual_return_date]
+    if problems:
+        raise LedgerError(f'Cannot return - {"; ".join(problems)}.')
+
+    now = datetime.utcnow()
+    result = db.session.execute(
+        update(EquipmentIssue)
+        .where(EquipmentIssue.id.in_(by_id), EquipmentIssue.actual_return_date.is_(None))
+        .values(actual_return_date=now, updated_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != len(by_id):
+        raise LedgerError('Some of these issues were returned meanwhile; nothing was returned. Please try again.')
+
+    rows = [issues[issue_id] for issue_id in by_id]
+    _, penalties = price({
+        'quantity': [row.quantity for row in rows],
+        'unit_cost': [row.unit_cost for row in rows],
+        'daily_penalty': [row.daily_penalty for row in rows],
+        'category': [row.category for row in rows],
+        'expected_return_date': [row.expected_return_date for row in rows],
+        'returned_at': [now] * len(rows),
+        'condition': [by_id[row.id]['condition'] for row in rows],
+    })
+
+    updates, moved = [], defaultdict(lambda: defaultdict(int))
+    for row, penalty in zip(rows, penalties):
+        item = by_id[row.id]
+        updates.append({'issue_id': row.id, 'condition': item['condition'], 'notes': item.get('notes') or '',
+                        'penalty': penalty})
+        moved[row.equipment_id][RETURN_COUNTERS[item['condition']]] += row.quantity
+        moved[row.equipment_id]['quantity_issued'] += row.quantity
+
+    issues_table = EquipmentIssue.__table__
+    db.session.execute(
+        issues_table.update()
+        .where(issues_table.c.id == bindparam('issue_id'))
+        .values(status='Returned', return_condition=bindparam('condition'), return_notes=bindparam('notes'),
+                penalty_amount=bindparam('penalty'), verified_by_id=verified_by_id, is_overdue=False),
+        updates
+    )
+
+    def units(counter):
+        return case({equipment_id: counts[counter] for equipment_id, counts in moved.items()},
+                    value=MedicalEquipment.id, else_=0)
+
+    result = db.session.execute(
+        update(MedicalEquipment)
+        .where(MedicalEquipment.id.in_(moved), MedicalEquipment.quantity_issued >= units('quantity_issued'))
+        .values(quantity_issued=MedicalEquipment.quantity_issued - units('quantity_issued'),
+                quantity_available=MedicalEquipment.quantity_available + units('quantity_available'),
+                quantity_damaged=MedicalEquipment.quantity_damaged + units('quantity_damaged'),
+                quantity_lost=MedicalEquipment.quantity_lost + units('quantity_lost'),
+                updated_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != len(moved):
+        raise LedgerError('Equipment counters are out of step with the issue records; reconcile them first.')
+
+    total_penalty = sum(update_row['penalty'] for update_row in updates)
+    emit('equipment', 'bulk_returned', issue_ids=sorted(by_id), equipment_ids=sorted(moved),
+         penalty_amount=round(total_penalty, 2))
+    return len(updates), total_penalty
+
+
+def _read_sheet(text, required):
+    reader = csv.DictReader(io.StringIO(text, newline=None))
+    missing = [column for column in required if column not in (reader.fieldnames or ())]
+    if missing:
+        return None, [f'Missing required columns: {", ".join(missing)}']
+    rows = []
+    for row_num, row in enumerate(reader, start=2):  # Row 1 is the header
+        values = {key: (value or '').strip() for key, value in row.items() if key}
+        if any(values.values()):
+            rows.append((row_num, values))
+    return rows, []
+
+
+def _lookup(rows):
+    """Students by roll number and equipment by code for every sheet row, one query each"""
+    rolls = {values.get('roll_number') for _, values in rows}
+    codes = {values.get('equipment_code') for _, values in rows}
+    students = dict(db.session.execute(
+        select(Student.roll_number, Student.id).where(Student.roll_number.in_(rolls))
+    ).all())
+    equipments = dict(db.session.execute(
+        select(MedicalEquipment.equipment_code, MedicalEquipment.id).where(MedicalEquipment.equipment_code.in_(codes))
+    ).all())
+    return students, equipments
+
+
+def parse_issue_sheet(text):
+    """
+    Parse a CSV bulk issue sheet
+
+    Required columns: roll_number, equipment_code. Optional: quantity (default 1).
+
+    Returns:
+        (lines, errors) - lines are dicts ready for ``issue_many``
+    """
+    rows, errors = _read_sheet(text, ISSUE_SHEET_COLUMNS)
+    if rows is None:
+        return [], errors
+    students, equipments = _lookup(rows)
+
+    lines = []
+    for row_num, values in rows:
+        student_id = students.get(values.get('roll_number'))
+        equipment_id = equipments.get(values.get('equipment_code'))
+        if student_id is None or equipment_id is None:
+            errors.append(f'Row {row_num}: unknown roll number or equipment code')
+            continue
+        try:
+            quantity = int(values.get('quantity') or 1)
+        except ValueError:
+            errors.append(f'Row {row_num}: Quantity must be a number')
+            continue
+        lines.append({'row': row_num, 'student_id': student_id, 'equipment_id': equipment_id, 'quantity': quantity})
+    return lines, errors
+
+
+def parse_return_sheet(text):
+    """
+    Parse a CSV bulk return sheet
+
+    Required columns: roll_number, equipment_code. Optional: condition (normal,
+    damaged or lost; default normal) and notes. Each row returns every open
+    issue of that equipment to that student.
+
+    Returns:
+        (items, errors) - items are dicts ready for ``return_many``
+    """
+    rows, errors = _read_sheet(text, RETURN_SHEET_COLUMNS)
+    if rows is None:
+        return [], errors
+    students, equipments = _lookup(rows)
+
+    open_issues = defaultdict(list)
+    for issue_id, student_id, equipment_id in db.session.execute(
+            select(EquipmentIssue.id, EquipmentIssue.student_id, EquipmentIssue.equipment_id)
+            .where(EquipmentIssue.actual_return_date.is_(None),
+                   EquipmentIssue.student_id.in_(set(students.values())),
+                   EquipmentIssue.equipment_id.in_(set(equipments.values())))):
+        open_issues[(student_id, equipment_id)].append(issue_id)
+
+    items = []
+    for row_num, values in rows:
+        condition = (values.get('condition') or 'normal').lower()
+        if condition not in RETURN_COUNTERS:
+            errors.append(f'Row {row_num}: condition must be one of {", ".join(RETURN_COUNTERS)}')
+            continue
+        key = (students.get(values.get('roll_number')), equipments.get(values.get('equipment_code')))
+        if not open_issues.get(key):
+            errors.append(f'Row {row_num}: no open issue of {values.get("equipment_code")} '
+                          f'to {values.get("roll_number")}')
+            continue
+        items.extend({'row': row_num, 'issue_id': issue_id, 'condition': condition, 'notes': values.get('notes')}
+                     for issue_id in open_issues.pop(key))
+    return items, errors
@@ -0,0 +1,360 @@
+"""
+Equipment availability ledger
+
+Every change to the counters on ``MedicalEquipment`` is a single guarded
+UPDATE, so two requests racing for the last unit can't both succeed:
+
+* issuing moves units from available to issued, after checking the units
+  are free on every day of the loan the same way a reservation is
+* returning claims the issue (only one return can stamp ``actual_return_date``)
+  and moves its units from issued to available, damaged or lost
+
+Reservations hold units for a student over future dates. A new reservation
+is checked against the peak number of units already committed on any day
+of its range (overlapping reservations found with the interval index, plus
+issues that are still out), with the equipment row locked so two
+reservations (or an issue and a reservation) can't both take the last unit.
+A reservation is issued between its start and end dates; ``expire_reservations``
+closes the ones whose end date passed without being issued.
+
+``reconciliation_query`` compares the counters with what the issue records
+imply and ``repair_counters`` rewrites them. Nothing here commits; the caller
+commits, or rolls back on LedgerError.
+"""
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import bindparam, case, func, or_, select, update
+
+from app.extensions import db
+from app.models import EquipmentIssue, EquipmentReservation, MedicalEquipment
+from app.outbox import emit
+
+# Return condition -> counter the returned units move to
+RETURN_COUNTERS = {
+    'normal': 'quantity_available',
+    'damaged': 'quantity_damaged',
+    'lost': 'quantity_lost',
+}
+
+
+class LedgerError(ValueError):
+    """An issue, return or reservation that can't be applied"""
+
+
+def _lock_capacity(equipment_id, now):
+    """
+    Lock an equipment row and return its units in service (available + issued)
+
+    Touching the row takes the write lock, so the availability check that
+    follows can't interleave with another issue or reservation.
+    """
+    result = db.session.execute(
+        update(MedicalEquipment).where(MedicalEquipment.id == equipment_id).values(updated_at=now)
+    )
+    if result.rowcount != 1:
+        raise LedgerError('Equipment not found.')
+    return db.session.execute(
+        select(MedicalEquipment.quantity_available + MedicalEquipment.quantity_issued)
+        .where(MedicalEquipment.id == equipment_id)
+    ).scalar() or 0
+
+
+def issue_units(equipment_id, student_id, quantity, issued_by_id, expected_return_date, reservation=None):
+    """
+    Issue equipment to a student
+
+    Checked the same way as a reservation: the units must be free on every
+    day from today to the return date, against the peak committed to other
+    reservations and issues still out (``committed_peak``). A reservation
+    being fulfilled releases its own units; it can only be issued between
+    its start and end dates (its units are only held for those days).
+
+    Args:
+        expected_return_date: When the units are due back (datetime)
+        reservation: EquipmentReservation this issue fulfils, if any
+
+    Returns:
+        The new EquipmentIssue (flushed)
+
+    Raises:
+        LedgerError: If not enough units are free; the caller should roll back
+    """
+    if not quantity or quantity < 1:
+        raise LedgerError('Quantity must be at least 1.')
+    if reservation is not None and (reservation.status != 'Reserved' or reservation.equipment_id != equipment_id):
+        raise LedgerError('The reservation is no longer open.')
+
+    # Checked like a reservation from today to the return date, with the equipment row locked
+    now = datetime.utcnow()
+    today = now.date()
+    if reservation is not None and reservation.end_date < today:
+        raise LedgerError(f'The reservation ended on {reservation.end_date}.')
+    if reservation is not None and reservation.start_date > today:
+        raise LedgerError(f'The reservation starts on {reservation.start_date}; it can be issued from then.')
+    capacity = _lock_capacity(equipment_id, now)
+    free = capacity - committed_peak(equipment_id, today, max(expected_return_date.date(), today),
+                                     exclude_id=reservation.id if reservation is not None else None, today=today)
+    if free < quantity:
+        raise LedgerError(f'Insufficient stock. Available: {max(free, 0)}')
+
+    result = db.session.execute(
+        update(MedicalEquipment)
+        .where(MedicalEquipment.id == equipment_id, MedicalEquipment.quantity_available >= quantity)
+        .values(quantity_available=MedicalEquipment.quantity_available - quantity,
+                quantity_issued=MedicalEquipment.quantity_issued + quantity, updated_at=now)
+        .execution_options(synchronize_session='fetch')
+    )
+    if result.rowcount != 1:
+        raise LedgerError('Equipment counters are out of step with the issue records; reconcile them first.')
+
+    issue = EquipmentIssue(
+        equipment_id=equipment_id,
+        student_id=student_id,
+        issued_by_id=issued_by_id,
+        quantity=quantity,
+        issued_date=now,
+        expected_return_date=expected_return_date
+    )
+    db.session.add(issue)
+    db.session.flush()
+
+    if reservation is not None:
+        result = db.session.execute(
+            update(EquipmentReservation)
+            .where(EquipmentReservation.id == reservation.id, EquipmentReservation.status == 'Reserved')
+            .values(status='Fulfilled', issue_id=issue.id, updated_at=now)
+        )
+        if result.rowcount != 1:
+            raise LedgerError('The reservation was fulfilled or cancelled meanwhile.')
+
+    emit('equipment', 'issued', issue_id=issue.id, equipment_id=equipment_id, student_id=student_id,
+         quantity=quantity)
+    return issue
+
+
+def return_issue(issue, condition, notes='', verified_by_id=None):
+    """
+    Return an issue's units in the given condition and record its penalty
+
+    Raises:
+        LedgerError: If the issue was already returned or the counters are out
+            of step with it (run ``cli.py reconcile-equipment``)
+    """
+    counter = RETURN_COUNTERS.get(condition)
+    if counter is None:
+        raise LedgerError(f'Unknown return condition: {condition}.')
+
+    now = datetime.utcnow()
+    result = db.session.execute(
+        update(EquipmentIssue)
+        .where(EquipmentIssue.id == issue.id, EquipmentIssue.actual_return_date.is_(None))
+        .values(actual_return_date=now, updated_at=now)
+    )
+    if result.rowcount != 1:
+        raise LedgerError('This issue has already been returned.')
+
+    target = getattr(MedicalEquipment, counter)
+    result = db.session.execute(
+        update(MedicalEquipment)
+        .where(MedicalEquipment.id == issue.equipment_id, MedicalEquipment.quantity_issued >= issue.quantity)
+        .values({MedicalEquipment.quantity_issued: MedicalEquipment.quantity_issued - issue.quantity,
+                 target: target + issue.quantity, MedicalEquipment.updated_at: now})
+    )
+    if result.rowcount != 1:
+        raise LedgerError('Equipment counters are out of step with the issue records; reconcile them first.')
+
+    issue.process_return(condition, notes)
+    if verified_by_id is not None:
+        issue.verified_by_id = verified_by_id
+    emit('equipment', 'returned', issue_id=issue.id, equipment_id=issue.equipment_id,
+         condition=condition, penalty_amount=issue.penalty_amount)
+    return issue
+
+
+def committed_peaks(equipment_ids, start, end, exclude_id=None, today=None):
+    """
+    Most units committed on any single day between start and end, per equipment
+
+    Open reservations overlapping the range count over their own dates; issues
+    still out count from today until their expected return (at least today).
+    Two queries however many equipment ids are given.
+
+    Returns:
+        Dict of equipment id -> peak (0 for equipment with nothing committed)
+    """
+    today = today or date.today()
+    intervals = defaultdict(list)
+    for equipment_id, first, last, quantity in db.session.execute(
+            select(EquipmentReservation.equipment_id, EquipmentReservation.start_date,
+                   EquipmentReservation.end_date, EquipmentReservation.quantity)
+            .where(EquipmentReservation.equipment_id.in_(equipment_ids), EquipmentReservation.status == 'Reserved',
+                   EquipmentReservation.start_date <= end, EquipmentReservation.end_date >= start,
+                   EquipmentReservation.id != (exclude_id or 0))):
+        intervals[equipment_id].append((first, last, quantity))
+    for equipment_id, expected, quantity in db.session.execute(
+            select(EquipmentIssue.equipment_id, EquipmentIssue.expected_return_date, EquipmentIssue.quantity)
+            .where(EquipmentIssue.equipment_id.in_(equipment_ids), EquipmentIssue.actual_return_date.is_(None))):
+        intervals[equipment_id].append((today, max(expected.date(), today), quantity))
+
+    peaks = dict.fromkeys(equipment_ids, 0)
+    for equipment_id, spans in intervals.items():
+        # Sweep over the days where the committed total changes
+        changes = defaultdict(int)
+        for first, last, quantity in spans:
+            first, last = max(first, start), min(last, end)
+            if first <= last:
+                changes[first] += quantity
+                changes[last + timedelta(days=1)] -= quantity
+        peak = running = 0
+        for day in sorted(changes):
+            running += changes[day]
+            peak = max(peak, running)
+        peaks[equipment_id] = peak
+    return peaks
+
+
+def committed_peak(equipment_id, start, end, exclude_id=None, today=None):
+    """Most units of one equipment committed on any single day between start and end (see committed_peaks)"""
+    return committed_peaks([equipment_id], start, end, exclude_id, today)[equipment_id]
+
+
+def reserve(equipment_id, student_id, quantity, start_date, end_date, reserved_by_id, notes=''):
+    """
+    Reserve units of an equipment for a student between two dates (inclusive)
+
+    Returns:
+        The new EquipmentReservation (flushed)
+
+    Raises:
+        LedgerError: If the dates are invalid or the units aren't free on every day
+    """
+    today = date.today()
+    if not quantity or quantity < 1:
+        raise LedgerError('Quantity must be at least 1.')
+    if start_date < today or end_date < start_date:
+        raise LedgerError('Reservations need a start date from today and an end date on or after it.')
+
+    # Lock the equipment row so concurrent reservations are checked one at a time
+    capacity = _lock_capacity(equipment_id, datetime.utcnow())
+    free = capacity - committed_peak(equipment_id, start_date, end_date, today=today)
+    if free < quantity:
+        raise LedgerError(f'Only {max(free, 0)} unit(s) free on every day from {start_date} to {end_date}.')
+
+    reservation = EquipmentReservation(
+        equipment_id=equipment_id,
+        student_id=student_id,
+        reserved_by_id=reserved_by_id,
+        quantity=quantity,
+        start_date=start_date,
+        end_date=end_date,
+        notes=notes
+    )
+    db.session.add(reservation)
+    db.session.flush()
+    emit('equipment', 'reserved', reservation_id=reservation.id, equipment_id=equipment_id,
+         student_id=student_id, quantity=quantity)
+    return reservation
+
+
+def cancel_reservation(reservation):
+    """Release a reservation's units; raises LedgerError if it is no longer open"""
+    result = db.session.execute(
+        update(EquipmentReservation)
+        .where(EquipmentReservation.id == reservation.id, EquipmentReservation.status == 'Reserved')
+        .values(status='Cancelled', updated_at=datetime.utcnow())
+    )
+    if result.rowcount != 1:
+        raise LedgerError('The reservation was fulfilled or cancelled meanwhile.')
+    emit('equipment', 'reservation_cancelled', reservation_id=reservation.id,
+         equipment_id=reservation.equipment_id)
+
+
+def expire_reservations(today=None):
+    """
+    Close open reservations whose end date has passed (status Expired) in one UPDATE
+
+    Returns:
+        Number of reservations expired
+    """
+    today = today or date.today()
+    expired = db.session.scalars(
+        update(EquipmentReservation)
+        .where(EquipmentReservation.status == 'Reserved', EquipmentReservation.end_date < today)
+        .values(status='Expired', updated_at=datetime.utcnow())
+        .returning(EquipmentReservation.id)
+        .execution_options(synchronize_session=False)
+    ).all()
+    if expired:
+        emit('equipment', 'reservations_expired', reservation_ids=expired)
+    return len(expired)
+
+
+def reconciliation_query(discrepancies_only=True):
+    """
+    Equipment counters next to the values the issue records imply
+
+    Issued units are those on issues not yet returned; damaged and lost units
+    those returned in that condition. Total stock isn't recorded anywhere
+    else, so the expected available count keeps the current total (or the
+    units accounted for by issues, if that is higher).
+
+    Returns:
+        Query of rows: id, equipment_code, name, available, issued, damaged, lost,
+        and expected_available, expected_issued, expected_damaged, expected_lost
+    """
+    def units(condition):
+        return func.coalesce(func.sum(case((condition, EquipmentIssue.quantity), else_=0)), 0)
+
+    derived = db.session.query(
+        EquipmentIssue.equipment_id,
+        units(EquipmentIssue.actual_return_date.is_(None)).label('issued'),
+        units(EquipmentIssue.return_condition == 'damaged').label('damaged'),
+        units(EquipmentIssue.return_condition == 'lost').label('lost'),
+    ).group_by(EquipmentIssue.equipment_id).subquery()
+
+    available = func.coalesce(MedicalEquipment.quantity_available, 0)
+    issued = func.coalesce(MedicalEquipment.quantity_issued, 0)
+    damaged = func.coalesce(MedicalEquipment.quantity_damaged, 0)
+    lost = func.coalesce(MedicalEquipment.quantity_lost, 0)
+    expected_issued = func.coalesce(derived.c.issued, 0)
+    expected_damaged = func.coalesce(derived.c.damaged, 0)
+    expected_lost = func.coalesce(derived.c.lost, 0)
+    accounted = expected_issued + expected_damaged + expected_lost
+    expected_available = case((available + issued + damaged + lost > accounted,
+                               available + issued + damaged + lost - accounted), else_=0)
+
+    query = db.session.query(
+        MedicalEquipment.id, MedicalEquipment.equipment_code, MedicalEquipment.name,
+        available.label('available'), issued.label('issued'), damaged.label('damaged'), lost.label('lost'),
+        expected_available.label('expected_available'), expected_issued.label('expected_issued'),
+        expected_damaged.label('expected_damaged'), expected_lost.label('expected_lost'),
+    ).select_from(MedicalEquipment).outerjoin(derived, derived.c.equipment_id == MedicalEquipment.id)
+
+    if discrepancies_only:
+        query = query.filter(or_(available != expected_available, issued != expected_issued,
+                                 damaged != expected_damaged, lost != expected_lost))
+    return query.order_by(MedicalEquipment.equipment_code)
+
+
+def repair_counters():
+    """
+    Rewrite drifting equipment counters from the issue records in one bulk UPDATE
+
+    Returns:
+        Number of equipment rows repaired
+    """
+    rows = reconciliation_query().all()
+    if rows:
+        equipments = MedicalEquipment.__table__
+        db.session.execute(
+            equipments.update()
+            .where(equipments.c.id == bindparam('equipment_id'))
+            .values(quantity_available=bindparam('available'), quantity_issued=bindparam('issued'),
+                    quantity_damaged=bindparam('damaged'), quantity_lost=bindparam('lost'),
+                    updated_at=datetime.utcnow()),
+            [{'equipment_id': row.id, 'available': row.expected_available, 'issued': row.expected_issued,
+              'damaged': row.expected_damaged, 'lost': row.expected_lost} for row in rows]
+        )
+        emit('equipment', 'reconciled', equipment_ids=[row.id for row in rows])
+    return len(rows)
@@ -0,0 +1,215 @@
+"""
+Equipment penalty engine
+
+Penalties are priced from a rule table (``EQUIPMENT_PENALTY_RULES``, keyed by
+equipment category; categories without an entry use ``default``). A rule
+charges:
+
+* ``damage_rate`` / ``loss_rate`` - fraction of the unit cost per unit
+  returned damaged or lost
+* ``daily_rate`` - per unit for every late day; None uses the equipment's own
+  ``daily_penalty``
+* ``grace_days`` - late days that are not charged (a return any part of a
+  day late counts as one late day); each late day after them is charged
+* ``max_late_days`` - late days charged at most (None: no limit)
+* ``cap`` - most charged per unit, as a fraction of the unit cost (None: no
+  cap; ignored for equipment without a cost)
+
+``price`` works over column arrays, so a sweep, a bulk return or a report
+prices every issue in one pass and applies the amounts with one executemany
+UPDATE. Nothing here writes or commits; callers apply the results in their
+own transaction.
+"""
+from array import array
+from collections import defaultdict
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import bindparam, select
+
+from app.extensions import db
+from app.models import EquipmentIssue, MedicalEquipment
+
+DEFAULT_RULE = {
+    'damage_rate': 0.5,
+    'loss_rate': 1.0,
+    'daily_rate': None,
+    'grace_days': 0,
+    'max_late_days': None,
+    'cap': None,
+}
+
+# Columns ``price`` reads, in the order ``penalty_columns`` selects them
+PRICE_COLUMNS = ('quantity', 'unit_cost', 'daily_penalty', 'category', 'expected_return_date', 'returned_at',
+                 'condition')
+
+
+def load_rules(overrides=None):
+    """
+    Penalty rules per category from the config, with ``overrides`` (same shape) on top
+
+    Raises:
+        ValueError: A rule names a setting the engine doesn't know
+    """
+    configured = current_app.config.get('EQUIPMENT_PENALTY_RULES') or {}
+    overrides = overrides or {}
+    for table in (configured, overrides):
+        for category, rule in table.items():
+            unknown = set(rule) - set(DEFAULT_RULE)
+            if unknown:
+                raise ValueError(f'Unknown penalty setting(s) for {category}: {", ".join(sorted(unknown))}')
+
+    default = {**DEFAULT_RULE, **configured.get('default', {}), **overrides.get('default', {})}
+    rules = {'default': default}
+    for category in (set(configured) | set(overrides)) - {'default'}:
+        rules[category] = {**default, **configured.get(category, {}), **overrides.get(category, {})}
+    return rules
+
+
+def price(columns, rules=None, as_of=None):
+    """
+    Penalty for each issue given as column arrays
+
+    Args:
+        columns: Dict of equal-length sequences named by PRICE_COLUMNS;
+            ``returned_at`` None means still out (priced as of ``as_of``) and
+            ``condition`` None charges only the late fee
+        rules: From ``load_rules`` (default: the configured rules)
+        as_of: Time open issues are priced at (default: now)
+
+    Returns:
+        (days overdue, penalties) as arrays in the order of the columns
+    """
+    rules = rules or load_rules()
+    as_of = as_of or datetime.utcnow()
+    count = len(columns['quantity'])
+    days_overdue, penalties = array('i', [0]) * count, array('d', [0.0]) * count
+
+    for index, (quantity, unit_cost, daily_penalty, category, due, returned_at, condition) in enumerate(
+            zip(*(columns[name] for name in PRICE_COLUMNS))):
+        rule = rules.get(category) or rules['default']
+        unit_cost = unit_cost or 0.0
+        per_unit = 0.0
+        if condition == 'damaged':
+            per_unit = unit_cost * rule['damage_rate']
+        elif condition == 'lost':
+            per_unit = unit_cost * rule['loss_rate']
+
+        returned_at = returned_at or as_of
+        if returned_at > due:
+            days_overdue[index] = late_days = max(1, (returned_at - due).days)
+            charged = max(0, late_days - rule['grace_days'])
+            if rule['max_late_days'] is not None:
+                charged = min(charged, rule['max_late_days'])
+            daily = rule['daily_rate'] if rule['daily_rate'] is not None else (daily_penalty or 0.0)
+            per_unit += charged * daily
+
+        if rule['cap'] is not None and unit_cost:
+            per_unit = min(per_unit, unit_cost * rule['cap'])
+        penalties[index] = round(per_unit * quantity, 2)
+    return days_overdue, penalties
+
+
+def penalty_for(condition, quantity, equipment, expected_return_date, returned_at, rules=None):
+    """Penalty for a single return of ``quantity`` units of ``equipment``"""
+    _, penalties = price({
+        'quantity': [quantity],
+        'unit_cost': [equipment.unit_cost],
+        'daily_penalty': [equipment.daily_penalty],
+        'category': [equipment.category],
+        'expected_return_date': [expected_return_date],
+        'returned_at': [returned_at],
+        'condition': [condition],
+    }, rules)
+    return penalties[0]
+
+
+def return_quote(issue, rules=None, as_of=None):
+    """Penalty returning ``issue`` now would be charged, per condition (None: the late fee alone)"""
+    conditions = (None, 'normal', 'damaged', 'lost')
+    equipment = issue.equipment
+    _, penalties = price({
+        'quantity': [issue.quantity] * len(conditions),
+        'unit_cost': [equipment.unit_cost] * len(conditions),
+        'daily_penalty': [equipment.daily_penalty] * len(conditions),
+        'category': [equipment.category] * len(conditions),
+        'expected_return_date': [issue.expected_return_date] * len(conditions),
+        'returned_at': [issue.actual_return_date] * len(conditions),
+        'condition': conditions,
+    }, rules, as_of)
+    return dict(zip(conditions, penalties))
+
+
+def penalty_columns(*criteria):
+    """SELECT of issue id, status, penalty charged so far and the PRICE_COLUMNS for issues matching ``criteria``"""
+    return select(
+        EquipmentIssue.id, EquipmentIssue.status, EquipmentIssue.penalty_amount, EquipmentIssue.days_overdue,
+        EquipmentIssue.quantity, MedicalEquipment.unit_cost, MedicalEquipment.daily_penalty,
+        MedicalEquipment.category, EquipmentIssue.expected_return_date,
+        EquipmentIssue.actual_return_date.label('returned_at'), EquipmentIssue.return_condition.label('condition'),
+    ).join(MedicalEquipment, EquipmentIssue.equipment_id == MedicalEquipment.id).where(*criteria)
+
+
+def _load_columns(*criteria):
+    rows = db.session.execute(penalty_columns(*criteria)).all()
+    names = ('id', 'status', 'penalty_amount', 'days_overdue') + PRICE_COLUMNS
+    return {name: column for name, column in zip(names, zip(*rows))} if rows else {name: () for name in names}
+
+
+def sweep_overdue(now=None, rules=None):
+    """
+    Mark issues past due as Overdue and bring their penalty up to date
+
+    Priced together and written with one executemany UPDATE, only for issues
+    whose days overdue or penalty changed. The caller commits.
+
+    Returns:
+        Number of issues updated
+    """
+    now = now or datetime.utcnow()
+    columns = _load_columns(EquipmentIssue.actual_return_date.is_(None), EquipmentIssue.expected_return_date < now,
+                            EquipmentIssue.status != 'Defaulted')
+    days_overdue, penalties = price(columns, rules, as_of=now)
+    updates = [
+        {'issue_id': issue_id, 'days': days, 'penalty': penalty}
+        for issue_id, status, old_days, old_penalty, days, penalty
+        in zip(columns['id'], columns['status'], columns['days_overdue'], columns['penalty_amount'],
+               days_overdue, penalties)
+        if (status, old_days, old_penalty) != ('Overdue', days, penalty)
+    ]
+    if updates:
+        issues = EquipmentIssue.__table__
+        db.session.execute(
+            issues.update()
+            .where(issues.c.id == bindparam('issue_id'), issues.c.actual_return_date.is_(None))
+            .values(status='Overdue', is_overdue=True, days_overdue=bindparam('days'),
+                    penalty_amount=bindparam('penalty'), updated_at=now),
+            updates
+        )
+    return len(updates)
+
+
+def reprice(overrides, *criteria, as_of=None):
+    """
+    What-if: penalties returned issues would have been charged under other rules
+
+    Args:
+        overrides: Rule table laid over the configured rules
+        criteria: Extra filters on the issues (e.g. a return date range)
+
+    Returns:
+        Rows per category (dicts with ``category``, ``issues``, ``charged``,
+        ``repriced``, ``difference``), largest difference first
+    """
+    columns = _load_columns(EquipmentIssue.actual_return_date.isnot(None), *criteria)
+    _, repriced = price(columns, load_rules(overrides), as_of=as_of)
+    totals = defaultdict(lambda: [0, 0.0, 0.0])
+    for category, charged, penalty in zip(columns['category'], columns['penalty_amount'], repriced):
+        total = totals[category or 'Uncategorised']
+        total[0] += 1
+        total[1] += charged or 0.0
+        total[2] += penalty
+    rows = [{'category': category, 'issues': issues, 'charged': round(charged, 2), 'repriced': round(penalty, 2),
+             'difference': round(penalty - charged, 2)}
+            for category, (issues, charged, penalty) in totals.items()]
+    return sorted(rows, key=lambda row: abs(row['difference']), reverse=True)
@@ -5,9 +5,16 @@ from datetime import datetime, timedelta
 from flask import render_template, request, flash, redirect, url_for, jsonify
 from flask_login import login_required, current_user
 from sqlalchemy import and_, or_
-from app.extensions import db
-from app.models import MedicalEquipment, EquipmentIssue, Student, User
+from app.extensions import db, cache
+from app.models import MedicalEquipment, EquipmentIssue, EquipmentReservation, Student, User
+from app.exports.utils import export_report
+from app.facets import get_facets
+from app.responses import not_modified
+from app.outbox import emit
 from . import equipment_bp
+from .bulk import issue_many, parse_issue_sheet, parse_return_sheet, return_many
+from .ledger import LedgerError, cancel_reservation, issue_units, reserve, return_issue
+from .penalties import return_quote
 
 
 def require_role(*roles):
@@ -27,8 +34,14 @@ def require_role(*roles):
 @login_required
 def inventory():
     """View equipment inventory"""
+    cached = not_modified(MedicalEquipment, EquipmentIssue)
+    if cached:
+        return cached
+    
     page = request.args.get('page', 1, type=int)
     search = request.args.get('search', '')
+    category = request.args.get('category', '')
+    location = request.args.get('location', '')
     
     query = MedicalEquipment.query
     
@@ -41,9 +54,16 @@ def inventory():
             )
         )
     
+    if category:
+        query = query.filter_by(category=category)
+    
+    if location:
+        query = query.filter_by(location=location)
+    
     equipments = query.paginate(page=page, per_page=20)
     
-    return render_template('equipment/inventory.html', equipments=equipments, search=search)
+    return render_template('equipment/inventory.html', equipments=equipments, search=search,
+                          facets=get_facets('equipment'), selected_category=category, selected_location=location)
 
 
 @equipment_bp.route('/issue', methods=['GET', 'POST'])
@@ -66,31 +86,18 @@ def issue_equipment():
                 flash('Invalid student or equipment.', 'danger')
                 return redirect(url_for('equipment.issue_equipment'))
             
-            if equipment.quantity_available < quantity:
-                flash(f'Insufficient stock. Available: {equipment.quantity_available}', 'danger')
-                return redirect(url_for('equipment.issue_equipment'))
-            
-            # Create issue record
+            # Stock is checked and taken in one guarded update
             expected_return_date = datetime.utcnow() + timedelta(days=expected_return_days)
-            
-            issue = EquipmentIssue(
-                equipment_id=equipment_id,
-                student_id=student_id,
-                issued_by_id=current_user.id,
-                quantity=quantity,
-                expected_return_date=expected_return_date
-            )
-            
-            # Update equipment quantity
-            equipment.quantity_available -= quantity
-            equipment.quantity_issued += quantity
-            
-            db.session.add(issue)
+            issue_units(equipment_id, student_id, quantity, current_user.id, expected_return_date)
             db.session.commit()
             
             flash(f'Equipment issued successfully. Expected return: {expected_return_date.strftime("%Y-%m-%d")}', 'success')
             return redirect(url_for('equipment.issue_list'))
             
+        except LedgerError as e:
+            db.session.rollback()
+            flash(str(e), 'danger')
+            return redirect(url_for('equipment.issue_equipment'))
         except Exception as e:
             db.session.rollback()
             flash(f'Error issuing equipment: {str(e)}', 'danger')
@@ -139,18 +146,7 @@ def issue_list():
             )
         )
     
-    # Mark overdue issues
-    overdue_issues = query.filter(
-        and_(
-            EquipmentIssue.actual_return_date == None,
-            EquipmentIssue.expected_return_date < datetime.utcnow(),
-            EquipmentIssue.status != 'Overdue'
-        )
-    ).all()
-    
-    for issue in overdue_issues:
-        issue.mark_as_overdue()
-    
+    # Overdue status and penalties are kept current by python cli.py sweep-overdue
     issues = query.order_by(EquipmentIssue.issued_date.desc()).paginate(page=page, per_page=20)
     
     return render_template('equipment/issue_list.html', issues=issues, status_filter=status_filter, search=search)
@@ -178,9 +174,7 @@ def return_equipment(issue_id):
                 return redirect(url_for('equipment.return_equipment', issue_id=issue_id))
             
             # Process return
-            issue.process_return(condition, notes)
-            issue.verified_by_id = current_user.id
-            
+            return_issue(issue, condition, notes, verified_by_id=current_user.id)
             db.session.commit()
             
             penalty_msg = ''
@@ -190,11 +184,212 @@ def return_equipment(issue_id):
             flash(f'Equipment return processed successfully.{penalty_msg}', 'success')
             return redirect(url_for('equipment.issue_list'))
             
+        except LedgerError as e:
+            db.session.rollback()
+            flash(str(e), 'danger')
+            return redirect(url_for('equipment.issue_list'))
         except Exception as e:
             db.session.rollback()
             flash(f'Error processing return: {str(e)}', 'danger')
     
-    return render_template('equipment/return.html', issue=issue)
+    return render_template('equipment/return.html', issue=issue, quote=return_quote(issue))
+
+
+def _read_sheet_upload(parse):
+    """
+    Parse an uploaded CSV sheet with ``parse``
+    
+    Returns:
+        (lines, error) - error is a message to flash when the sheet can't be used
+    """
+    file = request.files.get('file')
+    if not file.filename.endswith(('.csv', '.txt')):
+        return None, 'Please upload a CSV or TXT file.'
+    try:
+        lines, errors = parse(file.read().decode('UTF-8'))
+    except UnicodeDecodeError:
+        return None, 'The file must be UTF-8 encoded CSV.'
+    if errors:
+        error_msg = '; '.join(errors[:10])  # Show first 10 errors
+        if len(errors) > 10:
+            error_msg += f'; ... and {len(errors) - 10} more errors'
+        return None, f'The sheet was not applied. Encountered {len(errors)} error(s): {error_msg}'
+    return lines, None
+
+
+@equipment_bp.route('/bulk-issue', methods=['GET', 'POST'])
+@login_required
+@require_role('H2', 'Doctor')
+def bulk_issue():
+    """Issue equipment to many students at once (form or CSV sheet), all-or-nothing"""
+    if request.method == 'POST':
+        if request.files.get('file') and request.files['file'].filename:
+            lines, error = _read_sheet_upload(parse_issue_sheet)
+            if error:
+                flash(error, 'danger')
+                return redirect(url_for('equipment.bulk_issue'))
+        else:
+            equipment_id = request.form.get('equipment_id', type=int)
+            quantity = request.form.get('quantity', 1, type=int)
+            lines = [{'student_id': student_id, 'equipment_id': equipment_id, 'quantity': quantity}
+                     for student_id in request.form.getlist('student_ids', type=int)]
+        
+        expected_return_days = request.form.get('expected_return_days', 7, type=int)
+        expected_return_date = datetime.utcnow() + timedelta(days=expected_return_days)
+        try:
+            issue_ids = issue_many(lines, current_user.id, expected_return_date)
+        except LedgerError as e:
+            db.session.rollback()
+            flash(f'Nothing was issued. {e}', 'danger')
+            return redirect(url_for('equipment.bulk_issue'))
+        
+        db.session.commit()
+        flash(f'Issued {len(issue_ids)} item(s). Expected return: {expected_return_date.strftime("%Y-%m-%d")}', 'success')
+        return redirect(url_for('equipment.issue_list'))
+    
+    students = Student.query.all()
+    equipments = MedicalEquipment.query.filter(MedicalEquipment.quantity_available > 0) \
+        .order_by(MedicalEquipment.name).all()
+    
+    return render_template('equipment/bulk_issue.html', students=students, equipments=equipments)
+
+
+@equipment_bp.route('/bulk-return', methods=['GET', 'POST'])
+@login_required
+@require_role('H2', 'Doctor')
+def bulk_return():
+    """Process many returns at once (ticked open issues or CSV sheet), all-or-nothing"""
+    if request.method == 'POST':
+        if request.files.get('file') and request.files['file'].filename:
+            items, error = _read_sheet_upload(parse_return_sheet)
+            if error:
+                flash(error, 'danger')
+                return redirect(url_for('equipment.bulk_return'))
+        else:
+            items = [{'issue_id': issue_id, 'condition': request.form.get(f'condition_{issue_id}', 'normal'),
+                      'notes': request.form.get('notes', '')}
+                     for issue_id in request.form.getlist('issue_ids', type=int)]
+        
+        # Doctors verify returns of equipment they issued; H2 verifies any
+        if current_user.role != 'H2' and items:
+            others = EquipmentIssue.query.filter(EquipmentIssue.id.in_([item['issue_id'] for item in items]),
+                                                 EquipmentIssue.issued_by_id != current_user.id).count()
+            if others:
+                flash('You can only verify returns for equipment you issued.', 'danger')
+                return redirect(url_for('equipment.bulk_return'))
+        
+        try:
+            returned, penalty = return_many(items, current_user.id)
+        except LedgerError as e:
+            db.session.rollback()
+            flash(f'Nothing was returned. {e}', 'danger')
+            return redirect(url_for('equipment.bulk_return'))
+        
+        db.session.commit()
+        penalty_msg = f' Penalties charged: ₹{penalty:.2f}' if penalty > 0 else ''
+        flash(f'Processed {returned} return(s).{penalty_msg}', 'success')
+        return redirect(url_for('equipment.issue_list'))
+    
+    equipment_id = request.args.get('equipment_id', type=int)
+    query = EquipmentIssue.query.filter(EquipmentIssue.actual_return_date.is_(None))
+    if current_user.role != 'H2':
+        query = query.filter_by(issued_by_id=current_user.id)
+    if equipment_id:
+        query = query.filter_by(equipment_id=equipment_id)
+    open_issues = query.order_by(EquipmentIssue.expected_return_date, EquipmentIssue.id).limit(500).all()
+    equipments = MedicalEquipment.query.filter(MedicalEquipment.quantity_issued > 0) \
+        .order_by(MedicalEquipment.name).all()
+    
+    return render_template('equipment/bulk_return.html', issues=open_issues, equipments=equipments,
+                           equipment_id=equipment_id)
+
+
+@equipment_bp.route('/reservations', methods=['GET', 'POST'])
+@login_required
+@require_role('H2', 'Doctor', 'Student')
+def reservations():
+    """Reserve equipment for future dates and list open reservations"""
+    own_student = None
+    if current_user.role == 'Student':
+        own_student = Student.query.filter_by(user_id=current_user.id).first_or_404()
+    
+    if request.method == 'POST':
+        try:
+            student_id = own_student.id if own_student else request.form.get('student_id', type=int)
+            equipment_id = request.form.get('equipment_id', type=int)
+            quantity = request.form.get('quantity', 1, type=int)
+            start_date = datetime.strptime(request.form.get('start_date', ''), '%Y-%m-%d').date()
+            end_date = datetime.strptime(request.form.get('end_date', ''), '%Y-%m-%d').date()
+            
+            if not Student.query.get(student_id) or not MedicalEquipment.query.get(equipment_id):
+                flash('Invalid student or equipment.', 'danger')
+                return redirect(url_for('equipment.reservations'))
+            
+            reserve(equipment_id, student_id, quantity, start_date, end_date, current_user.id,
+                    notes=request.form.get('notes', ''))
+            db.session.commit()
+            flash(f'Equipment reserved from {start_date} to {end_date}.', 'success')
+        except ValueError as e:
+            db.session.rollback()
+            flash(str(e) if isinstance(e, LedgerError) else 'Invalid dates. Use YYYY-MM-DD.', 'danger')
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Error reserving equipment: {str(e)}', 'danger')
+        return redirect(url_for('equipment.reservations'))
+    
+    query = EquipmentReservation.query.filter(EquipmentReservation.status == 'Reserved',
+                                              EquipmentReservation.end_date >= datetime.utcnow().date())
+    if own_student:
+        query = query.filter_by(student_id=own_student.id)
+    open_reservations = query.order_by(EquipmentReservation.start_date, EquipmentReservation.id).all()
+    
+    students = [own_student] if own_student else Student.query.all()
+    equipments = MedicalEquipment.query.order_by(MedicalEquipment.name).all()
+    
+    return render_template('equipment/reservations.html', reservations=open_reservations, students=students,
+                           equipments=equipments, today=datetime.utcnow().date())
+
+
+@equipment_bp.route('/reservations/<int:reservation_id>/cancel', methods=['POST'])
+@login_required
+@require_role('H2', 'Doctor', 'Student')
+def cancel_equipment_reservation(reservation_id):
+    """Cancel an open reservation (students can only cancel their own)"""
+    reservation = EquipmentReservation.query.get_or_404(reservation_id)
+    
+    if current_user.role == 'Student' and reservation.student.user_id != current_user.id:
+        flash('You can only cancel your own reservations.', 'danger')
+        return redirect(url_for('equipment.reservations'))
+    
+    try:
+        cancel_reservation(reservation)
+        db.session.commit()
+        flash('Reservation cancelled.', 'success')
+    except LedgerError as e:
+        db.session.rollback()
+        flash(str(e), 'danger')
+    
+    return redirect(url_for('equipment.reservations'))
+
+
+@equipment_bp.route('/reservations/<int:reservation_id>/issue', methods=['POST'])
+@login_required
+@require_role('H2', 'Doctor')
+def issue_reservation(reservation_id):
+    """Issue reserved equipment to its student, due back at the end of the reservation"""
+    reservation = EquipmentReservation.query.get_or_404(reservation_id)
+    
+    try:
+        expected_return_date = datetime.combine(reservation.end_date, datetime.max.time().replace(microsecond=0))
+        issue_units(reservation.equipment_id, reservation.student_id, reservation.quantity, current_user.id,
+                    expected_return_date, reservation=reservation)
+        db.session.commit()
+        flash(f'Reserved equipment issued. Expected return: {reservation.end_date}', 'success')
+        return redirect(url_for('equipment.issue_list'))
+    except LedgerError as e:
+        db.session.rollback()
+        flash(str(e), 'danger')
+        return redirect(url_for('equipment.reservations'))
 
 
 @equipment_bp.route('/manage', methods=['GET', 'POST'])
@@ -267,13 +462,9 @@ def manage_equipment():
     return render_template('equipment/manage.html', equipments=equipments)
 
 
-@equipment_bp.route('/penalty-report', methods=['GET'])
-@login_required
-@require_role('Office', 'H2')
-def penalty_report():
-    """View penalty report for overdue/damaged/lost equipment"""
-    page = request.args.get('page', 1, type=int)
-    filter_type = request.args.get('filter', 'all')  # all, unpaid, paid
+def _penalty_query(args):
+    """Issues with penalties matching the report filter"""
+    filter_type = args.get('filter', 'all')  # all, unpaid, paid
     
     query = EquipmentIssue.query.filter(EquipmentIssue.penalty_amount > 0)
     
@@ -282,13 +473,54 @@ def penalty_report():
     elif filter_type == 'paid':
         query = query.filter_by(penalty_paid=True)
     
-    issues = query.order_by(EquipmentIssue.updated_at.desc()).paginate(page=page, per_page=20)
+    return query
+
+
+def _penalty_export(args):
+    """Export builder for the penalty report"""
+    headers = ['Issue ID', 'Roll Number', 'First Name', 'Last Name', 'Equipment Code', 'Equipment',
+               'Quantity', 'Issued', 'Expected Return', 'Returned', 'Return Condition', 'Days Overdue',
+               'Penalty Amount', 'Penalty Paid', 'Paid Date', 'Status']
+    query = _penalty_query(args) \
+        .join(Student, EquipmentIssue.student_id == Student.id) \
+        .join(User, Student.user_id == User.id) \
+        .join(MedicalEquipment, EquipmentIssue.equipment_id == MedicalEquipment.id) \
+        .with_entities(
+            EquipmentIssue.id, Student.roll_number, User.first_name, User.last_name,
+            MedicalEquipment.equipment_code, MedicalEquipment.name, EquipmentIssue.quantity,
+            EquipmentIssue.issued_date, EquipmentIssue.expected_return_date, EquipmentIssue.actual_return_date,
+            EquipmentIssue.return_condition, EquipmentIssue.days_overdue, EquipmentIssue.penalty_amount,
+            EquipmentIssue.penalty_paid, EquipmentIssue.penalty_paid_date, EquipmentIssue.status
+        ).order_by(EquipmentIssue.updated_at.desc(), EquipmentIssue.id.desc())
+    return headers, query
+
+
+@equipment_bp.route('/penalty-report', methods=['GET'])
+@login_required
+@require_role('Office', 'H2')
+def penalty_report():
+    """View penalty report for overdue/damaged/lost equipment"""
+    if request.args.get('format'):
+        return export_report('penalty-report', _penalty_export)
+    
+    page = request.args.get('page', 1, type=int)
+    filter_type = request.args.get('filter', 'all')  # all, unpaid, paid
+    
+    def render_content():
+        issues = _penalty_query(request.args).order_by(EquipmentIssue.updated_at.desc()).paginate(page=page, per_page=20)
+        
+        total_penalty = db.session.query(db.func.sum(EquipmentIssue.penalty_amount)).filter(
+            EquipmentIssue.penalty_paid == False
+        ).scalar() or 0.0
+        
+        return render_template('equipment/_penalty_report_content.html', issues=issues, filter_type=filter_type,
+                               total_penalty=total_penalty)
     
-    total_penalty = db.session.query(db.func.sum(EquipmentIssue.penalty_amount)).filter(
-        EquipmentIssue.penalty_paid == False
-    ).scalar() or 0.0
+    content = cache.fragment('equipment.penalty_report',
+                             ['equipment_issues', 'medical_equipments', 'students', 'users'],
+                             render_content, key_parts=[filter_type, page])
     
-    return render_template('equipment/penalty_report.html', issues=issues, filter_type=filter_type, total_penalty=total_penalty)
+    return render_template('equipment/penalty_report.html', content=content)
 
 
 @equipment_bp.route('/mark-penalty-paid/<int:issue_id>', methods=['POST'])
@@ -301,6 +533,7 @@ def mark_penalty_paid(issue_id):
     try:
         issue.penalty_paid = True
         issue.penalty_paid_date = datetime.utcnow()
+        emit('equipment', 'penalty_paid', issue_id=issue.id, penalty_amount=issue.penalty_amount)
         db.session.commit()
         
         flash('Penalty marked as paid.', 'success')
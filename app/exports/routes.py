@@ -0,0 +1,40 @@
+"""
+Report export blueprint routes - background export status and downloads
+"""
+from flask import Blueprint, render_template, redirect, url_for, flash, send_from_directory, abort
+from flask_login import current_user, login_required
+from app.exports.utils import load_job, export_folder, EXPORT_FORMATS
+
+exports_bp = Blueprint('exports', __name__, template_folder='../templates/exports')
+
+
+def _get_own_job(job_id):
+    """Load a job, making sure it belongs to the current user"""
+    job = load_job(job_id)
+    if job is None or job['owner_id'] != current_user.id:
+        abort(404)
+    return job
+
+
+@exports_bp.route('/<job_id>')
+@login_required
+def export_status(job_id):
+    """Show the status of a background export"""
+    job = _get_own_job(job_id)
+    return render_template('exports/status.html', job=job)
+
+
+@exports_bp.route('/<job_id>/download')
+@login_required
+def download_export(job_id):
+    """Download a finished background export"""
+    job = _get_own_job(job_id)
+    
+    if job['status'] != 'ready':
+        flash('This export is not ready yet.', 'warning')
+        return redirect(url_for('exports.export_status', job_id=job_id))
+    
+    return send_from_directory(export_folder(), job['filename'],
+                               mimetype=EXPORT_FORMATS[job['format']],
+                               as_attachment=True,
+                               download_name=job['download_name'])
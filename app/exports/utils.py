@@ -0,0 +1,241 @@
+"""
+Report export engine - streams CSV/XLSX from server-side cursors
+
+Report routes describe an export as a builder function that takes the request
+arguments and returns ``(headers, query)`` where the query yields plain row
+tuples. Small CSV exports are streamed straight to the client; large exports
+and XLSX files are written to EXPORT_FOLDER by a background worker and picked
+up from the exports blueprint once ready. Jobs older than EXPORT_RETENTION_HOURS
+are deleted whenever a new one starts (or by ``python cli.py purge-exports``).
+"""
+import csv
+import importlib.util
+import io
+import json
+import os
+import re
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+
+from flask import Response, current_app, flash, redirect, request, stream_with_context, url_for
+from flask_login import current_user
+
+# XLSX export is optional; openpyxl is only imported when an XLSX file is written
+XLSX_AVAILABLE = importlib.util.find_spec('openpyxl') is not None
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+_executor = None
+
+
+def _get_executor(app):
+    """Lazily create the shared background export pool"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=app.config['EXPORT_WORKERS'],
+                                       thread_name_prefix='h2-export')
+    return _executor
+
+
+def format_value(value):
+    """Convert a database value into a spreadsheet-friendly cell"""
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, date):
+        return value.strftime('%Y-%m-%d')
+    return value
+
+
+def iter_rows(query, batch_size):
+    """Iterate row tuples in fixed-size batches using a server-side cursor"""
+    for row in query.yield_per(batch_size):
+        yield [format_value(value) for value in row]
+
+
+def iter_csv(headers, rows):
+    """Yield encoded CSV chunks, one per row, starting with the header"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    writer.writerow(headers)
+    yield buffer.getvalue()
+
+    for row in rows:
+        buffer.seek(0)
+        buffer.truncate(0)
+        writer.writerow(row)
+        yield buffer.getvalue()
+
+
+def write_export(path, fmt, headers, rows):
+    """Write an export file atomically (via a .part file renamed on success)"""
+    partial_path = path + '.part'
+
+    if fmt == 'xlsx':
+        from openpyxl import Workbook
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        sheet.append(headers)
+        for row in rows:
+            sheet.append(row)
+        workbook.save(partial_path)
+    else:
+        with open(partial_path, 'w', newline='', encoding='utf-8') as f:
+            for chunk in iter_csv(headers, rows):
+                f.write(chunk)
+
+    os.replace(partial_path, path)
+
+
+def export_folder(app=None):
+    """Return the export directory, creating it if needed"""
+    app = app or current_app
+    folder = app.config['EXPORT_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def job_paths(job_id, app=None):
+    """Return (meta_path, folder) for an export job"""
+    folder = export_folder(app)
+    return os.path.join(folder, f'{job_id}.json'), folder
+
+
+def load_job(job_id):
+    """Load export job metadata, or None if the job does not exist"""
+    if not job_id.replace('-', '').isalnum():
+        return None
+    meta_path, folder = job_paths(job_id)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        job = json.load(f)
+
+    data_path = os.path.join(folder, job['filename'])
+    if os.path.exists(data_path):
+        job['status'] = 'ready'
+    elif os.path.exists(os.path.join(folder, f'{job_id}.error')):
+        job['status'] = 'failed'
+    else:
+        job['status'] = 'running'
+    return job
+
+
+def purge_exports(max_age_hours, app=None):
+    """
+    Delete export jobs (metadata, file and any error or partial file) older than ``max_age_hours``
+
+    A job is as old as its metadata, written when it was queued.
+
+    Returns:
+        Number of jobs removed
+    """
+    folder = export_folder(app)
+    cutoff = time.time() - max_age_hours * 3600
+    jobs = defaultdict(list)
+    for entry in os.scandir(folder):
+        job_id = entry.name.split('.', 1)[0]
+        if entry.is_file() and re.fullmatch(r'[0-9a-f]{32}', job_id):
+            jobs[job_id].append(entry)
+
+    removed = 0
+    for entries in jobs.values():
+        if min(entry.stat().st_mtime for entry in entries) >= cutoff:
+            continue
+        for entry in entries:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:  # Removed by another worker meanwhile
+                pass
+        removed += 1
+    return removed
+
+
+def _run_export_job(app, builder, args, fmt, path, error_path, hostel_id=None):
+    """Background worker body - rebuilds the query in its own app context, in the requester's hostel"""
+    from app.tenancy import hostel_scope
+    with app.app_context(), hostel_scope(hostel_id):
+        try:
+            headers, query = builder(args)
+            write_export(path, fmt, headers, iter_rows(query, app.config['EXPORT_BATCH_SIZE']))
+        except Exception as e:
+            with open(error_path, 'w') as f:
+                f.write(str(e))
+            if os.path.exists(path + '.part'):
+                os.remove(path + '.part')
+        finally:
+            from app.extensions import db
+            db.session.remove()
+
+
+def start_export_job(name, builder, args, fmt):
+    """Queue a background export and return its job id"""
+    from app.tenancy import current_hostel_id
+    app = current_app._get_current_object()
+    job_id = uuid.uuid4().hex
+    filename = f'{name}-{datetime.now().strftime("%Y%m%d-%H%M%S")}.{fmt}'
+    purge_exports(app.config['EXPORT_RETENTION_HOURS'], app)
+    meta_path, folder = job_paths(job_id, app)
+
+    with open(meta_path, 'w') as f:
+        json.dump({
+            'id': job_id,
+            'name': name,
+            'format': fmt,
+            'filename': f'{job_id}.{fmt}',
+            'download_name': filename,
+            'owner_id': current_user.id,
+            'created_at': datetime.utcnow().isoformat(),
+        }, f)
+
+    _get_executor(app).submit(_run_export_job, app, builder, args, fmt,
+                              os.path.join(folder, f'{job_id}.{fmt}'),
+                              os.path.join(folder, f'{job_id}.error'), current_hostel_id())
+    return job_id
+
+
+def export_report(name, builder, args=None):
+    """
+    Export a report in the format requested by ``?format=``
+
+    Args:
+        name: Report name used for the download filename
+        builder: Callable taking the request args and returning (headers, query)
+        args: Request arguments (defaults to request.args)
+
+    Returns:
+        A streamed CSV response, or a redirect to the background job status page
+    """
+    args = (args if args is not None else request.args).copy()
+    fmt = args.pop('format', 'csv').lower()
+
+    if fmt not in EXPORT_FORMATS:
+        flash(f'Unsupported export format: {fmt}', 'danger')
+        return redirect(request.path)
+
+    if fmt == 'xlsx' and not XLSX_AVAILABLE:
+        flash('XLSX export requires the openpyxl package. Please use CSV instead.', 'warning')
+        return redirect(request.path)
+
+    headers, query = builder(args)
+
+    # XLSX needs a real file, and big CSVs shouldn't tie up a request worker
+    if fmt == 'xlsx' or query.order_by(None).count() > current_app.config['EXPORT_BACKGROUND_THRESHOLD']:
+        job_id = start_export_job(name, builder, args, fmt)
+        flash('Your export is being prepared. This page will update when it is ready.', 'info')
+        return redirect(url_for('exports.export_status', job_id=job_id))
+
+    rows = iter_rows(query, current_app.config['EXPORT_BATCH_SIZE'])
+    filename = f'{name}-{datetime.now().strftime("%Y%m%d-%H%M%S")}.csv'
+
+    return Response(stream_with_context(iter_csv(headers, rows)),
+                    mimetype=EXPORT_FORMATS['csv'],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
@@ -3,10 +3,12 @@ Flask extensions initialization
 """
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
+from .cache import FragmentCache
 
 # Initialize extensions
 db = SQLAlchemy()
 login_manager = LoginManager()
+cache = FragmentCache()
 
 # Configure login manager
 login_manager.login_view = 'auth.login'
@@ -0,0 +1,52 @@
+"""
+Facet values for list filters
+
+Each facet set maps a model to the columns offered as filter dropdowns. All
+columns of a set are counted in a single UNION ALL of GROUP BY queries and the
+result is kept in the versioned cache, so it is recomputed only after a commit
+writes to the model's table.
+"""
+from sqlalchemy import func, literal, union_all
+from .extensions import db, cache
+from .models import Asset, Medicine, MedicalEquipment
+
+FACET_SETS = {
+    'assets': (Asset, ('category', 'location', 'condition')),
+    'medicines': (Medicine, ('supplier', 'unit')),
+    'equipment': (MedicalEquipment, ('category', 'location')),
+}
+
+
+def _compute_facets(model, columns):
+    """Count every distinct value of each column in one grouped query"""
+    selects = []
+    for name in columns:
+        column = getattr(model, name)
+        selects.append(
+            db.select(literal(name).label('facet'), column.label('value'), func.count().label('count'))
+            .where(column.isnot(None), column != '')
+            .group_by(column)
+        )
+    
+    facets = {name: [] for name in columns}
+    for facet, value, count in db.session.execute(union_all(*selects)):
+        facets[facet].append((value, count))
+    
+    for values in facets.values():
+        values.sort(key=lambda item: str(item[0]).lower())
+    return facets
+
+
+def get_facets(name):
+    """
+    Return facet values with counts for a facet set
+    
+    Args:
+        name: Facet set name ('assets', 'medicines' or 'equipment')
+    
+    Returns:
+        Dict of column name -> list of (value, count) sorted by value
+    """
+    model, columns = FACET_SETS[name]
+    return cache.cached(f'facets:{name}', [model.__tablename__],
+                        lambda: _compute_facets(model, columns))
@@ -7,6 +7,9 @@ from datetime import datetime
 from ..extensions import db
 from app.models import Student, DoctorVisit, Prescription, PrescriptionItem, Medicine, DummyMedicine, StockMovement, User, MedicineBatch, BatchDispensing
 from app.auth.utils import role_required
+from app.exports.utils import export_report
+from app.responses import not_modified
+from app.outbox import emit
 
 health_bp = Blueprint('health', __name__, template_folder='../templates/health')
 
@@ -217,13 +220,10 @@ def prescribe_during_visit(visit_id):
     return render_template('health/prescribe_during_visit.html', visit=visit, medicines=medicines)
 
 
-@health_bp.route('/prescriptions')
-@role_required('H2', 'Warden', 'Director', 'Doctor')
-def prescriptions_list():
-    """List all prescriptions"""
-    page = request.args.get('page', 1, type=int)
-    student_id = request.args.get('student_id', type=int)
-    status = request.args.get('status', '')
+def _prescriptions_query(args):
+    """Prescriptions matching the list filters"""
+    student_id = args.get('student_id', type=int)
+    status = args.get('status', '')
     
     query = Prescription.query
     
@@ -231,7 +231,42 @@ def prescriptions_list():
         query = query.filter_by(student_id=student_id)
     
     if status:
-        query = query.filter_by(overall_status=status)
+        query = query.filter(Prescription.status_filter(status))
+    
+    return query
+
+
+def _prescriptions_export(args):
+    """Export builder: one row per prescription item"""
+    headers = ['Prescription ID', 'Created', 'Roll Number', 'First Name', 'Last Name', 'Overall Status',
+               'Medicine', 'Dosage', 'Frequency', 'Duration (days)', 'Prescribed', 'Dispensed', 'Item Status']
+    query = _prescriptions_query(args).join(Prescription.student).join(Student.user) \
+        .join(Prescription.items) \
+        .outerjoin(Medicine, PrescriptionItem.medicine_id == Medicine.id) \
+        .outerjoin(DummyMedicine, PrescriptionItem.dummy_medicine_id == DummyMedicine.id) \
+        .with_entities(
+            Prescription.id, Prescription.created_at, Student.roll_number, User.first_name, User.last_name,
+            Prescription.overall_status_expression(),
+            db.func.coalesce(Medicine.name, DummyMedicine.name),
+            PrescriptionItem.dosage, PrescriptionItem.frequency, PrescriptionItem.duration_days,
+            PrescriptionItem.quantity_prescribed, PrescriptionItem.quantity_dispensed, PrescriptionItem.status
+        ).order_by(Prescription.created_at.desc(), Prescription.id.desc(), PrescriptionItem.id)
+    return headers, query
+
+
+@health_bp.route('/prescriptions')
+@role_required('H2', 'Warden', 'Director', 'Doctor')
+def prescriptions_list():
+    """List all prescriptions"""
+    if request.args.get('format'):
+        return export_report('prescriptions', _prescriptions_export)
+    
+    cached = not_modified(Prescription, PrescriptionItem, Medicine, DummyMedicine, Student)
+    if cached:
+        return cached
+    
+    page = request.args.get('page', 1, type=int)
+    query = _prescriptions_query(request.args)
     
     prescriptions = query.order_by(Prescription.created_at.desc()).paginate(page=page, per_page=20)
     
@@ -394,6 +429,7 @@ def create_prescription():
             flash('No valid medicines were added to the prescription.', 'danger')
             return redirect(url_for('health.create_prescription'))
         
+        emit('dispensing', 'prescribed', prescription_id=prescription.id, student_id=prescription.student_id)
         db.session.commit()
         flash(f'Prescription created with {item_count} medicine(s). Ready for dispensing.', 'success')
         
@@ -551,6 +587,8 @@ def dispense_prescription(prescription_id):
         reference_id=item.id
     )
     db.session.add(stock_movement)
+    emit('dispensing', 'dispensed', prescription_id=prescription.id, item_id=item.id, medicine_id=medicine.id,
+         quantity=quantity_to_dispense, batches=batches_used)
     db.session.commit()
     
     # Build success message with shelf and batch details
@@ -714,6 +752,18 @@ def add_medicine_batch(medicine_id):
         medicine.updated_at = datetime.utcnow()
         
         db.session.add(batch)
+        db.session.flush()
+        
+        # Record stock movement so the ledger matches the batches
+        db.session.add(StockMovement(
+            medicine_id=medicine_id,
+            user_id=current_user.id,
+            movement_type='ADD',
+            quantity=quantity,
+            reason=f'Batch addition - Batch: {batch_number} (Shelf: {shelf_location})',
+            reference_id=batch.id
+        ))
+        emit('stock', 'added', medicine_id=medicine_id, batch_id=batch.id, quantity=quantity)
         db.session.commit()
         
         flash(f'Batch {batch_number} added successfully. {quantity} units added to {medicine.name}.', 'success')
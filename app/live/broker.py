@@ -0,0 +1,221 @@
+"""
+Change notifications for live dashboards
+
+Routes record changes as outbox events (see ``app.outbox``); the
+``publish_event`` consumer below turns each committed sick leave, dispensing or
+equipment event into a notification. The current counts for the topic are
+computed once, grouped by hostel, and pushed over server-sent events (see
+``app.live.routes``); each subscriber receives only the counts of the hostel it
+works in, and only events from that hostel, so open dashboards update without
+re-running their queries on refresh.
+
+Brokers (LIVE_BROKER):
+    local   In-process; for the development server or a single worker
+    sqlite  SQLite file shared by every worker process on the host
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import date, datetime
+
+from flask import current_app
+from sqlalchemy import case, func, select
+
+from app.extensions import db
+from app.models import SickLeaveRequest, Prescription, StockMovement, EquipmentIssue
+from app.outbox import consumer
+from app.tenancy import all_hostels
+
+# Roles allowed to subscribe to each topic
+TOPIC_ROLES = {
+    'sickleave': ('H2', 'Warden', 'Office', 'Director'),
+    'dispensing': ('H2', 'Doctor', 'Director'),
+    'equipment': ('H2', 'Doctor', 'Director', 'Warden'),
+}
+
+
+class LocalBroker:
+    """In-process broker keeping the most recent events in memory"""
+
+    def __init__(self, history=500):
+        self._events = deque(maxlen=history)
+        self._last_id = 0
+        self._condition = threading.Condition()
+
+    def publish(self, topic, data):
+        with self._condition:
+            self._last_id += 1
+            self._events.append((self._last_id, topic, data))
+            self._condition.notify_all()
+
+    def latest_id(self):
+        with self._condition:
+            return self._last_id
+
+    def wait(self, after_id, timeout):
+        """Block until events newer than after_id exist (or timeout); return them"""
+        with self._condition:
+            self._condition.wait_for(lambda: self._last_id > after_id, timeout=timeout)
+            return [event for event in self._events if event[0] > after_id]
+
+
+class SQLiteBroker:
+    """Broker backed by a small SQLite file, polled by subscribers"""
+
+    def __init__(self, path, history=500, poll_interval=1.0):
+        self.path = path
+        self.history = history
+        self.poll_interval = poll_interval
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS live_events ('
+                               'id INTEGER PRIMARY KEY AUTOINCREMENT, topic TEXT NOT NULL, data TEXT NOT NULL)')
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def publish(self, topic, data):
+        with self._connect() as connection:
+            cursor = connection.execute('INSERT INTO live_events (topic, data) VALUES (?, ?)',
+                                        (topic, json.dumps(data)))
+            connection.execute('DELETE FROM live_events WHERE id <= ?', (cursor.lastrowid - self.history,))
+
+    def latest_id(self):
+        with self._connect() as connection:
+            return connection.execute('SELECT COALESCE(MAX(id), 0) FROM live_events').fetchone()[0]
+
+    def wait(self, after_id, timeout):
+        """Poll until events newer than after_id exist (or timeout); return them"""
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._connect() as connection:
+                rows = connection.execute('SELECT id, topic, data FROM live_events WHERE id > ? ORDER BY id',
+                                          (after_id,)).fetchall()
+            if rows or time.monotonic() >= deadline:
+                return [(event_id, topic, json.loads(data)) for event_id, topic, data in rows]
+            time.sleep(min(self.poll_interval, max(deadline - time.monotonic(), 0)))
+
+
+def init_live(app):
+    """Create the broker selected by LIVE_BROKER"""
+    if app.config['LIVE_BROKER'] == 'sqlite':
+        broker = SQLiteBroker(app.config['LIVE_BROKER_PATH'], poll_interval=app.config['LIVE_POLL_INTERVAL'])
+    else:
+        broker = LocalBroker()
+    app.extensions['live_broker'] = broker
+
+
+def get_broker():
+    return current_app.extensions['live_broker']
+
+
+def _count(condition):
+    return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+
+def _by_hostel(queries):
+    """Run queries selecting hostel_id then named counters into {hostel key: counters}, plus 'all'"""
+    names, hostels = [], {}
+    for query in queries:
+        result = db.session.execute(query)
+        columns = list(result.keys())[1:]
+        names += columns
+        for hostel_id, *values in result:
+            hostels.setdefault(hostel_key(hostel_id), {}).update(zip(columns, values))
+    counts = {key: {name: values.get(name, 0) for name in names} for key, values in hostels.items()}
+    counts['all'] = {name: sum(values[name] for values in counts.values()) for name in names}
+    return counts
+
+
+def hostel_key(hostel_id):
+    """Key of a hostel's counters in ``live_counts`` (JSON object keys are strings)"""
+    return '' if hostel_id is None else str(hostel_id)
+
+
+@all_hostels()
+def live_counts(topic):
+    """
+    Current counters for a topic, grouped by hostel in one query per table
+
+    Returns:
+        Dict of ``hostel_key(hostel_id)`` -> counters, and 'all' -> the
+        organisation-wide totals (empty for an unknown topic)
+    """
+    if topic == 'sickleave':
+        queries = [select(
+            SickLeaveRequest.hostel_id,
+            _count(SickLeaveRequest.h2_status == 'Pending').label('pending_h2'),
+            _count((SickLeaveRequest.warden_status == 'Pending') & (SickLeaveRequest.h2_status == 'Approved'))
+            .label('pending_warden'),
+            _count((SickLeaveRequest.office_status == 'Pending') & (SickLeaveRequest.warden_status == 'Approved'))
+            .label('pending_office'),
+            _count(SickLeaveRequest.director_status == 'Pending').label('pending_director'),
+            _count(SickLeaveRequest.overall_status == 'Approved').label('approved'),
+        ).group_by(SickLeaveRequest.hostel_id)]
+    elif topic == 'dispensing':
+        today = datetime.combine(date.today(), datetime.min.time())
+        queries = [
+            select(Prescription.hostel_id, func.count(Prescription.id).label('undispensed'))
+            .where(Prescription.undispensed_filter()).group_by(Prescription.hostel_id),
+            select(StockMovement.hostel_id, func.coalesce(func.sum(StockMovement.quantity), 0).label('dispensed_today'))
+            .where(StockMovement.movement_type == 'DISPENSE', StockMovement.created_at >= today)
+            .group_by(StockMovement.hostel_id),
+        ]
+    elif topic == 'equipment':
+        queries = [select(
+            EquipmentIssue.hostel_id,
+            _count(EquipmentIssue.status.in_(['Issued', 'Overdue'])).label('issued'),
+            _count(EquipmentIssue.status == 'Overdue').label('overdue'),
+        ).group_by(EquipmentIssue.hostel_id)]
+    else:
+        return {}
+    return _by_hostel(queries)
+
+
+def for_subscriber(data, hostel_id):
+    """
+    An event as a subscriber working in ``hostel_id`` (None: every hostel) sees it
+
+    Subscribers get their own hostel's counters only. Events made in another
+    hostel are dropped (None); events made across every hostel reach each
+    hostel without their details.
+    """
+    counts = data.get('counts') or {}
+    if hostel_id is None:
+        return {**data, 'counts': counts.get('all', {})}
+    event_hostel = data.get('hostel_id')
+    if event_hostel is not None and event_hostel != hostel_id:
+        return None
+    own = counts.get(hostel_key(hostel_id)) or dict.fromkeys(counts.get('all', {}), 0)
+    if event_hostel is None:
+        return {'action': data.get('action'), 'counts': own}
+    return {**data, 'counts': own}
+
+
+def publish_change(topic, action, **data):
+    """
+    Notify live subscribers about a committed change
+
+    Call after ``db.session.commit()``. Publishing never fails the caller; a
+    broker error only means open dashboards miss this update.
+
+    Args:
+        topic: 'sickleave', 'dispensing' or 'equipment'
+        action: Short description of what happened (e.g. 'h2_approved')
+        **data: Small JSON-serializable details (ids, statuses)
+    """
+    payload = {'action': action, 'counts': live_counts(topic), **data}
+    try:
+        get_broker().publish(topic, payload)
+    except (OSError, sqlite3.Error) as e:
+        current_app.logger.warning('Live update for %s not published: %s', topic, e)
+
+
+@consumer(*TOPIC_ROLES)
+def publish_event(outbox_event):
+    """Outbox consumer forwarding committed changes to live subscribers"""
+    publish_change(outbox_event.topic, outbox_event.event_type, event_id=outbox_event.id, **outbox_event.data)
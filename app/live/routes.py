@@ -0,0 +1,62 @@
+"""
+Server-sent event stream for live dashboards
+"""
+import json
+import time
+
+from flask import Blueprint, Response, current_app, request
+from flask_login import current_user, login_required
+
+from app.tenancy import current_hostel_id
+from .broker import TOPIC_ROLES, for_subscriber, get_broker
+
+live_bp = Blueprint('live', __name__)
+
+
+def _format_event(event_id, topic, data):
+    return f'id: {event_id}\nevent: {topic}\ndata: {json.dumps(data)}\n\n'
+
+
+@live_bp.route('/stream')
+@login_required
+def stream():
+    """Push change notifications for the topics the user's role can see"""
+    topics = {topic for topic, roles in TOPIC_ROLES.items() if current_user.has_role(*roles)}
+    broker = get_broker()
+    hostel_id = current_hostel_id()
+    heartbeat = current_app.config['LIVE_HEARTBEAT']
+    max_duration = current_app.config['LIVE_STREAM_DURATION']
+    reconnect_ms = int(current_app.config['LIVE_RECONNECT'] * 1000)
+
+    # Resume after a reconnect; ids from another worker or a restarted broker start afresh
+    latest = broker.latest_id()
+    last_id = request.headers.get('Last-Event-ID', type=int)
+    if last_id is None or last_id > latest:
+        last_id = latest
+
+    def generate():
+        # Streams are short so they don't hold a server thread: tell the browser how long to wait before
+        # reconnecting, and where it is in the event history so the reconnect replays what it missed
+        yield f'retry: {reconnect_ms}\nid: {last_id}\n\n'
+
+        cursor = last_id
+        ends_at = time.monotonic() + max_duration
+        while time.monotonic() < ends_at:
+            events = broker.wait(cursor, timeout=min(heartbeat, ends_at - time.monotonic()))
+            if not events:
+                yield ': keep-alive\n\n'
+                continue
+            for event_id, topic, data in events:
+                cursor = event_id
+                if topic not in topics:
+                    continue
+                data = for_subscriber(data, hostel_id)
+                if data is not None:
+                    yield _format_event(event_id, topic, data)
+        yield f'id: {cursor}\n\n'
+
+    if not topics:
+        return Response(status=204)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
@@ -1,8 +1,11 @@
 """
 Main blueprint routes for landing page and public pages
 """
-from flask import Blueprint, render_template
-from flask_login import login_required
+from flask import Blueprint, redirect, render_template, request, session, url_for
+from flask_login import current_user, login_required
+
+from app.extensions import db
+from app.models import Hostel
 
 main_bp = Blueprint('main', __name__, template_folder='../templates')
 
@@ -17,3 +20,16 @@ def index():
 def about():
     """About page (same as index for now)"""
     return render_template('index.html')
+
+
+@main_bp.route('/hostel', methods=['POST'])
+@login_required
+def select_hostel():
+    """Switch the hostel an organisation-wide user works in (empty: all hostels)"""
+    hostel_id = request.form.get('hostel_id', type=int)
+    if current_user.hostel_id is None:
+        if hostel_id is not None and db.session.get(Hostel, hostel_id) is not None:
+            session['hostel_id'] = hostel_id
+        else:
+            session.pop('hostel_id', None)
+    return redirect(url_for('dashboards.dashboard'))
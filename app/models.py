@@ -1,12 +1,43 @@
 """
 Database models for H2 System
 """
+import json
 from datetime import datetime
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy.orm import declared_attr
+from werkzeug.security import check_password_hash
 from .extensions import db, login_manager
 
 
+class Hostel(db.Model):
+    """A hostel served by this deployment; hostel-scoped tables carry its id"""
+    __tablename__ = 'hostels'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), unique=True, nullable=False)
+    code = db.Column(db.String(20), unique=True, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<Hostel {self.code}>'
+
+
+class HostelScoped:
+    """
+    Mixin for tables partitioned by hostel
+    
+    Queries on these models are filtered to the current hostel and new rows are
+    stamped with it (see app.tenancy). ``__hostel_parent__`` names the foreign
+    key and table a new row takes its hostel from when no hostel is selected
+    (CLI commands, background jobs).
+    """
+    __hostel_parent__ = None
+    
+    @declared_attr
+    def hostel_id(cls):
+        return db.Column(db.Integer, db.ForeignKey('hostels.id'))
+
+
 class User(UserMixin, db.Model):
     """User model with role-based access control"""
     __tablename__ = 'users'
@@ -18,6 +49,7 @@ class User(UserMixin, db.Model):
     first_name = db.Column(db.String(120))
     last_name = db.Column(db.String(120))
     role = db.Column(db.String(50), nullable=False)  # H2, Warden, Office, Director, Doctor
+    hostel_id = db.Column(db.Integer, db.ForeignKey('hostels.id'))  # None: may work across all hostels
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -31,7 +63,8 @@ class User(UserMixin, db.Model):
     
     def set_password(self, password):
         """Hash and set password"""
-        self.password_hash = generate_password_hash(password)
+        from app.auth.passwords import hash_password
+        self.password_hash = hash_password(password)
     
     def check_password(self, password):
         """Verify password"""
@@ -45,9 +78,12 @@ class User(UserMixin, db.Model):
         return f'<User {self.username}>'
 
 
-class Student(db.Model):
+class Student(HostelScoped, db.Model):
     """Student profile model"""
     __tablename__ = 'students'
+    __table_args__ = (
+        db.Index('ix_students_hostel_id_room', 'hostel_id', 'hostel_room'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, unique=True)
@@ -55,7 +91,7 @@ class Student(db.Model):
     date_of_birth = db.Column(db.Date)
     gender = db.Column(db.String(10))
     blood_group = db.Column(db.String(10))
-    hostel_room = db.Column(db.String(20))
+    hostel_room = db.Column(db.String(20), index=True)
     phone_number = db.Column(db.String(20))
     
     # Emergency contact
@@ -71,21 +107,25 @@ class Student(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
-    # Relationships
-    doctor_visits = db.relationship('DoctorVisit', backref='student', cascade='all, delete-orphan')
-    prescriptions = db.relationship('Prescription', backref='student', cascade='all, delete-orphan')
-    sickleave_requests = db.relationship('SickLeaveRequest', backref='student', cascade='all, delete-orphan')
+    # Relationships (dynamic so callers query them with ORDER BY/LIMIT/COUNT instead of loading whole lists)
+    doctor_visits = db.relationship('DoctorVisit', backref='student', cascade='all, delete-orphan', lazy='dynamic')
+    prescriptions = db.relationship('Prescription', backref='student', cascade='all, delete-orphan', lazy='dynamic')
+    sickleave_requests = db.relationship('SickLeaveRequest', backref='student', cascade='all, delete-orphan', lazy='dynamic')
     
     def __repr__(self):
         return f'<Student {self.roll_number}>'
 
 
-class DoctorVisit(db.Model):
+class DoctorVisit(HostelScoped, db.Model):
     """Doctor visit records"""
     __tablename__ = 'doctor_visits'
+    __hostel_parent__ = ('student_id', 'students')
+    __table_args__ = (
+        db.Index('ix_doctor_visits_hostel_date', 'hostel_id', 'visit_date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
-    student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False)
+    student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False, index=True)
     doctor_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     visit_date = db.Column(db.DateTime, default=datetime.utcnow)
     symptoms = db.Column(db.Text)
@@ -101,12 +141,16 @@ class DoctorVisit(db.Model):
         return f'<DoctorVisit {self.id} - {self.visit_date}>'
 
 
-class Prescription(db.Model):
+class Prescription(HostelScoped, db.Model):
     """Medicine prescription model - contains multiple medicines"""
     __tablename__ = 'prescriptions'
+    __hostel_parent__ = ('student_id', 'students')
+    __table_args__ = (
+        db.Index('ix_prescriptions_hostel_created', 'hostel_id', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
-    student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False)
+    student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False, index=True)
     visit_id = db.Column(db.Integer, db.ForeignKey('doctor_visits.id'))
     created_by_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     notes = db.Column(db.Text)  # General prescription notes
@@ -135,6 +179,44 @@ class Prescription(db.Model):
         else:
             return 'PENDING'
     
+    @classmethod
+    def _all_items_with_status(cls, status):
+        """SQL criterion: prescription has items and every item has the given status"""
+        other_status = db.or_(PrescriptionItem.status != status, PrescriptionItem.status.is_(None))
+        return db.and_(cls.items.any(), ~cls.items.any(other_status))
+    
+    @classmethod
+    def status_filter(cls, status):
+        """SQL criterion equivalent to ``overall_status == status``"""
+        if status == 'EMPTY':
+            return ~cls.items.any()
+        if status in ('DISPENSED', 'OUT_OF_STOCK'):
+            return cls._all_items_with_status(status)
+        if status == 'PENDING':
+            return cls.items.any(PrescriptionItem.status == 'PENDING')
+        if status == 'PARTIAL':
+            return db.and_(cls.items.any(),
+                           ~cls.items.any(PrescriptionItem.status == 'PENDING'),
+                           ~cls._all_items_with_status('DISPENSED'),
+                           ~cls._all_items_with_status('OUT_OF_STOCK'))
+        return db.false()
+    
+    @classmethod
+    def undispensed_filter(cls):
+        """SQL criterion matching prescriptions whose overall_status is not DISPENSED"""
+        return ~cls.status_filter('DISPENSED')
+    
+    @classmethod
+    def overall_status_expression(cls):
+        """SQL CASE expression computing overall_status in the database"""
+        return db.case(
+            (~cls.items.any(), 'EMPTY'),
+            (cls._all_items_with_status('DISPENSED'), 'DISPENSED'),
+            (cls._all_items_with_status('OUT_OF_STOCK'), 'OUT_OF_STOCK'),
+            (cls.items.any(PrescriptionItem.status == 'PENDING'), 'PENDING'),
+            else_='PARTIAL'
+        )
+    
     def __repr__(self):
         return f'<Prescription {self.id} - Student {self.student_id} ({self.overall_status})>'
 
@@ -196,12 +278,15 @@ class DummyMedicine(db.Model):
         return f'<DummyMedicine {self.name} (Replaced: {self.is_replaced})>'
 
 
-class Medicine(db.Model):
+class Medicine(HostelScoped, db.Model):
     """Medicine inventory model"""
     __tablename__ = 'medicines'
+    __table_args__ = (
+        db.UniqueConstraint('hostel_id', 'name', name='uq_medicines_hostel_name'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(255), unique=True, nullable=False, index=True)
+    name = db.Column(db.String(255), nullable=False, index=True)
     generic_name = db.Column(db.String(255))
     dosage = db.Column(db.String(100))
     quantity = db.Column(db.Integer, default=0)
@@ -241,9 +326,13 @@ class Medicine(db.Model):
         return f'<Medicine {self.name}>'
 
 
-class MedicineBatch(db.Model):
+class MedicineBatch(HostelScoped, db.Model):
     """Track individual batches of medicine with shelf location and expiry"""
     __tablename__ = 'medicine_batches'
+    __hostel_parent__ = ('medicine_id', 'medicines')
+    __table_args__ = (
+        db.Index('ix_medicine_batches_hostel_expiry', 'hostel_id', 'expiry_date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     medicine_id = db.Column(db.Integer, db.ForeignKey('medicines.id'), nullable=False, index=True)
@@ -275,9 +364,10 @@ class MedicineBatch(db.Model):
         return f'<MedicineBatch {self.batch_number} - {self.available_quantity}/{self.quantity}>'
 
 
-class BatchDispensing(db.Model):
+class BatchDispensing(HostelScoped, db.Model):
     """Record of batch used during medicine dispensing for traceability"""
     __tablename__ = 'batch_dispensings'
+    __hostel_parent__ = ('batch_id', 'medicine_batches')
     
     id = db.Column(db.Integer, primary_key=True)
     prescription_item_id = db.Column(db.Integer, db.ForeignKey('prescription_items.id'), nullable=False, index=True)
@@ -295,9 +385,15 @@ class BatchDispensing(db.Model):
         return f'<BatchDispensing Batch#{self.batch_id} - {self.quantity_dispensed} units>'
 
 
-class StockMovement(db.Model):
+class StockMovement(HostelScoped, db.Model):
     """Track medicine stock movements (addition/removal)"""
     __tablename__ = 'stock_movements'
+    __hostel_parent__ = ('medicine_id', 'medicines')
+    __table_args__ = (
+        # Covers the per-medicine ledger balance used by stock reconciliation
+        db.Index('ix_stock_movements_medicine_type_quantity', 'medicine_id', 'movement_type', 'quantity'),
+        db.Index('ix_stock_movements_hostel_created', 'hostel_id', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     medicine_id = db.Column(db.Integer, db.ForeignKey('medicines.id'), nullable=False)
@@ -312,12 +408,12 @@ class StockMovement(db.Model):
         return f'<StockMovement {self.movement_type} - {self.medicine_id}>'
 
 
-class Asset(db.Model):
+class Asset(HostelScoped, db.Model):
     """Hostel asset tracking"""
     __tablename__ = 'assets'
     
     id = db.Column(db.Integer, primary_key=True)
-    asset_code = db.Column(db.String(50), unique=True, nullable=False, index=True)
+    asset_code = db.Column(db.String(50), nullable=False, index=True)
     name = db.Column(db.String(255), nullable=False)
     category = db.Column(db.String(100))  # Table, Chair, Heater, Bed, etc.
     description = db.Column(db.Text)
@@ -333,13 +429,24 @@ class Asset(db.Model):
     # Relationships
     maintenance_logs = db.relationship('MaintenanceLog', backref='asset', cascade='all, delete-orphan')
     
+    __table_args__ = (
+        # Condition report: GROUP BY condition/category/location and per-condition lists
+        db.Index('ix_assets_condition_category_location', 'condition', 'category', 'location'),
+        db.Index('ix_assets_hostel_condition_category', 'hostel_id', 'condition', 'category'),
+        db.UniqueConstraint('hostel_id', 'asset_code', name='uq_assets_hostel_code'),
+    )
+    
     def __repr__(self):
         return f'<Asset {self.asset_code} - {self.name}>'
 
 
-class MaintenanceLog(db.Model):
+class MaintenanceLog(HostelScoped, db.Model):
     """Asset maintenance history"""
     __tablename__ = 'maintenance_logs'
+    __hostel_parent__ = ('asset_id', 'assets')
+    __table_args__ = (
+        db.Index('ix_maintenance_logs_hostel_date', 'hostel_id', 'maintenance_date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     asset_id = db.Column(db.Integer, db.ForeignKey('assets.id'), nullable=False)
@@ -354,12 +461,12 @@ class MaintenanceLog(db.Model):
         return f'<MaintenanceLog {self.asset_id} - {self.maintenance_date}>'
 
 
-class SickLeaveRequest(db.Model):
+class SickLeaveRequest(HostelScoped, db.Model):
     """Sick leave and sick food request workflow"""
     __tablename__ = 'sickleave_requests'
     
     id = db.Column(db.Integer, primary_key=True)
-    student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False)
+    student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False, index=True)
     created_by_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     
     # Request details
@@ -373,29 +480,31 @@ class SickLeaveRequest(db.Model):
     h2_status = db.Column(db.String(50), default='Pending')  # Pending, Approved, Rejected
     h2_notes = db.Column(db.Text)
     h2_approved_by = db.Column(db.Integer, db.ForeignKey('users.id'))
-    h2_approved_date = db.Column(db.DateTime)
+    h2_approved_date = db.Column(db.DateTime, index=True)
     
     warden_status = db.Column(db.String(50), default='Pending')  # Pending, Approved, Rejected
     warden_notes = db.Column(db.Text)
     warden_verified_by = db.Column(db.Integer, db.ForeignKey('users.id'))
-    warden_verified_date = db.Column(db.DateTime)
+    warden_verified_date = db.Column(db.DateTime, index=True)
     
     office_status = db.Column(db.String(50), default='Pending')  # Pending, Approved, Rejected
     office_notes = db.Column(db.Text)
     office_approved_by = db.Column(db.Integer, db.ForeignKey('users.id'))
-    office_approved_date = db.Column(db.DateTime)
+    office_approved_date = db.Column(db.DateTime, index=True)
     
     director_status = db.Column(db.String(50), default='Pending')  # Pending, Approved, Rejected, N/A
     director_notes = db.Column(db.Text)
     director_approved_by = db.Column(db.Integer, db.ForeignKey('users.id'))
-    director_approved_date = db.Column(db.DateTime)
+    director_approved_date = db.Column(db.DateTime, index=True)
     
-    overall_status = db.Column(db.String(50), default='Pending')  # Pending, Approved, Rejected
+    overall_status = db.Column(db.String(50), default='Pending', index=True)  # Pending, Approved, Rejected
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Foreign keys for approvers
+    __hostel_parent__ = ('student_id', 'students')
     __table_args__ = (
+        db.Index('ix_sickleave_requests_hostel_status', 'hostel_id', 'overall_status', 'created_at'),
         db.ForeignKeyConstraint(['h2_approved_by'], ['users.id']),
         db.ForeignKeyConstraint(['warden_verified_by'], ['users.id']),
         db.ForeignKeyConstraint(['office_approved_by'], ['users.id']),
@@ -418,13 +527,16 @@ class SickLeaveRequest(db.Model):
         return f'<SickLeaveRequest {self.id} - {self.request_type}>'
 
 
-class MedicalEquipment(db.Model):
+class MedicalEquipment(HostelScoped, db.Model):
     """Medical equipment inventory (non-consumable items)"""
     __tablename__ = 'medical_equipments'
+    __table_args__ = (
+        db.UniqueConstraint('hostel_id', 'equipment_code', name='uq_medical_equipments_hostel_code'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(255), nullable=False)  # Crepe Band, Hot Pack, Ice Pack, etc.
-    equipment_code = db.Column(db.String(50), unique=True, nullable=False, index=True)
+    equipment_code = db.Column(db.String(50), nullable=False, index=True)
     category = db.Column(db.String(100))  # Support, Thermal, Device, etc.
     description = db.Column(db.Text)
     quantity_available = db.Column(db.Integer, default=0)
@@ -449,13 +561,17 @@ class MedicalEquipment(db.Model):
         return f'<MedicalEquipment {self.equipment_code} - {self.name}>'
 
 
-class EquipmentIssue(db.Model):
+class EquipmentIssue(HostelScoped, db.Model):
     """Equipment issue/rental record"""
     __tablename__ = 'equipment_issues'
+    __hostel_parent__ = ('equipment_id', 'medical_equipments')
+    __table_args__ = (
+        db.Index('ix_equipment_issues_hostel_status', 'hostel_id', 'status'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
-    equipment_id = db.Column(db.Integer, db.ForeignKey('medical_equipments.id'), nullable=False)
-    student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False)
+    equipment_id = db.Column(db.Integer, db.ForeignKey('medical_equipments.id'), nullable=False, index=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False, index=True)
     issued_by_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)  # H2 or Doctor
     verified_by_id = db.Column(db.Integer, db.ForeignKey('users.id'))  # H2 who verified return
     
@@ -476,64 +592,133 @@ class EquipmentIssue(db.Model):
     penalty_paid = db.Column(db.Boolean, default=False)
     penalty_paid_date = db.Column(db.DateTime)
     
-    status = db.Column(db.String(50), default='Issued')  # Issued, Overdue, Returned, Defaulted
+    status = db.Column(db.String(50), default='Issued', index=True)  # Issued, Overdue, Returned, Defaulted
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
-    student = db.relationship('Student', backref='equipment_issues')
+    student = db.relationship('Student', backref=db.backref('equipment_issues', lazy='dynamic'))
     issued_by = db.relationship('User', foreign_keys=[issued_by_id], backref='equipment_issues_issued')
     verified_by = db.relationship('User', foreign_keys=[verified_by_id], backref='equipment_issues_verified')
     
-    def mark_as_overdue(self):
-        """Mark issue as overdue and calculate penalty"""
-        from datetime import datetime, timedelta
-        
-        if not self.actual_return_date and self.expected_return_date < datetime.utcnow():
-            self.is_overdue = True
-            self.status = 'Overdue'
-            
-            days_over = (datetime.utcnow() - self.expected_return_date).days
-            self.days_overdue = max(1, days_over)  # At least 1 day
-            
-            equipment = MedicalEquipment.query.get(self.equipment_id)
-            self.penalty_amount = self.days_overdue * equipment.daily_penalty * self.quantity
-            
-            db.session.commit()
-    
     def process_return(self, condition, notes=''):
-        """Process equipment return"""
+        """
+        Record the return condition and penalty on the issue (the caller commits)
+        
+        Equipment counters are moved by ``app.equipment.ledger.return_issue``,
+        which calls this once it has claimed the issue.
+        """
         from datetime import datetime
+        from app.equipment.penalties import penalty_for
         
-        self.actual_return_date = datetime.utcnow()
+        self.actual_return_date = self.actual_return_date or datetime.utcnow()
         self.return_condition = condition
         self.return_notes = notes
+        self.status = 'Returned'
         
         equipment = MedicalEquipment.query.get(self.equipment_id)
-        
-        # Update equipment quantities
-        equipment.quantity_issued -= self.quantity
-        
-        if condition == 'normal':
-            equipment.quantity_available += self.quantity
-            self.status = 'Returned'
-        elif condition == 'damaged':
-            equipment.quantity_damaged += self.quantity
-            self.status = 'Returned'
-            self.penalty_amount = equipment.unit_cost * self.quantity * 0.5  # 50% penalty for damage
-        elif condition == 'lost':
-            equipment.quantity_lost += self.quantity
-            self.status = 'Returned'
-            self.penalty_amount = equipment.unit_cost * self.quantity  # Full replacement cost
-        
-        # Calculate overdue penalty
-        if self.actual_return_date > self.expected_return_date:
-            days_over = (self.actual_return_date - self.expected_return_date).days
-            days_over = max(1, days_over)
-            self.penalty_amount += days_over * equipment.daily_penalty * self.quantity
-        
+        self.penalty_amount = penalty_for(condition, self.quantity, equipment, self.expected_return_date,
+                                          self.actual_return_date)
         self.is_overdue = False
-        db.session.commit()
     
     def __repr__(self):
         return f'<EquipmentIssue {self.id} - Student {self.student_id}>'
+
+
+class EquipmentReservation(HostelScoped, db.Model):
+    """Equipment held for a student over future dates"""
+    __tablename__ = 'equipment_reservations'
+    __hostel_parent__ = ('equipment_id', 'medical_equipments')
+    __table_args__ = (
+        # Interval lookup: reservations of one equipment overlapping a date range
+        db.Index('ix_equipment_reservations_interval', 'equipment_id', 'status', 'start_date', 'end_date'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    equipment_id = db.Column(db.Integer, db.ForeignKey('medical_equipments.id'), nullable=False)
+    student_id = db.Column(db.Integer, db.ForeignKey('students.id'), nullable=False, index=True)
+    reserved_by_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    issue_id = db.Column(db.Integer, db.ForeignKey('equipment_issues.id'))  # Set once fulfilled
+    quantity = db.Column(db.Integer, default=1, nullable=False)
+    start_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date, nullable=False)
+    status = db.Column(db.String(20), default='Reserved', nullable=False)  # Reserved, Fulfilled, Cancelled, Expired
+    notes = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Relationships
+    equipment = db.relationship('MedicalEquipment',
+                                backref=db.backref('reservations', lazy='dynamic', cascade='all, delete-orphan'))
+    student = db.relationship('Student', backref=db.backref('equipment_reservations', lazy='dynamic'))
+    reserved_by = db.relationship('User', foreign_keys=[reserved_by_id])
+    
+    def __repr__(self):
+        return f'<EquipmentReservation {self.id} {self.equipment_id} {self.start_date}..{self.end_date}>'
+
+
+class OutboxEvent(db.Model):
+    """Domain event recorded in the same transaction as the change it describes"""
+    __tablename__ = 'outbox_events'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    topic = db.Column(db.String(50), nullable=False)  # sickleave, dispensing, stock, equipment
+    event_type = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')  # JSON
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    # Delivery state
+    dispatched_at = db.Column(db.DateTime, index=True)
+    locked_until = db.Column(db.DateTime)  # Lease held by the dispatcher delivering the event
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    last_error = db.Column(db.Text)
+    
+    @property
+    def data(self):
+        return json.loads(self.payload)
+    
+    def __repr__(self):
+        return f'<OutboxEvent {self.id} {self.topic}.{self.event_type}>'
+
+
+class ProcessingWatermark(db.Model):
+    """How far an incremental job has processed its source rows"""
+    __tablename__ = 'processing_watermarks'
+    
+    name = db.Column(db.String(50), primary_key=True)  # Job name, e.g. 'medicine_consumption'
+    last_id = db.Column(db.Integer, default=0, nullable=False)  # Id progress of old releases; init-db rebuilds from it
+    last_at = db.Column(db.DateTime)  # Latest source timestamp processed
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<ProcessingWatermark {self.name} {self.last_at}>'
+
+
+class MedicineConsumption(db.Model):
+    """Units dispensed per medicine per day, built incrementally from DISPENSE stock movements"""
+    __tablename__ = 'medicine_consumption'
+    
+    medicine_id = db.Column(db.Integer, db.ForeignKey('medicines.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    quantity = db.Column(db.Integer, default=0, nullable=False)
+    
+    def __repr__(self):
+        return f'<MedicineConsumption {self.medicine_id} {self.day} {self.quantity}>'
+
+
+class DailyRollup(HostelScoped, db.Model):
+    """Daily total of a reporting metric per dimension and hostel, maintained incrementally for trend reports"""
+    __tablename__ = 'daily_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('metric', 'day', 'dimension', 'hostel_id', name='uq_daily_rollups_key'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    metric = db.Column(db.String(50), nullable=False)  # visits, diagnosis, stage_turnaround, equipment_issued
+    day = db.Column(db.Date, nullable=False)
+    dimension = db.Column(db.String(100), nullable=False, default='')  # Diagnosis, stage, category
+    count = db.Column(db.Integer, default=0, nullable=False)
+    total = db.Column(db.Float, default=0.0, nullable=False)  # Summed measure (hours, units)
+    
+    def __repr__(self):
+        return f'<DailyRollup {self.metric} {self.day} {self.dimension!r} {self.count}>'
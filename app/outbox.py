@@ -0,0 +1,203 @@
+"""
+Transactional outbox for domain events
+
+Routes record what happened with ``emit(topic, event_type, ...)`` *before*
+committing, so the event row is written in the same transaction as the
+``StockMovement``, ``BatchDispensing``, ``SickLeaveRequest`` or
+``EquipmentIssue`` change it describes: either both are saved or neither is.
+Once the transaction commits, a dispatcher delivers pending events to the
+consumers registered for their topic, outside the request that made the change.
+
+Delivery is at-least-once. An event is leased to one dispatcher at a time and
+marked dispatched only after every consumer succeeded; a failed or interrupted
+delivery is retried (up to OUTBOX_MAX_ATTEMPTS), so consumers must tolerate
+seeing an event twice.
+
+Dispatch modes (OUTBOX_DISPATCH):
+    background  A small thread pool drains the outbox after each commit
+    inline      Pending events are delivered at the end of the request
+    manual      Only ``python cli.py dispatch-events`` delivers events
+"""
+import importlib
+import json
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app, g, has_app_context, has_request_context
+from sqlalchemy import event, or_, select, update
+from sqlalchemy.orm import Session
+
+from .extensions import db
+from .models import OutboxEvent
+
+# topic -> list of consumer functions taking an OutboxEvent
+CONSUMERS = defaultdict(list)
+
+# Modules that register consumers; init_outbox imports them so every app (CLI
+# commands built without routes included) delivers to the same consumers
+CONSUMER_MODULES = (
+    'app.live.broker',
+    'app.stock.forecast',
+)
+
+_executor = None
+_hooks_installed = False
+
+
+def consumer(*topics):
+    """Register a function to receive every dispatched event of the given topics"""
+    def decorator(func):
+        for topic in topics:
+            CONSUMERS[topic].append(func)
+        return func
+    return decorator
+
+
+def emit(topic, event_type, **payload):
+    """
+    Record a domain event in the current transaction
+
+    The hostel the change was made in is recorded as ``hostel_id`` (None when
+    made across every hostel), so live updates only reach that hostel.
+
+    Args:
+        topic: Area of the change ('sickleave', 'dispensing', 'stock', 'equipment')
+        event_type: What happened (e.g. 'dispensed', 'warden_review')
+        **payload: JSON-serializable details (ids, quantities, statuses)
+
+    Returns:
+        The pending OutboxEvent (saved by the caller's commit)
+    """
+    from .tenancy import current_hostel_id
+    payload.setdefault('hostel_id', current_hostel_id())
+    outbox_event = OutboxEvent(topic=topic, event_type=event_type, payload=json.dumps(payload, default=str))
+    db.session.add(outbox_event)
+    return outbox_event
+
+
+def _claimable(now):
+    return (OutboxEvent.dispatched_at.is_(None),
+            OutboxEvent.attempts < current_app.config['OUTBOX_MAX_ATTEMPTS'],
+            or_(OutboxEvent.locked_until.is_(None), OutboxEvent.locked_until < now))
+
+
+def dispatch_pending(limit=None):
+    """
+    Deliver pending events to their consumers in the order they were written
+
+    Each event is claimed with a conditional UPDATE before delivery, so several
+    workers (or a worker and the CLI) can drain the outbox concurrently
+    without delivering the same event twice at once.
+
+    Returns:
+        (delivered, failed) event counts
+    """
+    limit = limit or current_app.config['OUTBOX_BATCH_SIZE']
+    lease = timedelta(seconds=current_app.config['OUTBOX_LEASE_SECONDS'])
+    now = datetime.utcnow()
+    event_ids = db.session.scalars(
+        select(OutboxEvent.id).where(*_claimable(now)).order_by(OutboxEvent.id).limit(limit)
+    ).all()
+
+    delivered = failed = 0
+    for event_id in event_ids:
+        now = datetime.utcnow()
+        claimed = db.session.execute(
+            update(OutboxEvent)
+            .where(OutboxEvent.id == event_id, *_claimable(now))
+            .values(locked_until=now + lease, attempts=OutboxEvent.attempts + 1)
+        ).rowcount
+        db.session.commit()
+        if not claimed:
+            continue
+
+        outbox_event = db.session.get(OutboxEvent, event_id)
+        try:
+            for handler in CONSUMERS.get(outbox_event.topic, ()):
+                handler(outbox_event)
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.exception('Outbox event %s failed', event_id)
+            values = {'locked_until': None, 'last_error': f'{type(e).__name__}: {e}'[:1000]}
+            failed += 1
+        else:
+            values = {'locked_until': None, 'last_error': None, 'dispatched_at': datetime.utcnow()}
+            delivered += 1
+        db.session.execute(update(OutboxEvent).where(OutboxEvent.id == event_id).values(**values))
+        db.session.commit()
+
+    return delivered, failed
+
+
+def purge_dispatched(days):
+    """Delete events dispatched more than ``days`` days ago; returns the number removed"""
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    removed = db.session.execute(
+        OutboxEvent.__table__.delete().where(OutboxEvent.dispatched_at < cutoff)
+    ).rowcount
+    db.session.commit()
+    return removed
+
+
+def _get_executor(app):
+    """Lazily create the shared dispatcher pool"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='h2-outbox')
+    return _executor
+
+
+def _run_dispatch(app):
+    """Background worker body - drains the outbox in its own app context"""
+    with app.app_context():
+        try:
+            # Keep going while full batches come back; failed events wait for the next commit
+            while sum(dispatch_pending()) >= app.config['OUTBOX_BATCH_SIZE']:
+                pass
+        except Exception:
+            app.logger.exception('Outbox dispatch failed')
+        finally:
+            db.session.remove()
+
+
+def init_outbox(app):
+    """Register the consumers and deliver outbox events after each commit according to OUTBOX_DISPATCH"""
+    global _hooks_installed
+    for module in CONSUMER_MODULES:
+        importlib.import_module(module)
+    app.extensions['outbox_dispatch'] = app.config['OUTBOX_DISPATCH']
+    if not _hooks_installed:
+        _install_outbox_hooks()
+        _hooks_installed = True
+
+    if app.config['OUTBOX_DISPATCH'] == 'inline':
+        @app.after_request
+        def dispatch_after_request(response):
+            if g.pop('outbox_pending', False):
+                dispatch_pending()
+            return response
+
+
+def _install_outbox_hooks():
+    """Notice commits that wrote outbox events and hand them to the dispatcher"""
+
+    @event.listens_for(Session, 'after_flush')
+    def _record_events(session, flush_context):
+        if any(isinstance(obj, OutboxEvent) for obj in session.new):
+            session.info['outbox_pending'] = True
+
+    @event.listens_for(Session, 'after_commit')
+    def _schedule_dispatch(session):
+        if not session.info.pop('outbox_pending', False) or not has_app_context():
+            return
+        mode = current_app.extensions.get('outbox_dispatch')
+        if mode == 'background':
+            app = current_app._get_current_object()
+            _get_executor(app).submit(_run_dispatch, app)
+        elif mode == 'inline' and has_request_context():
+            g.outbox_pending = True
+
+    @event.listens_for(Session, 'after_rollback')
+    def _discard_events(session):
+        session.info.pop('outbox_pending', None)
@@ -0,0 +1,131 @@
+"""
+Response compression and conditional GET for H2 System
+
+``init_responses(app)`` installs one after_request hook that
+
+* gives every uncompressed HTML/JSON GET response a weak ETag and answers
+  matching If-None-Match requests with 304 Not Modified, and
+* compresses text responses above COMPRESS_MIN_SIZE with brotli (when
+  installed) or gzip, whichever the client prefers.
+
+Views that can tell from the data whether anything changed call
+``not_modified(...)`` before doing any work, so repeat visits skip the queries
+and template rendering as well as the transfer.
+"""
+import gzip
+import hashlib
+from datetime import date
+
+from flask import current_app, g, request, session
+from flask_login import current_user
+from sqlalchemy import func, select
+
+from .extensions import db
+from .models import User
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {'text/html', 'text/css', 'text/plain', 'text/csv', 'text/javascript',
+                          'application/json', 'application/javascript', 'image/svg+xml'}
+VALIDATED_MIMETYPES = {'text/html', 'application/json'}
+
+
+def not_modified(*models, extra=()):
+    """
+    Answer a GET with 304 when none of the given models changed since the client's copy
+
+    The validators are the newest ``updated_at`` and the row count of every
+    model (the count catches deletes), read in a single query, plus the user,
+    the current hostel, the full URL, today's date and any ``extra`` values the page depends on.
+    The users table is always included because every page shows the
+    current user's name. Pending flash messages always get a fresh page.
+
+    Args:
+        *models: Models with an ``updated_at`` column that the page is built from
+        extra: Additional values the response depends on
+
+    Returns:
+        A 304 response if the client's cached copy is current, otherwise None
+        (the validators are attached to the response the view returns)
+    """
+    columns = []
+    for model in (User, *models):
+        columns.append(select(func.max(model.updated_at)).scalar_subquery())
+        columns.append(select(func.count()).select_from(model).scalar_subquery())
+    values = db.session.execute(select(*columns)).one()
+
+    user_id = current_user.get_id() if current_user else None
+    parts = [user_id, g.get('hostel_id'), request.full_path, date.today(), *values, *extra]
+    etag = hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+    last_modified = max((value for value in values[::2] if value is not None), default=None)
+    g.response_validators = (etag, last_modified)
+
+    if '_flashes' not in session and request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+        _apply_validators(response, etag, last_modified)
+        return response
+    return None
+
+
+def _apply_validators(response, etag, last_modified):
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+
+
+def _negotiate_encoding():
+    """Pick brotli or gzip according to the client's Accept-Encoding qualities"""
+    accepted = request.accept_encodings
+    options = [('gzip', accepted['gzip'])]
+    if brotli is not None:
+        options.append(('br', accepted['br']))
+    encoding, quality = max(options, key=lambda option: option[1])
+    return encoding if quality > 0 else None
+
+
+def init_responses(app):
+    """Install conditional GET and compression for dynamic responses"""
+    min_size = app.config['COMPRESS_MIN_SIZE']
+    gzip_level = app.config['COMPRESS_GZIP_LEVEL']
+    brotli_quality = app.config['COMPRESS_BROTLI_QUALITY']
+
+    @app.after_request
+    def finalize_response(response):
+        # Files and streamed exports are left alone (static files are precompressed)
+        if response.direct_passthrough or response.is_streamed:
+            return response
+
+        if request.method == 'GET' and response.status_code == 200 \
+                and response.mimetype in VALIDATED_MIMETYPES:
+            validators = g.pop('response_validators', None)
+            if validators:
+                _apply_validators(response, *validators)
+            elif not response.get_etag()[0]:
+                response.add_etag(weak=True)
+                response.cache_control.private = True
+                response.cache_control.no_cache = True
+            response.make_conditional(request)
+
+        if response.status_code != 200 or 'Content-Encoding' in response.headers \
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES:
+            return response
+
+        response.vary.add('Accept-Encoding')
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+
+        encoding = _negotiate_encoding()
+        if encoding == 'br':
+            response.set_data(brotli.compress(data, quality=brotli_quality))
+        elif encoding == 'gzip':
+            response.set_data(gzip.compress(data, compresslevel=gzip_level))
+        else:
+            return response
+        response.headers['Content-Encoding'] = encoding
+        return response
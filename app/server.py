@@ -0,0 +1,88 @@
+"""
+Production WSGI server for H2 System
+
+Runs the application under gunicorn with threaded workers. Worker and thread
+counts, keep-alive and timeouts come from the SERVER_* config settings and can
+be overridden from ``python cli.py serve``. With preload enabled the app is
+imported once in the master process and shared by every forked worker; each
+worker then opens its own database connections.
+"""
+import multiprocessing
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:  # gunicorn is only needed to serve in production
+    BaseApplication = None
+
+
+def default_workers():
+    """Gunicorn's recommended worker count: (2 x CPU cores) + 1"""
+    return multiprocessing.cpu_count() * 2 + 1
+
+
+def server_options(config, **overrides):
+    """
+    Build gunicorn settings from the app config
+
+    Args:
+        config: Flask config (or any mapping with SERVER_* keys)
+        **overrides: Settings given on the command line; None values are ignored
+
+    Returns:
+        Dict of gunicorn settings
+    """
+    options = {
+        'bind': config['SERVER_BIND'],
+        'workers': config['SERVER_WORKERS'] or default_workers(),
+        'threads': config['SERVER_THREADS'],
+        'worker_class': 'gthread',
+        'keepalive': config['SERVER_KEEPALIVE'],
+        'timeout': config['SERVER_TIMEOUT'],
+        'graceful_timeout': config['SERVER_GRACEFUL_TIMEOUT'],
+        'max_requests': config['SERVER_MAX_REQUESTS'],
+        'max_requests_jitter': config['SERVER_MAX_REQUESTS_JITTER'],
+        'preload_app': config['SERVER_PRELOAD'],
+        'accesslog': config['SERVER_ACCESS_LOG'],
+        'errorlog': '-',
+    }
+    options.update({key: value for key, value in overrides.items() if value is not None})
+    return options
+
+
+def _post_fork(server, worker):
+    """Drop database connections inherited from the master after a preload fork"""
+    from app.extensions import db
+    app = worker.app.application
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+
+def run_server(app_factory, options):
+    """
+    Serve the application with gunicorn
+
+    Args:
+        app_factory: Callable returning the Flask app; called once in the
+            master when preloading, otherwise once per worker
+        options: Gunicorn settings from server_options()
+    """
+    if BaseApplication is None:
+        raise RuntimeError('The production server requires gunicorn (pip install gunicorn).')
+
+    class H2Server(BaseApplication):
+        def __init__(self):
+            self.application = None
+            super().__init__()
+
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+            if options.get('preload_app'):
+                self.cfg.set('post_fork', _post_fork)
+
+        def load(self):
+            if self.application is None:
+                self.application = app_factory()
+            return self.application
+
+    H2Server().run()
@@ -7,6 +7,8 @@ from datetime import datetime, timedelta
 from ..extensions import db
 from app.models import Student, SickLeaveRequest
 from app.auth.utils import role_required
+from app.responses import not_modified
+from app.outbox import emit
 
 sickleave_bp = Blueprint('sickleave', __name__, template_folder='../templates/sickleave')
 
@@ -68,6 +70,10 @@ def calendar_data():
     if not year or not month:
         return jsonify([])
     
+    cached = not_modified(SickLeaveRequest, Student)
+    if cached:
+        return cached
+    
     # Get first and last day of month
     first_day = datetime(year, month, 1).date()
     if month == 12:
@@ -154,6 +160,8 @@ def create_request():
         )
         
         db.session.add(sick_request)
+        db.session.flush()
+        emit('sickleave', 'created', request_id=sick_request.id, request_type=request_type)
         db.session.commit()
         
         flash(f'{request_type} request created successfully.', 'success')
@@ -195,6 +203,7 @@ def h2_approve(request_id):
     sick_request.h2_approved_by = current_user.id
     sick_request.h2_approved_date = datetime.utcnow()
     
+    emit('sickleave', 'h2_review', request_id=request_id, status=sick_request.h2_status)
     db.session.commit()
     
     flash(message, 'success')
@@ -227,6 +236,7 @@ def warden_verify(request_id):
     sick_request.warden_verified_by = current_user.id
     sick_request.warden_verified_date = datetime.utcnow()
     
+    emit('sickleave', 'warden_review', request_id=request_id, status=sick_request.warden_status)
     db.session.commit()
     
     flash(message, 'success')
@@ -263,6 +273,7 @@ def office_approve(request_id):
     sick_request.office_approved_by = current_user.id
     sick_request.office_approved_date = datetime.utcnow()
     
+    emit('sickleave', 'office_review', request_id=request_id, status=sick_request.office_status)
     db.session.commit()
     
     flash(message, 'success')
@@ -290,6 +301,7 @@ def director_approve(request_id):
     sick_request.director_approved_by = current_user.id
     sick_request.director_approved_date = datetime.utcnow()
     
+    emit('sickleave', 'director_review', request_id=request_id, status=sick_request.director_status)
     db.session.commit()
     
     flash(message, 'success')
@@ -0,0 +1,45 @@
+// Live dashboard updates over server-sent events
+document.addEventListener('DOMContentLoaded', function() {
+    const counters = document.querySelectorAll('[data-live-count]');
+    const notices = document.querySelectorAll('[data-live-notice]');
+    const streamUrl = document.body.dataset.liveStream;
+
+    // Only pages showing live values keep a connection open
+    if (!streamUrl || !window.EventSource || (counters.length === 0 && notices.length === 0)) {
+        return;
+    }
+
+    const topics = new Set();
+    counters.forEach(function(element) {
+        topics.add(element.dataset.liveCount.split('.')[0]);
+    });
+    notices.forEach(function(element) {
+        topics.add(element.dataset.liveNotice);
+    });
+
+    const source = new EventSource(streamUrl);
+
+    topics.forEach(function(topic) {
+        source.addEventListener(topic, function(event) {
+            const data = JSON.parse(event.data);
+
+            counters.forEach(function(element) {
+                const [counterTopic, name] = element.dataset.liveCount.split('.');
+                if (counterTopic === topic && name in data.counts) {
+                    element.textContent = data.counts[name];
+                }
+            });
+
+            notices.forEach(function(element) {
+                if (element.dataset.liveNotice === topic) {
+                    element.classList.remove('d-none');
+                }
+            });
+        });
+    });
+
+    // Close the connection when leaving the page so the server frees the stream
+    window.addEventListener('pagehide', function() {
+        source.close();
+    });
+});
@@ -0,0 +1,209 @@
+"""
+Static asset pipeline for H2 System
+
+``python cli.py build-static`` copies every file under app/static into
+STATIC_BUILD_DIR with a content hash in its name (css/style.css ->
+build/css/style.1a2b3c4d5e6f.css), rewrites url() references inside CSS to the
+hashed names, writes .gz (and .br when brotli is installed) siblings for text
+files, and renders resized WebP variants of large images when Pillow is
+installed. A manifest maps original names to built ones.
+
+At runtime ``init_static(app)`` loads the manifest so that
+``url_for('static', filename='css/style.css')`` returns the hashed URL, and
+serves built files precompressed with immutable far-future caching. Files that
+are missing from the manifest are served unchanged.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+
+from flask import request, send_from_directory
+
+try:
+    import brotli
+except ImportError:  # .br files are optional; gzip is always produced
+    brotli = None
+
+try:
+    from PIL import Image
+except ImportError:  # WebP variants are optional
+    Image = None
+
+MANIFEST_NAME = 'manifest.json'
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.svg', '.json', '.txt', '.html', '.map', '.ttf', '.eot'}
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png'}
+CSS_URL_RE = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+
+def _content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def _hashed_name(path, digest, extension=None):
+    root, ext = posixpath.splitext(path)
+    return f'{root}.{digest}{extension or ext}'
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def _compress(path, data, min_size):
+    """Write precompressed siblings of a built text file"""
+    if len(data) < min_size:
+        return
+    _write(path + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        _write(path + '.br', brotli.compress(data, quality=11))
+
+
+def _rewrite_css_urls(css, css_path, files, build_dir):
+    """Point relative url() references in a stylesheet at their hashed names"""
+    css_dir = posixpath.dirname(css_path)
+    built_css_dir = posixpath.join(build_dir, css_dir)
+
+    def replace(match):
+        quote, url = match.groups()
+        if url.startswith(('data:', 'http:', 'https:', '//', '/', '#')):
+            return match.group(0)
+        path, suffix = re.match(r'([^?#]*)(.*)', url).groups()
+        target = posixpath.normpath(posixpath.join(css_dir, path))
+        if target not in files:
+            return match.group(0)
+        return f'url({quote}{posixpath.relpath(files[target], built_css_dir)}{suffix}{quote})'
+
+    return CSS_URL_RE.sub(replace, css)
+
+
+def _webp_variant(source_path, target_path, max_width, quality):
+    """Save a resized WebP copy of an image; return False if Pillow can't read it"""
+    try:
+        with Image.open(source_path) as image:
+            if image.width > max_width:
+                height = round(image.height * max_width / image.width)
+                image = image.resize((max_width, height), Image.LANCZOS)
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            image.save(target_path, 'WEBP', quality=quality, method=6)
+    except OSError:
+        return False
+    return True
+
+
+def build_static(app):
+    """
+    Fingerprint, compress and convert the static folder
+
+    Args:
+        app: Flask application (provides the static folder and STATIC_* config)
+
+    Returns:
+        The manifest dict: {'files': {original: built}, 'webp': {original: built}}
+    """
+    static_folder = app.static_folder
+    build_dir = app.config['STATIC_BUILD_DIR']
+    build_root = os.path.join(static_folder, build_dir)
+    min_size = app.config['STATIC_COMPRESS_MIN_SIZE']
+
+    if os.path.isdir(build_root):
+        shutil.rmtree(build_root)
+
+    sources = []
+    for root, dirs, names in os.walk(static_folder):
+        dirs[:] = sorted(d for d in dirs if os.path.join(root, d) != build_root)
+        for name in sorted(names):
+            full_path = os.path.join(root, name)
+            sources.append(os.path.relpath(full_path, static_folder).replace(os.sep, '/'))
+
+    # Stylesheets go last so the files they reference already have hashed names
+    sources.sort(key=lambda path: (path.endswith('.css'), path))
+    files, webp = {}, {}
+
+    for path in sources:
+        with open(os.path.join(static_folder, path), 'rb') as f:
+            data = f.read()
+        extension = posixpath.splitext(path)[1].lower()
+
+        if extension == '.css':
+            data = _rewrite_css_urls(data.decode('utf-8'), path, files, build_dir).encode('utf-8')
+
+        built = posixpath.join(build_dir, _hashed_name(path, _content_hash(data)))
+        built_path = os.path.join(static_folder, built)
+        _write(built_path, data)
+        files[path] = built
+
+        if extension in COMPRESSIBLE_EXTENSIONS:
+            _compress(built_path, data, min_size)
+
+        if extension in IMAGE_EXTENSIONS and Image is not None \
+                and len(data) > app.config['STATIC_WEBP_MIN_SIZE']:
+            webp_name = posixpath.join(build_dir, _hashed_name(path, _content_hash(data), '.webp'))
+            if _webp_variant(os.path.join(static_folder, path), os.path.join(static_folder, webp_name),
+                             app.config['STATIC_IMAGE_MAX_WIDTH'], app.config['STATIC_WEBP_QUALITY']):
+                webp[path] = webp_name
+
+    manifest = {'files': files, 'webp': webp}
+    with open(os.path.join(build_root, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_manifest(app):
+    """Read the build manifest, or return an empty one if there is no build"""
+    path = os.path.join(app.static_folder, app.config['STATIC_BUILD_DIR'], MANIFEST_NAME)
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'files': {}, 'webp': {}}
+
+
+def init_static(app):
+    """Serve fingerprinted static files when a build manifest is available"""
+    manifest = load_manifest(app) if app.config['STATIC_USE_MANIFEST'] else {'files': {}, 'webp': {}}
+    app.extensions['static_manifest'] = manifest
+    build_prefix = app.config['STATIC_BUILD_DIR'] + '/'
+    max_age = app.config['STATIC_MAX_AGE']
+
+    @app.url_defaults
+    def fingerprint_static_urls(endpoint, values):
+        if endpoint == 'static' and values.get('filename') in manifest['files']:
+            values['filename'] = manifest['files'][values['filename']]
+
+    @app.context_processor
+    def static_helpers():
+        def static_webp(filename):
+            """URL of the WebP variant of an image, or None if none was built"""
+            built = manifest['webp'].get(filename)
+            return f'{app.static_url_path}/{built}' if built else None
+        return {'static_webp': static_webp}
+
+    def send_static(filename):
+        if not filename.startswith(build_prefix):
+            return app.send_static_file(filename)
+
+        # Built files never change under the same name, so a cached copy is always valid
+        accepted = request.accept_encodings
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = None
+        for encoding, extension in (('br', '.br'), ('gzip', '.gz')):
+            if accepted[encoding] and os.path.isfile(os.path.join(app.static_folder, filename + extension)):
+                response = send_from_directory(app.static_folder, filename + extension,
+                                               mimetype=mimetype, max_age=max_age)
+                response.headers['Content-Encoding'] = encoding
+                break
+        if response is None:
+            response = send_from_directory(app.static_folder, filename, max_age=max_age)
+
+        response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+    app.view_functions['static'] = send_static
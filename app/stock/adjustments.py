@@ -0,0 +1,249 @@
+"""
+Batch-aware stock adjustments
+
+Adjustments change the batches that dispensing draws from, not just the
+medicine total:
+
+* LOSS and DISPENSE take stock from an explicitly chosen batch, or from the
+  medicine's batches in FEFO order (expired batches are only dispensed from
+  when chosen explicitly; losses reach them first, since they expire first)
+* ADD tops up an existing batch or creates a new one
+* COUNT sets a batch to a counted quantity, recorded as the ADD or LOSS that
+  closes the gap (for stocktakes)
+
+Every batch decrement is a guarded UPDATE that only succeeds while the batch
+still holds enough stock, so two adjustments racing for the same units can't
+drive a batch negative. Batch changes, ``Medicine.quantity`` and the
+``StockMovement`` row are written in the caller's transaction; nothing is
+committed here, so a sheet of adjustments is applied all-or-nothing.
+"""
+import csv
+import io
+from datetime import datetime
+
+from sqlalchemy import update
+
+from app.extensions import db
+from app.models import Medicine, MedicineBatch, StockMovement
+from app.outbox import emit
+
+ADJUSTMENT_TYPES = ('ADD', 'LOSS', 'DISPENSE', 'COUNT')
+
+SHEET_COLUMNS = ('medicine', 'movement_type', 'quantity')
+SHEET_OPTIONAL_COLUMNS = ('batch_number', 'expiry_date', 'shelf_location', 'cost_per_unit', 'reason')
+
+
+class AdjustmentError(ValueError):
+    """An adjustment that can't be applied (unknown batch, insufficient stock)"""
+
+
+def _find_batch(medicine, batch_id=None, batch_number=None, required=True):
+    """Look up the target batch; an unknown batch_number is allowed when not required (new batch)"""
+    if batch_id:
+        batch = db.session.get(MedicineBatch, batch_id)
+    elif batch_number:
+        batch = MedicineBatch.query.filter_by(medicine_id=medicine.id, batch_number=batch_number).first()
+        if batch is None and not required:
+            return None
+    else:
+        return None
+    if batch is None or batch.medicine_id != medicine.id:
+        raise AdjustmentError(f'Batch {batch_number or batch_id} not found for {medicine.name}.')
+    return batch
+
+
+def _fefo_batches(medicine, include_expired):
+    """Batches holding stock, earliest expiry first"""
+    query = MedicineBatch.query.filter(MedicineBatch.medicine_id == medicine.id,
+                                       MedicineBatch.available_quantity > 0)
+    if not include_expired:
+        query = query.filter(MedicineBatch.expiry_date > datetime.now().date())
+    return query.order_by(MedicineBatch.expiry_date, MedicineBatch.created_at, MedicineBatch.id).all()
+
+
+def _take(batch, quantity, now):
+    """Remove stock from a batch, failing if it no longer holds enough"""
+    result = db.session.execute(
+        update(MedicineBatch)
+        .where(MedicineBatch.id == batch.id, MedicineBatch.available_quantity >= quantity)
+        .values(available_quantity=MedicineBatch.available_quantity - quantity, updated_at=now)
+    )
+    if result.rowcount != 1:
+        raise AdjustmentError(f'Batch {batch.batch_number} no longer has {quantity} units available.')
+
+
+def _put(batch, quantity, now):
+    """Add received stock to a batch"""
+    db.session.execute(
+        update(MedicineBatch)
+        .where(MedicineBatch.id == batch.id)
+        .values(quantity=MedicineBatch.quantity + quantity,
+                available_quantity=MedicineBatch.available_quantity + quantity, updated_at=now)
+    )
+
+
+def apply_adjustment(medicine, movement_type, quantity, user_id, reason='', batch_id=None, batch_number=None,
+                     expiry_date=None, shelf_location=None, cost_per_unit=None):
+    """
+    Apply one stock adjustment to a medicine's batches
+
+    Args:
+        medicine: Medicine being adjusted
+        movement_type: ADD, LOSS, DISPENSE or COUNT
+        quantity: Units to add/remove (for COUNT, the counted quantity)
+        user_id: User recorded on the stock movement
+        reason: Free-text reason for the movement
+        batch_id, batch_number: Target batch (optional for LOSS/DISPENSE; FEFO when omitted)
+        expiry_date, shelf_location, cost_per_unit: Details for a new batch created by ADD
+
+    Returns:
+        List of (batch_number, units) the adjustment was applied to
+
+    Raises:
+        AdjustmentError: If the adjustment can't be applied; the caller should roll back
+    """
+    if movement_type not in ADJUSTMENT_TYPES:
+        raise AdjustmentError(f'Unknown adjustment type: {movement_type}.')
+    if quantity is None or quantity < 0 or (quantity == 0 and movement_type != 'COUNT'):
+        raise AdjustmentError('Quantity must be greater than 0.')
+
+    now = datetime.utcnow()
+    batch = _find_batch(medicine, batch_id, batch_number, required=movement_type != 'ADD')
+    allocations = []
+
+    if movement_type == 'COUNT':
+        if batch is None:
+            raise AdjustmentError(f'A stock count needs a batch number ({medicine.name}).')
+        counted, difference = quantity, quantity - batch.available_quantity
+        if difference == 0:
+            return []
+        movement_type, quantity = ('ADD', difference) if difference > 0 else ('LOSS', -difference)
+        reason = reason or f'Stock count: {batch.available_quantity} recorded, {counted} counted'
+
+    if movement_type == 'ADD':
+        if batch is None:
+            if not (batch_number and expiry_date and shelf_location):
+                raise AdjustmentError(f'A new batch of {medicine.name} needs a batch number, expiry date and '
+                                      f'shelf location.')
+            batch = MedicineBatch(medicine_id=medicine.id, batch_number=batch_number, quantity=quantity,
+                                  available_quantity=quantity, expiry_date=expiry_date,
+                                  shelf_location=shelf_location, cost_per_unit=cost_per_unit, date_added=now)
+            db.session.add(batch)
+            db.session.flush()
+        else:
+            _put(batch, quantity, now)
+        allocations.append((batch, quantity))
+    elif batch is not None:
+        _take(batch, quantity, now)
+        allocations.append((batch, quantity))
+    else:
+        remaining = quantity
+        batches = _fefo_batches(medicine, include_expired=movement_type == 'LOSS')
+        available = sum(candidate.available_quantity for candidate in batches)
+        if available < quantity:
+            raise AdjustmentError(f'Insufficient stock for {medicine.name}. Available: {available}, '
+                                  f'Required: {quantity}.')
+        for candidate in batches:
+            if remaining <= 0:
+                break
+            units = min(remaining, candidate.available_quantity)
+            _take(candidate, units, now)
+            allocations.append((candidate, units))
+            remaining -= units
+
+    delta = quantity if movement_type == 'ADD' else -quantity
+    db.session.execute(
+        update(Medicine).where(Medicine.id == medicine.id)
+        .values(quantity=Medicine.quantity + delta, updated_at=now)
+    )
+
+    batches_info = ', '.join(f'{used.batch_number} ({units})' for used, units in allocations)
+    db.session.add(StockMovement(
+        medicine_id=medicine.id,
+        user_id=user_id,
+        movement_type=movement_type,
+        quantity=quantity,
+        reason=f'{reason} - Batches: {batches_info}' if reason else f'Batches: {batches_info}',
+        reference_id=allocations[0][0].id if len(allocations) == 1 else None,
+        created_at=now
+    ))
+    emit('stock', 'adjusted', medicine_id=medicine.id, movement_type=movement_type, quantity=quantity,
+         batches=[{'batch_id': used.id, 'quantity': units} for used, units in allocations])
+
+    return [(used.batch_number, units) for used, units in allocations]
+
+
+def parse_adjustment_sheet(text):
+    """
+    Parse a CSV adjustment sheet
+
+    Required columns: medicine (name), movement_type, quantity. Optional:
+    batch_number, expiry_date (YYYY-MM-DD), shelf_location, cost_per_unit, reason.
+
+    Returns:
+        (lines, errors) - lines are dicts ready for ``apply_sheet``
+    """
+    reader = csv.DictReader(io.StringIO(text, newline=None))
+    missing = [column for column in SHEET_COLUMNS if column not in (reader.fieldnames or ())]
+    if missing:
+        return [], [f'Missing required columns: {", ".join(missing)}']
+
+    lines, errors = [], []
+    for row_num, row in enumerate(reader, start=2):  # Row 1 is the header
+        values = {key: (row.get(key) or '').strip() for key in SHEET_COLUMNS + SHEET_OPTIONAL_COLUMNS}
+        if not any(values.values()):
+            continue
+        try:
+            line = {
+                'row': row_num,
+                'medicine': values['medicine'],
+                'movement_type': values['movement_type'].upper(),
+                'quantity': int(values['quantity']),
+                'batch_number': values['batch_number'] or None,
+                'expiry_date': datetime.strptime(values['expiry_date'], '%Y-%m-%d').date()
+                if values['expiry_date'] else None,
+                'shelf_location': values['shelf_location'] or None,
+                'cost_per_unit': float(values['cost_per_unit']) if values['cost_per_unit'] else None,
+                'reason': values['reason'],
+            }
+        except ValueError as e:
+            errors.append(f'Row {row_num}: {e}')
+            continue
+        if not line['medicine'] or line['movement_type'] not in ADJUSTMENT_TYPES:
+            errors.append(f'Row {row_num}: medicine and a movement_type of {", ".join(ADJUSTMENT_TYPES)} '
+                          f'are required')
+            continue
+        lines.append(line)
+    return lines, errors
+
+
+def apply_sheet(lines, user_id, reason=''):
+    """
+    Apply every line of an adjustment sheet in the current transaction
+
+    Medicines are looked up in one query. The first line that fails raises
+    AdjustmentError (prefixed with its row number); the caller rolls back so
+    none of the sheet is applied.
+
+    Returns:
+        Number of stock movements recorded
+    """
+    names = {line['medicine'] for line in lines}
+    medicines = {medicine.name: medicine for medicine in Medicine.query.filter(Medicine.name.in_(names))}
+
+    recorded = 0
+    for line in lines:
+        medicine = medicines.get(line['medicine'])
+        try:
+            if medicine is None:
+                raise AdjustmentError(f'Unknown medicine: {line["medicine"]}.')
+            allocations = apply_adjustment(
+                medicine, line['movement_type'], line['quantity'], user_id,
+                reason=line['reason'] or reason, batch_number=line['batch_number'],
+                expiry_date=line['expiry_date'], shelf_location=line['shelf_location'],
+                cost_per_unit=line['cost_per_unit'])
+        except AdjustmentError as e:
+            raise AdjustmentError(f'Row {line["row"]}: {e}') from e
+        if allocations:
+            recorded += 1
+    return recorded
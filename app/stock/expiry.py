@@ -0,0 +1,173 @@
+"""
+Expiry analytics and write-off for medicine batches
+
+Everything here is a range query on the indexed ``MedicineBatch.expiry_date``
+(batches expiring in a window, batches already expired) with value computed
+in SQL from the batch cost (falling back to the medicine's cost), so no batch
+objects are loaded. ``write_off_expired`` is the monthly job: it zeroes every
+expired batch still holding stock and records the LOSS movements in bulk,
+and raises ``WriteOffConflict`` if a batch changed after it was read.
+"""
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import bindparam, func, insert
+
+from app.extensions import db
+from app.models import Medicine, MedicineBatch, StockMovement
+from app.outbox import emit
+
+
+class WriteOffConflict(RuntimeError):
+    """A batch changed between selecting and zeroing it; roll back and retry"""
+
+
+def _unit_cost():
+    return func.coalesce(MedicineBatch.cost_per_unit, Medicine.cost_per_unit, 0)
+
+
+def _batch_query():
+    """Batches with stock, joined to their medicine, as plain rows"""
+    return db.session.query(
+        MedicineBatch.id, Medicine.id.label('medicine_id'), Medicine.name, MedicineBatch.batch_number,
+        MedicineBatch.shelf_location, MedicineBatch.expiry_date, MedicineBatch.available_quantity,
+        _unit_cost().label('unit_cost'),
+        (MedicineBatch.available_quantity * _unit_cost()).label('value'),
+    ).join(Medicine, MedicineBatch.medicine_id == Medicine.id) \
+        .filter(MedicineBatch.available_quantity > 0)
+
+
+def expiring_batches_query(days, today=None):
+    """Batches with stock that expire within the next ``days`` days, soonest first"""
+    today = today or date.today()
+    return _batch_query().filter(MedicineBatch.expiry_date > today,
+                                 MedicineBatch.expiry_date <= today + timedelta(days=days)) \
+        .order_by(MedicineBatch.expiry_date, Medicine.name)
+
+
+def expired_batches_query(today=None):
+    """Expired batches still holding stock (awaiting write-off)"""
+    today = today or date.today()
+    return _batch_query().filter(MedicineBatch.expiry_date <= today) \
+        .order_by(MedicineBatch.expiry_date, Medicine.name)
+
+
+def _month_start(day):
+    return day.replace(day=1)
+
+
+def _add_months(day, months):
+    month = day.month - 1 + months
+    return day.replace(year=day.year + month // 12, month=month % 12 + 1, day=1)
+
+
+def write_off_forecast(months=3, today=None):
+    """
+    Stock value that will expire in each of the coming months
+
+    One grouped query by expiry date over the window; the per-day totals are
+    folded into calendar months here.
+
+    Returns:
+        List of dicts with ``month`` (first day), ``batches``, ``units`` and ``value``
+    """
+    today = today or date.today()
+    end = _add_months(_month_start(today), months)
+    rows = db.session.query(
+        MedicineBatch.expiry_date,
+        func.count(MedicineBatch.id),
+        func.sum(MedicineBatch.available_quantity),
+        func.sum(MedicineBatch.available_quantity * _unit_cost()),
+    ).join(Medicine, MedicineBatch.medicine_id == Medicine.id) \
+        .filter(MedicineBatch.available_quantity > 0,
+                MedicineBatch.expiry_date > today,
+                MedicineBatch.expiry_date < end) \
+        .group_by(MedicineBatch.expiry_date).all()
+
+    forecast = [{'month': _add_months(_month_start(today), offset), 'batches': 0, 'units': 0, 'value': 0.0}
+                for offset in range(months)]
+    for expiry_date, batches, units, value in rows:
+        bucket = forecast[(expiry_date.year - today.year) * 12 + expiry_date.month - today.month]
+        bucket['batches'] += batches
+        bucket['units'] += units or 0
+        bucket['value'] += value or 0.0
+    return forecast
+
+
+def expiry_summary(days=30, today=None):
+    """Totals for the expiry report header: expired stock and stock expiring within ``days``"""
+    today = today or date.today()
+
+    def totals(query):
+        subquery = query.order_by(None).subquery()
+        count, units, value = db.session.query(
+            func.count(subquery.c.id), func.sum(subquery.c.available_quantity), func.sum(subquery.c.value)
+        ).one()
+        return {'batches': count, 'units': units or 0, 'value': value or 0.0}
+
+    return {'expired': totals(expired_batches_query(today)),
+            'expiring': totals(expiring_batches_query(days, today))}
+
+
+def write_off_expired(user_id, today=None):
+    """
+    Zero every expired batch still holding stock and record LOSS movements
+
+    One executemany UPDATE zeroes the batches, guarded on the quantity that
+    was read, then one bulk INSERT records the movements and one executemany
+    UPDATE adjusts the medicine totals. Only the current hostel's batches are
+    written off (every hostel outside one). Nothing is committed; the caller commits.
+
+    Raises:
+        WriteOffConflict: A batch was dispensed or adjusted after it was read;
+            the caller rolls back (nothing written here should be kept)
+
+    Returns:
+        (batches written off, units, value)
+    """
+    today = today or date.today()
+    now = datetime.utcnow()
+    rows = expired_batches_query(today).add_columns(Medicine.hostel_id).all()
+    if not rows:
+        return 0, 0, 0.0
+
+    batches = MedicineBatch.__table__
+    claimed = db.session.execute(
+        batches.update()
+        .where(batches.c.id == bindparam('batch_id'), batches.c.available_quantity == bindparam('units'))
+        .values(available_quantity=0, updated_at=now),
+        [{'batch_id': row.id, 'units': row.available_quantity} for row in rows]
+    ).rowcount
+    if claimed != len(rows):
+        raise WriteOffConflict(f'{len(rows) - claimed} expired batch(es) changed during the write-off')
+
+    db.session.execute(insert(StockMovement), [
+        {
+            'medicine_id': row.medicine_id,
+            'hostel_id': row.hostel_id,
+            'user_id': user_id,
+            'movement_type': 'LOSS',
+            'quantity': row.available_quantity,
+            'reason': f'Expiry write-off - Batch: {row.batch_number} (expired {row.expiry_date}, '
+                      f'Shelf: {row.shelf_location})',
+            'reference_id': row.id,
+            'created_at': now,
+        }
+        for row in rows
+    ])
+
+    per_medicine = {}
+    for row in rows:
+        per_medicine[row.medicine_id] = per_medicine.get(row.medicine_id, 0) + row.available_quantity
+    medicines = Medicine.__table__
+    db.session.execute(
+        medicines.update()
+        .where(medicines.c.id == bindparam('medicine_id'))
+        .values(quantity=medicines.c.quantity - bindparam('units'), updated_at=now),
+        [{'medicine_id': medicine_id, 'units': units} for medicine_id, units in per_medicine.items()]
+    )
+
+    units = sum(row.available_quantity for row in rows)
+    value = sum(row.value or 0.0 for row in rows)
+    emit('stock', 'expired_written_off', batches=len(rows), units=units, value=round(value, 2),
+         medicine_ids=sorted(per_medicine))
+    return len(rows), units, value
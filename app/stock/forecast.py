@@ -0,0 +1,191 @@
+"""
+Consumption forecasting and reorder suggestions
+
+DISPENSE stock movements are folded into ``MedicineConsumption`` (units per
+medicine per day) incrementally: each refresh aggregates only the movements
+added since the last one, tracked by a timestamp watermark. The forecast then
+reads a fixed window of daily totals in one query and, per medicine,
+estimates daily demand and its variability:
+
+* lead-time demand = mean daily demand x REORDER_LEAD_TIME_DAYS
+* safety stock = REORDER_SERVICE_FACTOR x standard deviation x sqrt(lead time)
+* reorder point = lead-time demand + safety stock (never below min_stock_level)
+
+A medicine at or below its reorder point gets a suggested order that brings
+usable (non-expired) stock up to cover the lead time plus REORDER_REVIEW_DAYS.
+"""
+import math
+from collections import defaultdict
+from datetime import date, timedelta
+from statistics import fmean, pstdev
+
+from flask import current_app
+from sqlalchemy import bindparam, func, insert, select
+
+from app.extensions import db, cache
+from app.models import Medicine, MedicineBatch, MedicineConsumption, StockMovement
+from app.outbox import consumer
+from app.tenancy import all_hostels
+from app.watermarks import advance_window, in_window, pending_window, reset
+
+WATERMARK = 'medicine_consumption'
+
+
+def _as_date(value):
+    # SQLite returns date() as text, other databases as a date
+    return value if isinstance(value, date) else date.fromisoformat(str(value))
+
+
+@all_hostels()
+def refresh_consumption():
+    """
+    Add DISPENSE movements recorded since the last refresh to the daily series
+
+    Movements are picked up once they are ROLLUP_SETTLE_SECONDS old. Runs across every hostel, whichever one the caller works in. Nothing is
+    committed; the caller commits (or rolls back on WatermarkConflict).
+
+    Returns:
+        Number of (medicine, day) totals changed
+    """
+    last_at, high = pending_window(WATERMARK, current_app.config['ROLLUP_SETTLE_SECONDS'])
+
+    day = func.date(StockMovement.created_at)
+    totals = {
+        (medicine_id, _as_date(day_value)): units
+        for medicine_id, day_value, units in db.session.execute(
+            select(StockMovement.medicine_id, day, func.sum(StockMovement.quantity))
+            .where(in_window(StockMovement.created_at, last_at, high),
+                   StockMovement.movement_type == 'DISPENSE')
+            .group_by(StockMovement.medicine_id, day)
+        )
+    }
+
+    if totals:
+        existing = {tuple(row) for row in db.session.execute(
+            select(MedicineConsumption.medicine_id, MedicineConsumption.day)
+            .where(MedicineConsumption.medicine_id.in_({key[0] for key in totals}),
+                   MedicineConsumption.day >= min(key[1] for key in totals))
+        )}
+
+        consumption = MedicineConsumption.__table__
+        updates = [{'key_medicine': medicine_id, 'key_day': day_value, 'units': units}
+                   for (medicine_id, day_value), units in totals.items() if (medicine_id, day_value) in existing]
+        if updates:
+            db.session.execute(
+                consumption.update()
+                .where(consumption.c.medicine_id == bindparam('key_medicine'),
+                       consumption.c.day == bindparam('key_day'))
+                .values(quantity=consumption.c.quantity + bindparam('units')),
+                updates
+            )
+        inserts = [{'medicine_id': medicine_id, 'day': day_value, 'quantity': units}
+                   for (medicine_id, day_value), units in totals.items() if (medicine_id, day_value) not in existing]
+        if inserts:
+            db.session.execute(insert(MedicineConsumption), inserts)
+
+    advance_window(WATERMARK, last_at, high)
+    return len(totals)
+
+
+@all_hostels()
+def rebuild_consumption():
+    """Discard the daily series and rebuild it from every DISPENSE movement (caller commits)"""
+    db.session.execute(MedicineConsumption.__table__.delete())
+    reset(WATERMARK)
+    return refresh_consumption()
+
+
+@consumer('dispensing', 'stock')
+def refresh_on_stock_event(outbox_event):
+    """Keep the daily series current as dispensing and adjustments happen"""
+    refresh_consumption()
+
+
+def _usable_stock(today):
+    """Batch stock per medicine that is still usable today, as a subquery"""
+    return db.session.query(
+        MedicineBatch.medicine_id,
+        func.sum(MedicineBatch.available_quantity).label('total')
+    ).filter(MedicineBatch.expiry_date > today) \
+        .group_by(MedicineBatch.medicine_id).subquery()
+
+
+def _compute_forecast(today, history_days, lead_days, review_days, service_factor):
+    start = today - timedelta(days=history_days)
+    series = defaultdict(lambda: [0] * history_days)
+    for medicine_id, day_value, units in db.session.query(
+            MedicineConsumption.medicine_id, MedicineConsumption.day, MedicineConsumption.quantity
+    ).filter(MedicineConsumption.day >= start, MedicineConsumption.day < today):
+        series[medicine_id][(day_value - start).days] = units
+
+    usable = _usable_stock(today)
+    medicines = db.session.query(
+        Medicine.id, Medicine.name, Medicine.unit, Medicine.supplier, Medicine.min_stock_level,
+        Medicine.cost_per_unit, Medicine.created_at, func.coalesce(usable.c.total, 0)
+    ).outerjoin(usable, usable.c.medicine_id == Medicine.id).order_by(Medicine.name)
+
+    forecast = []
+    for medicine_id, name, unit, supplier, min_level, cost, created_at, stock in medicines:
+        # Medicines added during the window are averaged over the days they existed
+        days = history_days
+        if created_at:
+            days = max(1, min(history_days, (today - created_at.date()).days))
+        daily = series[medicine_id][-days:] if medicine_id in series else [0] * days
+
+        demand = fmean(daily)
+        deviation = pstdev(daily) if len(daily) > 1 else 0.0
+        safety_stock = service_factor * deviation * math.sqrt(lead_days)
+        reorder_point = max(demand * lead_days + safety_stock, min_level or 0)
+        target = max(demand * (lead_days + review_days) + safety_stock, min_level or 0)
+        suggested = math.ceil(target - stock) if stock <= reorder_point else 0
+
+        forecast.append({
+            'medicine_id': medicine_id,
+            'name': name,
+            'unit': unit,
+            'supplier': supplier or '',
+            'stock': stock,
+            'daily_demand': demand,
+            'deviation': deviation,
+            'days_of_cover': stock / demand if demand else None,
+            'safety_stock': math.ceil(safety_stock),
+            'reorder_point': math.ceil(reorder_point),
+            'suggested': max(suggested, 0),
+            'value': max(suggested, 0) * (cost or 0.0),
+        })
+    return forecast
+
+
+def demand_forecast(today=None):
+    """
+    Demand statistics and reorder quantity for every medicine
+
+    Cached until the daily series, medicines or batches change (and per day).
+
+    Returns:
+        List of dicts, one per medicine, ordered by name
+    """
+    today = today or date.today()
+    config = current_app.config
+    params = (config['REORDER_HISTORY_DAYS'], config['REORDER_LEAD_TIME_DAYS'],
+              config['REORDER_REVIEW_DAYS'], config['REORDER_SERVICE_FACTOR'])
+    return cache.cached('stock.demand_forecast', ['medicine_consumption', 'medicines', 'medicine_batches'],
+                        lambda: _compute_forecast(today, *params), key_parts=[today, *params])
+
+
+def reorder_suggestions(today=None):
+    """
+    Medicines that should be reordered now, grouped by supplier
+
+    Returns:
+        List of dicts with ``supplier``, ``lines`` (forecast rows), ``units`` and ``value``
+    """
+    suppliers = defaultdict(list)
+    for row in demand_forecast(today):
+        if row['suggested']:
+            suppliers[row['supplier']].append(row)
+
+    return [{'supplier': supplier, 'lines': lines,
+             'units': sum(line['suggested'] for line in lines),
+             'value': sum(line['value'] for line in lines)}
+            for supplier, lines in sorted(suppliers.items(), key=lambda item: (not item[0], item[0].lower()))]
@@ -0,0 +1,125 @@
+"""
+Stock ledger reconciliation
+
+Stock is recorded three ways, which can drift apart:
+
+* ``Medicine.quantity`` - the running total kept by the stock routes
+* the sum of ``MedicineBatch.available_quantity`` - what dispensing draws from
+* the ``StockMovement`` ledger - ADD movements minus DISPENSE and LOSS
+
+Each is aggregated with one grouped query per table, joined per medicine in a
+single statement, so checking the whole inventory costs the same few index
+scans however long the movement history is. Batches are the physical stock,
+so a repair brings the other two in line with them.
+"""
+from datetime import datetime
+
+from sqlalchemy import case, func, insert, or_, update
+
+from app.extensions import db
+from app.models import Medicine, MedicineBatch, StockMovement
+from app.outbox import emit
+
+# Movements that add to stock; every other movement type removes stock
+INBOUND_MOVEMENTS = ('ADD',)
+
+# Medicines updated per statement when repairing
+REPAIR_CHUNK_SIZE = 500
+
+
+def reconciliation_query(discrepancies_only=True, medicine_ids=None):
+    """
+    Per-medicine stock figures from all three sources
+
+    Rows have ``id``, ``name``, ``recorded`` (Medicine.quantity), ``batches``
+    (available batch total), ``ledger`` (movement balance) and
+    ``invalid_batches`` (batches with negative stock or more available than
+    received).
+
+    Args:
+        discrepancies_only: Only return medicines where the sources disagree
+        medicine_ids: Restrict the check to these medicines
+    """
+    batch_totals = db.session.query(
+        MedicineBatch.medicine_id,
+        func.sum(MedicineBatch.available_quantity).label('available'),
+        func.sum(case((or_(MedicineBatch.available_quantity < 0,
+                           MedicineBatch.available_quantity > MedicineBatch.quantity), 1),
+                      else_=0)).label('invalid'),
+    ).group_by(MedicineBatch.medicine_id).subquery()
+
+    ledger_totals = db.session.query(
+        StockMovement.medicine_id,
+        func.sum(case((StockMovement.movement_type.in_(INBOUND_MOVEMENTS), StockMovement.quantity),
+                      else_=-StockMovement.quantity)).label('balance'),
+    ).group_by(StockMovement.medicine_id).subquery()
+
+    recorded = func.coalesce(Medicine.quantity, 0)
+    batches = func.coalesce(batch_totals.c.available, 0)
+    ledger = func.coalesce(ledger_totals.c.balance, 0)
+    invalid = func.coalesce(batch_totals.c.invalid, 0)
+
+    query = db.session.query(
+        Medicine.id, Medicine.name, recorded.label('recorded'), batches.label('batches'),
+        ledger.label('ledger'), invalid.label('invalid_batches'),
+    ).select_from(Medicine) \
+        .outerjoin(batch_totals, batch_totals.c.medicine_id == Medicine.id) \
+        .outerjoin(ledger_totals, ledger_totals.c.medicine_id == Medicine.id)
+
+    if discrepancies_only:
+        query = query.filter(or_(recorded != batches, ledger != batches, invalid > 0))
+    if medicine_ids:
+        query = query.filter(Medicine.id.in_(medicine_ids))
+
+    return query.order_by(Medicine.name)
+
+
+def repair_stock(user_id, medicine_ids=None):
+    """
+    Bring Medicine.quantity and the movement ledger in line with the batches
+
+    Medicine totals are reset with one bulk UPDATE per chunk, and the ledger is
+    balanced with correcting ADD/LOSS movements written in one bulk INSERT.
+    Batches with invalid quantities are left for a stocktake. Nothing is
+    committed; the caller commits.
+
+    Args:
+        user_id: User recorded on the correcting movements
+        medicine_ids: Only repair these medicines (default: every discrepancy)
+
+    Returns:
+        (medicines repaired, correcting movements written)
+    """
+    rows = reconciliation_query(medicine_ids=medicine_ids).add_columns(Medicine.hostel_id).all()
+    now = datetime.utcnow()
+
+    quantity_ids = [row.id for row in rows if row.recorded != row.batches]
+    batch_total = db.session.query(func.coalesce(func.sum(MedicineBatch.available_quantity), 0)) \
+        .filter(MedicineBatch.medicine_id == Medicine.id).scalar_subquery()
+    for start in range(0, len(quantity_ids), REPAIR_CHUNK_SIZE):
+        db.session.execute(
+            update(Medicine)
+            .where(Medicine.id.in_(quantity_ids[start:start + REPAIR_CHUNK_SIZE]))
+            .values(quantity=batch_total, updated_at=now)
+            .execution_options(synchronize_session=False)
+        )
+
+    movements = [
+        {
+            'medicine_id': row.id,
+            'hostel_id': row.hostel_id,
+            'user_id': user_id,
+            'movement_type': 'ADD' if row.batches > row.ledger else 'LOSS',
+            'quantity': abs(row.batches - row.ledger),
+            'reason': f'Reconciliation: ledger balance {row.ledger} corrected to batch stock {row.batches}',
+            'created_at': now,
+        }
+        for row in rows if row.ledger != row.batches
+    ]
+    if movements:
+        db.session.execute(insert(StockMovement), movements)
+
+    repaired = {row.id for row in rows if row.recorded != row.batches or row.ledger != row.batches}
+    if repaired:
+        emit('stock', 'reconciled', medicine_ids=sorted(repaired), movements=len(movements))
+    return len(repaired), len(movements)
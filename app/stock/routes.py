@@ -4,9 +4,19 @@ Medical stock management blueprint routes
 from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
 from flask_login import current_user, login_required
 from datetime import datetime
-from ..extensions import db
-from app.models import Medicine, StockMovement, MedicineBatch
+from sqlalchemy import func
+from ..extensions import db, cache
+from app.models import Medicine, StockMovement, MedicineBatch, User
 from app.auth.utils import role_required
+from app.exports.utils import export_report
+from app.facets import get_facets
+from app.responses import not_modified
+from app.outbox import emit
+from .expiry import (WriteOffConflict, expired_batches_query, expiring_batches_query, expiry_summary,
+                     write_off_expired, write_off_forecast)
+from .forecast import demand_forecast, reorder_suggestions
+from .adjustments import AdjustmentError, apply_adjustment, apply_sheet, parse_adjustment_sheet
+from .reconcile import reconciliation_query, repair_stock
 import csv
 import io
 
@@ -17,15 +27,27 @@ stock_bp = Blueprint('stock', __name__, template_folder='../templates/stock')
 @role_required('H2', 'Director')
 def inventory():
     """View medicine inventory (based on non-expired batches only)"""
+    cached = not_modified(Medicine, MedicineBatch)
+    if cached:
+        return cached
+    
     page = request.args.get('page', 1, type=int)
     search = request.args.get('search', '')
     show_low = request.args.get('low_stock', 'false').lower() == 'true'
+    supplier = request.args.get('supplier', '')
+    unit = request.args.get('unit', '')
     
     query = Medicine.query
     
     if search:
         query = query.filter(Medicine.name.ilike(f'%{search}%'))
     
+    if supplier:
+        query = query.filter_by(supplier=supplier)
+    
+    if unit:
+        query = query.filter_by(unit=unit)
+    
     medicines = query.order_by(Medicine.name).all()
     
     # Filter by low stock using property (excludes expired batches)
@@ -51,7 +73,8 @@ def inventory():
     
     medicines = SimplePage(medicines_page, page, per_page, total)
     
-    return render_template('stock/inventory.html', medicines=medicines, search=search, show_low=show_low)
+    return render_template('stock/inventory.html', medicines=medicines, search=search, show_low=show_low,
+                          facets=get_facets('medicines'), selected_supplier=supplier, selected_unit=unit)
 
 
 @stock_bp.route('/add-medicine', methods=['GET', 'POST'])
@@ -129,6 +152,7 @@ def add_medicine():
         )
         
         db.session.add(movement)
+        emit('stock', 'added', medicine_id=medicine.id, batch_id=batch.id, quantity=quantity)
         db.session.commit()
         
         flash(f'Medicine {name} added successfully with batch {batch_number} ({quantity} units).', 'success')
@@ -178,67 +202,285 @@ def edit_medicine(medicine_id):
 @stock_bp.route('/<int:medicine_id>/adjust-stock', methods=['POST'])
 @role_required('H2', 'Director')
 def adjust_stock(medicine_id):
-    """Adjust medicine stock"""
+    """Adjust medicine stock batch by batch (FEFO unless a batch is chosen)"""
     medicine = Medicine.query.get_or_404(medicine_id)
     
     quantity = request.form.get('quantity', type=int)
-    movement_type = request.form.get('movement_type')  # ADD, DISPENSE, LOSS
-    reason = request.form.get('reason')
-    
-    if movement_type == 'ADD':
-        medicine.quantity += quantity
-    elif movement_type in ['DISPENSE', 'LOSS']:
-        if medicine.quantity < quantity:
-            flash('Insufficient stock available.', 'danger')
-            return redirect(url_for('stock.view_medicine', medicine_id=medicine.id))
-        medicine.quantity -= quantity
-    
-    # Record stock movement
-    movement = StockMovement(
-        medicine_id=medicine.id,
-        user_id=current_user.id,
-        movement_type=movement_type,
-        quantity=quantity,
-        reason=reason
-    )
-    
-    db.session.add(movement)
+    movement_type = request.form.get('movement_type')  # ADD, DISPENSE, LOSS, COUNT
+    reason = request.form.get('reason', '')
+    expiry_date = request.form.get('expiry_date')
+    
+    try:
+        allocations = apply_adjustment(
+            medicine, movement_type, quantity, current_user.id, reason=reason,
+            batch_id=request.form.get('batch_id', type=int),
+            batch_number=request.form.get('batch_number', '').strip() or None,
+            expiry_date=datetime.strptime(expiry_date, '%Y-%m-%d').date() if expiry_date else None,
+            shelf_location=request.form.get('shelf_location', '').strip() or None,
+            cost_per_unit=request.form.get('cost_per_unit', type=float)
+        )
+    except ValueError as e:
+        db.session.rollback()
+        flash(str(e) if isinstance(e, AdjustmentError) else 'Invalid expiry date format. Use YYYY-MM-DD.', 'danger')
+        return redirect(url_for('stock.view_medicine', medicine_id=medicine.id))
+    
     db.session.commit()
     
-    flash(f'Stock adjusted: {movement_type} {quantity} units.', 'success')
+    if not allocations:
+        flash('Counted quantity matches the batch; no adjustment needed.', 'info')
+    else:
+        batch_details = ', '.join(f'{batch_number} ({units} units)' for batch_number, units in allocations)
+        flash(f'Stock adjusted ({movement_type}). Batches: {batch_details}.', 'success')
     return redirect(url_for('stock.view_medicine', medicine_id=medicine.id))
 
 
+@stock_bp.route('/adjustments', methods=['GET', 'POST'])
+@role_required('H2', 'Director')
+def adjustment_sheet():
+    """Apply a multi-line adjustment sheet (e.g. a monthly stocktake) in one transaction"""
+    if request.method == 'POST':
+        file = request.files.get('file')
+        
+        if not file or file.filename == '':
+            flash('No selected file.', 'danger')
+            return redirect(url_for('stock.adjustment_sheet'))
+        
+        if not file.filename.endswith(('.csv', '.txt')):
+            flash('Please upload a CSV or TXT file.', 'danger')
+            return redirect(url_for('stock.adjustment_sheet'))
+        
+        try:
+            lines, errors = parse_adjustment_sheet(file.read().decode('UTF-8'))
+        except UnicodeDecodeError:
+            flash('The file must be UTF-8 encoded CSV.', 'danger')
+            return redirect(url_for('stock.adjustment_sheet'))
+        
+        if errors:
+            error_msg = '; '.join(errors[:10])  # Show first 10 errors
+            if len(errors) > 10:
+                error_msg += f'; ... and {len(errors) - 10} more errors'
+            flash(f'The sheet was not applied. Encountered {len(errors)} error(s): {error_msg}', 'danger')
+            return redirect(url_for('stock.adjustment_sheet'))
+        
+        if not lines:
+            flash('The sheet has no adjustment lines.', 'warning')
+            return redirect(url_for('stock.adjustment_sheet'))
+        
+        try:
+            recorded = apply_sheet(lines, current_user.id, reason=request.form.get('reason', ''))
+        except AdjustmentError as e:
+            db.session.rollback()
+            flash(f'The sheet was not applied. {e}', 'danger')
+            return redirect(url_for('stock.adjustment_sheet'))
+        
+        db.session.commit()
+        
+        flash(f'Adjustment sheet applied: {recorded} stock movement(s) recorded from {len(lines)} line(s).', 'success')
+        return redirect(url_for('stock.stock_history'))
+    
+    return render_template('stock/adjustment_sheet.html')
+
+
+def _low_stock_query(*entities):
+    """
+    Medicines at or below min_stock_level (non-expired batches only)
+    
+    Args:
+        *entities: Columns/entities to select; the non-expired batch total is appended as the last column
+    """
+    today = datetime.now().date()
+    batch_totals = db.session.query(
+        MedicineBatch.medicine_id,
+        func.sum(MedicineBatch.available_quantity).label('total')
+    ).filter(MedicineBatch.expiry_date > today).group_by(MedicineBatch.medicine_id).subquery()
+    
+    total = func.coalesce(batch_totals.c.total, 0)
+    return db.session.query(*entities, total.label('total_batch_quantity')) \
+        .select_from(Medicine) \
+        .outerjoin(batch_totals, batch_totals.c.medicine_id == Medicine.id) \
+        .filter(total <= Medicine.min_stock_level) \
+        .order_by(Medicine.name)
+
+
+def _low_stock_export(args):
+    """Export builder for the low stock alert report"""
+    headers = ['Medicine', 'Generic Name', 'Dosage', 'Unit', 'Supplier', 'Min Level', 'Current Stock']
+    query = _low_stock_query(Medicine.name, Medicine.generic_name, Medicine.dosage,
+                             Medicine.unit, Medicine.supplier, Medicine.min_stock_level)
+    return headers, query
+
+
 @stock_bp.route('/low-stock-alerts')
 @role_required('H2', 'Director')
 def low_stock_alerts():
     """View low stock alerts (based on non-expired batches only)"""
-    # Get all medicines and filter by low stock using property (excludes expired batches)
-    all_medicines = Medicine.query.all()
-    medicines = [m for m in all_medicines if m.is_low_stock]
+    if request.args.get('format'):
+        return export_report('low-stock-alerts', _low_stock_export)
     
-    return render_template('stock/low_stock_alerts.html', medicines=medicines)
+    def render_content():
+        medicines = []
+        for medicine, total_batch_quantity in _low_stock_query(Medicine):
+            medicine.display_quantity = total_batch_quantity
+            medicines.append(medicine)
+        
+        return render_template('stock/_low_stock_alerts_content.html', medicines=medicines)
+    
+    # Batches expire at midnight, so today's date is part of the key
+    content = cache.fragment('stock.low_stock_alerts', ['medicines', 'medicine_batches'], render_content,
+                             key_parts=[datetime.now().date()])
+    
+    return render_template('stock/low_stock_alerts.html', content=content)
+
+
+def _stock_history_query(args):
+    """Stock movements matching the history filters"""
+    medicine_id = args.get('medicine_id', type=int)
+    movement_type = args.get('movement_type', '')
+    
+    query = StockMovement.query
+    
+    if medicine_id:
+        query = query.filter_by(medicine_id=medicine_id)
+    
+    if movement_type:
+        query = query.filter_by(movement_type=movement_type)
+    
+    return query
+
+
+def _stock_history_export(args):
+    """Export builder for the stock movement history"""
+    headers = ['Date', 'Medicine', 'Type', 'Quantity', 'Reason', 'Reference', 'User']
+    query = _stock_history_query(args).join(Medicine).join(User, StockMovement.user_id == User.id) \
+        .with_entities(
+            StockMovement.created_at, Medicine.name, StockMovement.movement_type, StockMovement.quantity,
+            StockMovement.reason, StockMovement.reference_id, User.username
+        ).order_by(StockMovement.created_at.desc(), StockMovement.id.desc())
+    return headers, query
 
 
 @stock_bp.route('/stock-history')
 @role_required('H2', 'Director')
 def stock_history():
     """View stock movement history"""
+    if request.args.get('format'):
+        return export_report('stock-history', _stock_history_export)
+    
     page = request.args.get('page', 1, type=int)
     medicine_id = request.args.get('medicine_id', type=int)
     movement_type = request.args.get('movement_type', '')
     
-    query = StockMovement.query
+    movements = _stock_history_query(request.args).order_by(StockMovement.created_at.desc()).paginate(page=page, per_page=50)
     
-    if medicine_id:
-        query = query.filter_by(medicine_id=medicine_id)
+    return render_template('stock/stock_history.html', logs=movements, medicine_id=medicine_id,
+                          movement_type=movement_type)
+
+
+def _reconciliation_export(args):
+    """Export builder for the stock reconciliation report"""
+    headers = ['ID', 'Medicine', 'Recorded Quantity', 'Batch Stock', 'Ledger Balance', 'Invalid Batches']
+    return headers, reconciliation_query(discrepancies_only=args.get('show') != 'all')
+
+
+@stock_bp.route('/reconciliation')
+@role_required('Director')
+def reconciliation():
+    """Compare recorded quantities, batch stock and the movement ledger"""
+    if request.args.get('format'):
+        return export_report('stock-reconciliation', _reconciliation_export)
     
-    if movement_type:
-        query = query.filter_by(movement_type=movement_type)
+    show = request.args.get('show', '')
+    rows = reconciliation_query(discrepancies_only=show != 'all').all()
+    
+    return render_template('stock/reconciliation.html', rows=rows, show=show)
+
+
+@stock_bp.route('/reconciliation/repair', methods=['POST'])
+@role_required('Director')
+def repair_reconciliation():
+    """Repair selected (or all) discrepancies in bulk"""
+    medicine_ids = request.form.getlist('medicine_ids', type=int)
+    
+    if not medicine_ids and request.form.get('scope') != 'all':
+        flash('Select the medicines to repair.', 'warning')
+        return redirect(url_for('stock.reconciliation'))
     
-    movements = query.order_by(StockMovement.created_at.desc()).paginate(page=page, per_page=50)
+    repaired, movements = repair_stock(current_user.id, medicine_ids or None)
+    db.session.commit()
+    
+    flash(f'Repaired {repaired} medicine(s); {movements} correcting stock movement(s) recorded.', 'success')
+    return redirect(url_for('stock.reconciliation'))
+
+
+EXPIRY_WINDOWS = (7, 30, 60, 90)
+
+
+def _expiry_export(args):
+    """Export builder for the expiring batches report"""
+    headers = ['Batch ID', 'Medicine ID', 'Medicine', 'Batch Number', 'Shelf', 'Expiry Date', 'Available',
+               'Unit Cost', 'Value']
+    days = args.get('days', 30, type=int)
+    if args.get('view') == 'expired':
+        return headers, expired_batches_query()
+    return headers, expiring_batches_query(days)
+
+
+@stock_bp.route('/expiry')
+@role_required('H2', 'Director')
+def expiry_report():
+    """Batches expiring soon, expired stock awaiting write-off and projected write-off value"""
+    if request.args.get('format'):
+        return export_report('expiry-report', _expiry_export)
+    
+    days = request.args.get('days', 30, type=int)
+    if days not in EXPIRY_WINDOWS:
+        days = 30
+    
+    def render_content():
+        return render_template('stock/_expiry_report_content.html', days=days, windows=EXPIRY_WINDOWS,
+                               summary=expiry_summary(days), forecast=write_off_forecast(3),
+                               expiring=expiring_batches_query(days).all(),
+                               expired=expired_batches_query().all())
     
-    return render_template('stock/stock_history.html', movements=movements, medicine_id=medicine_id)
+    # Batches expire at midnight, so today's date is part of the key; the write-off button is Director-only
+    content = cache.fragment('stock.expiry_report', ['medicines', 'medicine_batches'], render_content,
+                             key_parts=[days, current_user.role, datetime.now().date()])
+    
+    return render_template('stock/expiry_report.html', content=content)
+
+
+@stock_bp.route('/expiry/write-off', methods=['POST'])
+@role_required('Director')
+def write_off_expired_stock():
+    """Write off all expired stock now (normally done by the monthly job)"""
+    try:
+        batches, units, value = write_off_expired(current_user.id)
+    except WriteOffConflict:
+        db.session.rollback()
+        flash('Some expired stock was dispensed or adjusted during the write-off. Nothing was written off; '
+              'please try again.', 'warning')
+        return redirect(url_for('stock.expiry_report'))
+    db.session.commit()
+    
+    if batches:
+        flash(f'Wrote off {units} expired unit(s) from {batches} batch(es), value ₹{value:.2f}.', 'success')
+    else:
+        flash('No expired stock to write off.', 'info')
+    return redirect(url_for('stock.expiry_report'))
+
+
+@stock_bp.route('/reorder')
+@role_required('H2', 'Director')
+def reorder_report():
+    """
+    Suggested orders per supplier from forecast consumption
+
+    Read-only: the consumption series is kept up to date by the outbox consumer and
+    python cli.py refresh-consumption.
+    """
+    forecast = demand_forecast()
+    return render_template('stock/reorder_report.html', suppliers=reorder_suggestions(),
+                           forecast=forecast, show_all=request.args.get('show') == 'all')
 
 
 @stock_bp.route('/<int:medicine_id>/delete', methods=['POST'])
@@ -417,6 +659,7 @@ def bulk_upload_medicines():
             
             # Commit all successful entries
             if created > 0 or updated > 0:
+                emit('stock', 'bulk_uploaded', created=created, updated=updated)
                 db.session.commit()
                 flash(f'Successfully created {created} new medicine(s) and updated {updated} existing medicine(s).', 'success')
             
@@ -5,7 +5,7 @@ from flask import Blueprint, render_template, redirect, url_for, flash, request,
 from flask_login import current_user, login_required
 from datetime import datetime
 from ..extensions import db
-from app.models import Student, User
+from app.models import Student, User, DoctorVisit, Prescription
 from app.auth.utils import role_required
 import csv
 import io
@@ -126,8 +126,8 @@ def view_student(student_id):
         flash('You do not have permission to view this profile.', 'danger')
         return redirect(url_for('dashboards.dashboard'))
     
-    doctor_visits = student.doctor_visits
-    prescriptions = student.prescriptions
+    doctor_visits = student.doctor_visits.order_by(DoctorVisit.visit_date.asc(), DoctorVisit.id.asc()).all()
+    prescriptions = student.prescriptions.order_by(Prescription.created_at.asc(), Prescription.id.asc()).all()
     
     return render_template('students/profile.html', 
                           student=student, 
@@ -182,8 +182,8 @@ def health_history(student_id):
         flash('You do not have permission to view this profile.', 'danger')
         return redirect(url_for('dashboards.dashboard'))
     
-    doctor_visits = student.doctor_visits
-    prescriptions = student.prescriptions
+    doctor_visits = student.doctor_visits.order_by(DoctorVisit.visit_date.desc(), DoctorVisit.id.desc()).all()
+    prescriptions = student.prescriptions.order_by(Prescription.created_at.desc(), Prescription.id.desc()).all()
     
     return render_template('students/health_history.html',
                           student=student,
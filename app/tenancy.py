@@ -0,0 +1,121 @@
+"""
+Hostel tenancy
+
+Tables using the ``HostelScoped`` mixin are partitioned by hostel. The hostel
+a request works in is resolved once, before the view runs: staff assigned to
+a hostel always work in it, organisation-wide users (no hostel) pick one with
+the navbar switcher or see every hostel.
+
+Two session hooks then keep the views unaware of tenancy:
+
+* every ORM SELECT, UPDATE and DELETE gets ``hostel_id = :current`` added for
+  each scoped entity it touches (joins, subqueries and aliases included), so
+  list pages, counts and ``session.get`` by id only see the current hostel
+  and use the indexes that lead with ``hostel_id``
+* new scoped rows are stamped with the current hostel before they are
+  flushed; outside a hostel (CLI, background jobs) they take the hostel of
+  the row named by ``__hostel_parent__``
+
+Core statements on tables (bulk inserts, rollup upserts) are not rewritten;
+they set ``hostel_id`` explicitly. Jobs that must see every hostel, such as
+watermark-driven rollups, run inside ``all_hostels()``.
+"""
+from contextlib import contextmanager
+
+from flask import g, has_app_context, session as flask_session
+from flask_login import current_user
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, with_loader_criteria
+
+from .extensions import db, cache
+from .models import Hostel, HostelScoped
+
+_hooks_installed = False
+
+
+def current_hostel_id():
+    """Hostel the current request or job works in (None: every hostel)"""
+    return g.get('hostel_id') if has_app_context() else None
+
+
+@contextmanager
+def hostel_scope(hostel_id):
+    """Run a block as if working in ``hostel_id`` (None: every hostel)"""
+    previous = g.get('hostel_id')
+    g.hostel_id = hostel_id
+    try:
+        yield
+    finally:
+        g.hostel_id = previous
+
+
+def all_hostels():
+    """Run a block across every hostel, whichever one the request works in"""
+    return hostel_scope(None)
+
+
+def hostel_choices():
+    """(id, name) of every hostel, for select fields (cached until hostels change)"""
+    return cache.cached('tenancy.hostel_choices', ['hostels'], lambda: [
+        (hostel_id, name) for hostel_id, name in db.session.query(Hostel.id, Hostel.name).order_by(Hostel.name)
+    ])
+
+
+def init_tenancy(app):
+    """Resolve the current hostel for each request and install the session hooks"""
+    global _hooks_installed
+    if not _hooks_installed:
+        _install_tenancy_hooks()
+        _hooks_installed = True
+
+    @app.before_request
+    def resolve_hostel():
+        hostel_id = None
+        if current_user.is_authenticated:
+            hostel_id = current_user.hostel_id or flask_session.get('hostel_id')
+        g.hostel_id = hostel_id
+
+    @app.context_processor
+    def inject_hostel():
+        return {'current_hostel_id': g.get('hostel_id'), 'hostel_choices': hostel_choices}
+
+
+def _parent_hostel(session, obj):
+    """Hostel of the row a new object belongs to, via its ``__hostel_parent__`` key"""
+    column, table_name = obj.__hostel_parent__
+    parent_id = getattr(obj, column)
+    if parent_id is None:
+        return None
+    table = db.metadata.tables[table_name]
+    with session.no_autoflush:
+        return session.execute(select(table.c.hostel_id).where(table.c.id == parent_id)).scalar()
+
+
+def _install_tenancy_hooks():
+    """Filter ORM statements to the current hostel and stamp new rows with it"""
+
+    @event.listens_for(Session, 'do_orm_execute')
+    def _scope_statement(orm_execute_state):
+        if not orm_execute_state.is_orm_statement:
+            return
+        if not (orm_execute_state.is_select or orm_execute_state.is_update or orm_execute_state.is_delete):
+            return
+        if orm_execute_state.is_column_load or orm_execute_state.is_relationship_load:
+            return
+        hostel_id = current_hostel_id()
+        if hostel_id is None:
+            return
+        orm_execute_state.statement = orm_execute_state.statement.options(
+            with_loader_criteria(HostelScoped, lambda cls: cls.hostel_id == hostel_id, include_aliases=True)
+        )
+
+    @event.listens_for(Session, 'before_flush')
+    def _stamp_new_rows(session, flush_context, instances):
+        hostel_id = current_hostel_id()
+        for obj in session.new:
+            if not isinstance(obj, HostelScoped) or obj.hostel_id is not None:
+                continue
+            if hostel_id is not None:
+                obj.hostel_id = hostel_id
+            elif obj.__hostel_parent__:
+                obj.hostel_id = _parent_hostel(session, obj)
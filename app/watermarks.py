@@ -0,0 +1,76 @@
+"""
+Watermarks for incremental jobs
+
+A job that folds new source rows into a derived table (daily consumption,
+rollups, symptom counts) remembers how far it got by timestamp: each run
+reads only the rows stamped after the last run, up to a short settle lag
+behind now, so that a transaction stamped just before the run but committed
+after it is picked up next time rather than skipped. The watermark moves
+with a conditional UPDATE in the same transaction as the derived rows, so
+two runs racing over the same window can't both count it: the second one
+fails and rolls back.
+
+Append-only sources are windowed on their insert time (``created_at``), not
+their id: on databases with concurrent writers (PostgreSQL, MySQL) a lower
+id can commit after a higher one, which an id high-water mark would skip for
+good. Rows whose stamp changes after insert (a sick leave decision) are
+windowed on that stamp.
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_, update
+
+from .extensions import db
+from .models import ProcessingWatermark
+
+
+class WatermarkConflict(RuntimeError):
+    """Another run advanced the watermark first; roll back and retry"""
+
+
+def _get_or_create(name):
+    watermark = db.session.get(ProcessingWatermark, name)
+    if watermark is None:
+        watermark = ProcessingWatermark(name=name, last_id=0)
+        db.session.add(watermark)
+        db.session.flush()
+    return watermark
+
+
+def pending_window(name, settle_seconds):
+    """
+    Timestamp window a job still has to process
+
+    Returns:
+        (last_at, high) - process rows stamped after last_at (None: from the start) up to high
+    """
+    watermark = _get_or_create(name)
+    return watermark.last_at, datetime.utcnow() - timedelta(seconds=settle_seconds)
+
+
+def in_window(column, last_at, high):
+    """Criterion for rows stamped in the window; the first run (last_at None) also takes unstamped rows"""
+    if last_at is None:
+        return or_(column.is_(None), column <= high)
+    return and_(column > last_at, column <= high)
+
+
+def advance_window(name, last_at, high):
+    """Move the timestamp watermark from last_at to high; raises WatermarkConflict if it moved meanwhile"""
+    previous = ProcessingWatermark.last_at.is_(None) if last_at is None else ProcessingWatermark.last_at == last_at
+    result = db.session.execute(
+        update(ProcessingWatermark)
+        .where(ProcessingWatermark.name == name, previous)
+        .values(last_at=high, updated_at=datetime.utcnow())
+    )
+    if result.rowcount != 1:
+        raise WatermarkConflict(f'Watermark {name} moved past {last_at} during the run.')
+
+
+def reset(name):
+    """Forget a job's progress so the next run starts from the first source row"""
+    db.session.execute(
+        update(ProcessingWatermark)
+        .where(ProcessingWatermark.name == name)
+        .values(last_id=0, last_at=None, updated_at=datetime.utcnow())
+    )
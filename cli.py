@@ -3,12 +3,22 @@ CLI Commands for H2 System Database Management
 Usage: python cli.py <command>
 """
 
+import os
 import click
-from app import create_app, db
-from app.models import User, Student, Medicine
+from config import config
 
+# The app, models and SQLAlchemy are imported on first use so that `--help` and
+# commands that fail validation don't pay for building the whole application.
+_app = None
 
-app = create_app()
+
+def get_app():
+    """Create the application on first use (without blueprints - no command needs routes)"""
+    global _app
+    if _app is None:
+        from app import create_app
+        _app = create_app(load_routes=False)
+    return _app
 
 
 @click.group()
@@ -17,19 +27,171 @@ def cli():
     pass
 
 
+def recreate_rollups():
+    """
+    Rebuild the derived daily tables if they predate per-hostel rollups or timestamp watermarks
+
+    The rollups are derived data keyed by hostel, so an old table (keyed by
+    metric, day and dimension only, without an id) is dropped and recomputed from the visits,
+    equipment issues and sick leave decisions rather than altered. Jobs that
+    tracked their progress by source id are rebuilt the same way, since their
+    id can't be turned into the timestamp they now track.
+    """
+    from app import db
+    from app.models import DailyRollup, ProcessingWatermark
+    from app.analytics.rollups import rebuild_rollups
+    from app.analytics.surveillance import rebuild_surveillance
+    table = DailyRollup.__table__
+    inspector = db.inspect(db.engine)
+    if not inspector.has_table(table.name):
+        return False
+    old_table = 'id' not in {column['name'] for column in inspector.get_columns(table.name)}
+    if not old_table and not db.session.scalar(
+            db.select(db.func.count()).where(ProcessingWatermark.last_id > 0)):
+        return False
+    if old_table:
+        table.drop(db.engine)
+        table.create(db.engine)
+    rebuild_rollups()
+    rebuild_surveillance()
+    db.session.commit()
+    return True
+
+
+def add_missing_columns():
+    """Add nullable columns added to models after their tables already existed"""
+    from app import db
+    added = 0
+    with db.engine.begin() as connection:
+        inspector = db.inspect(connection)
+        existing_tables = set(inspector.get_table_names())
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing and column.nullable and not column.primary_key:
+                    column_type = column.type.compile(dialect=connection.dialect)
+                    connection.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}')
+                    added += 1
+    return added
+
+
+def backfill_hostel_ids():
+    """Give rows without a hostel the hostel of their parent row (tables scoped after they had data)"""
+    from sqlalchemy import select
+    from app import db
+    from app.models import HostelScoped
+    scoped = {mapper.class_.__tablename__: mapper.class_ for mapper in db.Model.registry.mappers
+              if issubclass(mapper.class_, HostelScoped) and mapper.class_.__hostel_parent__}
+    filled = 0
+    with db.engine.begin() as connection:
+        # Parents come before children, so a batch takes its medicine's hostel before its dispensings look
+        for table in db.metadata.sorted_tables:
+            model = scoped.get(table.name)
+            if model is None:
+                continue
+            column, parent_name = model.__hostel_parent__
+            parent = db.metadata.tables[parent_name]
+            parent_hostel = select(parent.c.hostel_id).where(parent.c.id == table.c[column]).scalar_subquery()
+            result = connection.execute(
+                table.update().where(table.c.hostel_id.is_(None), parent_hostel.isnot(None))
+                .values(hostel_id=parent_hostel)
+            )
+            filled += result.rowcount
+    return filled
+
+
+def create_missing_indexes():
+    """Create indexes added to models after their tables already existed"""
+    from app import db
+    created = 0
+    with db.engine.begin() as connection:
+        existing_tables = set(db.inspect(connection).get_table_names())
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {index['name'] for index in db.inspect(connection).get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(connection)
+                    created += 1
+    return created
+
+
+def migrate_unique_indexes():
+    """
+    Replace unique indexes that models have since relaxed or scoped per hostel
+
+    Databases created before hostels have UNIQUE indexes such as
+    ``ix_medicines_name``; the models now declare a plain index there plus a
+    unique (hostel_id, name) constraint, which is created as a unique index of
+    the same name (SQLite can't add constraints to an existing table).
+    """
+    from sqlalchemy import UniqueConstraint
+    from app import db
+    changed = 0
+    with db.engine.begin() as connection:
+        inspector = db.inspect(connection)
+        quote = connection.dialect.identifier_preparer.quote
+        existing_tables = set(inspector.get_table_names())
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            reflected = {index['name']: index for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                found = reflected.get(index.name)
+                if found and found['unique'] and not index.unique:
+                    index.drop(connection)
+                    index.create(connection)
+                    changed += 1
+            existing = set(reflected) | {constraint['name']
+                                         for constraint in inspector.get_unique_constraints(table.name)}
+            for constraint in table.constraints:
+                if isinstance(constraint, UniqueConstraint) and constraint.name and constraint.name not in existing:
+                    columns = ', '.join(quote(column.name) for column in constraint.columns)
+                    connection.exec_driver_sql(f'CREATE UNIQUE INDEX {quote(constraint.name)} '
+                                               f'ON {quote(table.name)} ({columns})')
+                    changed += 1
+    return changed
+
+
 @cli.command()
-def init_db():
-    """Initialize the database"""
-    with app.app_context():
+@click.option('--seed', is_flag=True, help='Also create the default users and sample equipment')
+def init_db(seed):
+    """Initialize the database (creates missing tables, columns and indexes)"""
+    from app import db
+    with get_app().app_context():
         db.create_all()
+        added = add_missing_columns()
+        filled = backfill_hostel_ids()
+        migrated = migrate_unique_indexes()
+        created = create_missing_indexes()
+        rebuilt = recreate_rollups()
         click.echo("✓ Database initialized successfully!")
+        if added:
+            click.echo(f"  - Added {added} missing column(s)")
+        if filled:
+            click.echo(f"  - Gave {filled} row(s) the hostel of their parent row")
+        if migrated:
+            click.echo(f"  - Replaced {migrated} unique index(es) with per-hostel ones")
+        if rebuilt:
+            click.echo("  - Rebuilt the daily rollups, symptom counts and consumption series")
+        if created:
+            click.echo(f"  - Created {created} missing index(es)")
+        
+        if seed:
+            from app.seed import create_default_users, create_sample_equipment
+            create_default_users()
+            create_sample_equipment()
 
 
 @cli.command()
 def reset_db():
     """Reset the database (WARNING: Deletes all data)"""
+    from app import db
     if click.confirm('This will delete all data. Are you sure?'):
-        with app.app_context():
+        with get_app().app_context():
             db.drop_all()
             db.create_all()
             click.echo("✓ Database reset successfully!")
@@ -40,7 +202,9 @@ def reset_db():
 @cli.command()
 def seed_db():
     """Seed database with sample data"""
-    with app.app_context():
+    from app import db
+    from app.models import User, Medicine
+    with get_app().app_context():
         # Check if admin exists
         admin = User.query.filter_by(username='admin').first()
         if admin:
@@ -106,7 +270,9 @@ def seed_db():
 @cli.command()
 def create_admin():
     """Create admin user"""
-    with app.app_context():
+    from app import db
+    from app.models import User
+    with get_app().app_context():
         admin = User.query.filter_by(username='admin').first()
         if admin:
             click.echo("✗ Admin user already exists!")
@@ -139,7 +305,9 @@ def create_admin():
               prompt='Role', help='User role')
 def create_user(username, password, email, first_name, last_name, role):
     """Create a new user"""
-    with app.app_context():
+    from app import db
+    from app.models import User
+    with get_app().app_context():
         if User.query.filter_by(username=username).first():
             click.echo(f"✗ User '{username}' already exists!")
             return
@@ -162,7 +330,8 @@ def create_user(username, password, email, first_name, last_name, role):
 @cli.command()
 def list_users():
     """List all users"""
-    with app.app_context():
+    from app.models import User
+    with get_app().app_context():
         users = User.query.all()
         
         if not users:
@@ -181,7 +350,9 @@ def list_users():
 @click.argument('username')
 def delete_user(username):
     """Delete a user"""
-    with app.app_context():
+    from app import db
+    from app.models import User
+    with get_app().app_context():
         user = User.query.filter_by(username=username).first()
         
         if not user:
@@ -199,8 +370,9 @@ def delete_user(username):
 @cli.command()
 def db_stats():
     """Show database statistics"""
-    with app.app_context():
-        from app.models import Student, DoctorVisit, Prescription, Asset, SickLeaveRequest
+    with get_app().app_context():
+        from app.models import (User, Student, DoctorVisit, Prescription, Medicine, Asset,
+                                SickLeaveRequest)
         
         click.echo("\n📊 Database Statistics:")
         click.echo("=" * 40)
@@ -214,5 +386,446 @@ def db_stats():
         click.echo("=" * 40)
 
 
+@cli.command()
+@click.option('--all', 'show_all', is_flag=True, help='List every medicine, not only discrepancies')
+@click.option('--medicine-id', 'medicine_ids', type=int, multiple=True, help='Only check these medicines')
+@click.option('--repair', is_flag=True, help='Align recorded quantities and the ledger with batch stock')
+@click.option('--user', 'username', default='admin', show_default=True,
+              help='User recorded on correcting stock movements')
+def reconcile_stock(show_all, medicine_ids, repair, username):
+    """Compare Medicine.quantity, batch stock and the stock movement ledger"""
+    import time
+
+    with get_app().app_context():
+        from app import db
+        from app.models import User
+        from app.stock.reconcile import reconciliation_query, repair_stock
+
+        started = time.perf_counter()
+        rows = reconciliation_query(discrepancies_only=not show_all, medicine_ids=medicine_ids).all()
+        elapsed = time.perf_counter() - started
+
+        click.echo(f"\n{'ID':>6}  {'Medicine':<30} {'Recorded':>9} {'Batches':>9} {'Ledger':>9} {'Invalid':>8}")
+        click.echo("-" * 76)
+        for row in rows:
+            click.echo(f"{row.id:>6}  {row.name[:30]:<30} {row.recorded:>9} {row.batches:>9} "
+                       f"{row.ledger:>9} {row.invalid_batches:>8}")
+
+        drifting = [row for row in rows if row.recorded != row.batches or row.ledger != row.batches]
+        click.echo("-" * 76)
+        click.echo(f"{len(drifting)} medicine(s) out of balance, "
+                   f"{sum(1 for row in rows if row.invalid_batches)} with invalid batches "
+                   f"(checked in {elapsed:.2f}s)")
+
+        if repair and drifting:
+            user = User.query.filter_by(username=username).first()
+            if not user:
+                raise click.ClickException(f"User '{username}' not found")
+            repaired, movements = repair_stock(user.id, medicine_ids or None)
+            db.session.commit()
+            click.echo(f"✓ Repaired {repaired} medicine(s), recorded {movements} correcting movement(s)")
+
+
+@cli.command()
+@click.option('--all', 'show_all', is_flag=True, help='List every equipment item, not only discrepancies')
+@click.option('--repair', is_flag=True, help='Rewrite drifting counters from the issue records')
+def reconcile_equipment(show_all, repair):
+    """Compare equipment counters with the equipment issue records"""
+    import time
+
+    with get_app().app_context():
+        from app import db
+        from app.equipment.ledger import reconciliation_query, repair_counters
+
+        started = time.perf_counter()
+        rows = reconciliation_query(discrepancies_only=not show_all).all()
+        elapsed = time.perf_counter() - started
+
+        click.echo(f"\n{'Code':<12} {'Equipment':<24} {'Available':>13} {'Issued':>11} {'Damaged':>11} {'Lost':>11}")
+        click.echo("-" * 86)
+        for row in rows:
+            click.echo(f"{row.equipment_code[:12]:<12} {row.name[:24]:<24} "
+                       f"{row.available:>5} -> {row.expected_available:<5} {row.issued:>4} -> {row.expected_issued:<4} "
+                       f"{row.damaged:>4} -> {row.expected_damaged:<4} {row.lost:>4} -> {row.expected_lost:<4}")
+
+        drifting = [row for row in rows if (row.available, row.issued, row.damaged, row.lost) !=
+                    (row.expected_available, row.expected_issued, row.expected_damaged, row.expected_lost)]
+        click.echo("-" * 86)
+        click.echo(f"{len(drifting)} equipment item(s) out of step with their issues (checked in {elapsed:.2f}s)")
+
+        if repair and drifting:
+            repaired = repair_counters()
+            db.session.commit()
+            click.echo(f"✓ Repaired the counters of {repaired} equipment item(s)")
+
+
+@cli.command()
+def sweep_overdue():
+    """Mark equipment issues past due as Overdue and bring their penalties up to date (run hourly from cron)"""
+    with get_app().app_context():
+        from app import db
+        from app.equipment.penalties import sweep_overdue as sweep
+
+        updated = sweep()
+        db.session.commit()
+        click.echo(f"✓ Updated {updated} overdue issue(s)")
+
+
+@cli.command()
+def expire_reservations():
+    """Close equipment reservations whose end date passed without being issued (run daily from cron)"""
+    with get_app().app_context():
+        from app import db
+        from app.equipment.ledger import expire_reservations as expire
+
+        expired = expire()
+        db.session.commit()
+        click.echo(f"✓ Expired {expired} reservation(s)")
+
+
+@cli.command()
+@click.option('--category', default='default', show_default=True, help='Category the changed rule applies to')
+@click.option('--damage-rate', type=float, help='Fraction of unit cost charged for damage')
+@click.option('--loss-rate', type=float, help='Fraction of unit cost charged for a loss')
+@click.option('--daily-rate', type=float, help='Charge per unit per late day, instead of each item\'s own')
+@click.option('--grace-days', type=int, help='Late days not charged')
+@click.option('--max-late-days', type=int, help='Late days charged at most')
+@click.option('--cap', type=float, help='Most charged per unit, as a fraction of unit cost')
+@click.option('--since', type=click.DateTime(formats=['%Y-%m-%d']), help='Only returns on or after this date')
+def reprice_penalties(category, since, **settings):
+    """What-if: re-price returned equipment under changed penalty rules"""
+    with get_app().app_context():
+        from app.models import EquipmentIssue
+        from app.equipment.penalties import reprice
+
+        rule = {name: value for name, value in settings.items() if value is not None}
+        if not rule:
+            click.echo("⚠ Nothing to change; pass at least one rule setting (see --help)")
+            return
+        criteria = [EquipmentIssue.actual_return_date >= since] if since else []
+        rows = reprice({category: rule}, *criteria)
+
+        click.echo(f"\n{'Category':<20} {'Issues':>7} {'Charged':>12} {'Repriced':>12} {'Difference':>12}")
+        click.echo("-" * 67)
+        for row in rows:
+            click.echo(f"{row['category'][:20]:<20} {row['issues']:>7} {row['charged']:>12.2f} "
+                       f"{row['repriced']:>12.2f} {row['difference']:>+12.2f}")
+        click.echo("-" * 67)
+        charged = sum(row['charged'] for row in rows)
+        repriced = sum(row['repriced'] for row in rows)
+        click.echo(f"{'Total':<20} {sum(row['issues'] for row in rows):>7} {charged:>12.2f} {repriced:>12.2f} "
+                   f"{repriced - charged:>+12.2f}")
+
+
+@cli.command()
+@click.option('--dry-run', is_flag=True, help='Only report what would be written off')
+@click.option('--user', 'username', default='admin', show_default=True,
+              help='User recorded on the LOSS movements')
+def write_off_expired(dry_run, username):
+    """Zero expired medicine batches and record LOSS movements (run monthly from cron)"""
+    with get_app().app_context():
+        from app import db
+        from app.models import User
+        from app.stock.expiry import WriteOffConflict, expiry_summary, write_off_expired as write_off
+
+        expired = expiry_summary()['expired']
+        click.echo(f"{expired['units']} expired unit(s) in {expired['batches']} batch(es), "
+                   f"value {expired['value']:.2f}")
+        if dry_run or not expired['batches']:
+            return
+
+        user = User.query.filter_by(username=username).first()
+        if not user:
+            raise click.ClickException(f"User '{username}' not found")
+        try:
+            batches, units, value = write_off(user.id)
+        except WriteOffConflict as exc:
+            db.session.rollback()
+            raise click.ClickException(f'{exc}; nothing was written off, run it again')
+        db.session.commit()
+        click.echo(f"✓ Wrote off {units} unit(s) from {batches} batch(es), value {value:.2f}")
+
+
+@cli.command()
+@click.option('--rebuild', is_flag=True, help='Discard the daily series and rebuild it from all movements')
+def refresh_consumption(rebuild):
+    """Fold new DISPENSE movements into the daily consumption series used for reorder suggestions"""
+    with get_app().app_context():
+        from app import db
+        from app.stock.forecast import rebuild_consumption, refresh_consumption as refresh
+
+        changed = rebuild_consumption() if rebuild else refresh()
+        db.session.commit()
+        click.echo(f"✓ Updated {changed} daily consumption total(s)")
+
+
+@cli.command()
+@click.option('--rebuild', is_flag=True, help='Discard the rollups and recompute them from all source rows')
+def refresh_rollups(rebuild):
+    """Fold new activity into the daily rollup tables behind the trends view (run from cron)"""
+    import time
+
+    with get_app().app_context():
+        from app import db
+        from app.analytics.rollups import rebuild_rollups, refresh_rollups as refresh
+
+        started = time.perf_counter()
+        changed = rebuild_rollups() if rebuild else refresh()
+        db.session.commit()
+        click.echo(f"✓ Updated {changed} daily total(s) in {time.perf_counter() - started:.2f}s")
+
+
+@cli.command()
+@click.option('--rebuild', is_flag=True, help='Discard the symptom counts and tokenise every visit again')
+def surveillance(rebuild):
+    """Tokenise new doctor visits and report symptom spikes (run from cron)"""
+    import time
+
+    with get_app().app_context():
+        from app import db
+        from app.analytics.surveillance import outbreak_alerts, rebuild_surveillance, refresh_surveillance
+
+        started = time.perf_counter()
+        changed = rebuild_surveillance() if rebuild else refresh_surveillance()
+        db.session.commit()
+        click.echo(f"✓ Updated {changed} daily symptom count(s) in {time.perf_counter() - started:.2f}s")
+
+        alerts = outbreak_alerts()
+        for alert in alerts:
+            where = f"block {alert['block']}" if alert['block'] else 'whole hostel'
+            click.echo(f"⚠ {alert['symptom']} ({where}): {alert['observed']} case(s), "
+                       f"{alert['expected']:.1f} expected, score {alert['score']:.1f}")
+        if not alerts:
+            click.echo("No unusual symptom clusters")
+
+
+@cli.command()
+@click.argument('name')
+@click.argument('code')
+def create_hostel(name, code):
+    """Register a hostel (tenant) by name and short code"""
+    from app import db
+    from app.models import Hostel
+    with get_app().app_context():
+        if Hostel.query.filter((Hostel.name == name) | (Hostel.code == code)).first():
+            click.echo(f"✗ A hostel named '{name}' or coded '{code}' already exists!")
+            return
+        
+        hostel = Hostel(name=name, code=code)
+        db.session.add(hostel)
+        db.session.commit()
+        click.echo(f"✓ Hostel '{name}' ({code}) created with id {hostel.id}")
+
+
+@cli.command()
+@click.option('--hostel', 'code', required=True, help='Code of the hostel to assign')
+@click.option('--users', 'usernames', multiple=True, help='Also assign these users to the hostel')
+def assign_hostel(code, usernames):
+    """Move every row without a hostel (single-hostel data) into a hostel"""
+    from sqlalchemy import update
+    from app import db
+    from app.models import Hostel, HostelScoped, User
+    with get_app().app_context():
+        hostel = Hostel.query.filter_by(code=code).first()
+        if not hostel:
+            click.echo(f"✗ Hostel '{code}' not found!")
+            return
+        
+        for mapper in sorted(db.Model.registry.mappers, key=lambda m: m.class_.__name__):
+            model = mapper.class_
+            if not issubclass(model, HostelScoped):
+                continue
+            result = db.session.execute(
+                update(model).where(model.hostel_id.is_(None)).values(hostel_id=hostel.id)
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount:
+                click.echo(f"  - {model.__tablename__}: {result.rowcount} row(s)")
+        
+        assigned = []
+        for username in usernames:
+            user = User.query.filter_by(username=username).first()
+            if user:
+                user.hostel_id = hostel.id
+                assigned.append(user.id)
+            else:
+                click.echo(f"⚠ User '{username}' not found, skipped")
+        
+        db.session.commit()
+        from app.auth.utils import invalidate_user
+        for user_id in assigned:
+            invalidate_user(user_id)
+        click.echo(f"✓ Assigned unscoped rows to hostel '{hostel.name}'")
+
+
+@cli.command()
+@click.option('--loop', is_flag=True, help='Keep polling for new events until interrupted')
+@click.option('--interval', default=5.0, show_default=True, help='Seconds between polls with --loop')
+@click.option('--purge', is_flag=True, help='Also delete events dispatched before OUTBOX_RETENTION_DAYS')
+def dispatch_events(loop, interval, purge):
+    """Deliver pending outbox events to their consumers"""
+    import time
+
+    app = get_app()
+    with app.app_context():
+        from sqlalchemy import func
+        from app import db
+        from app.models import OutboxEvent
+        from app.outbox import dispatch_pending, purge_dispatched
+
+        while True:
+            delivered, failed = dispatch_pending()
+            if delivered or failed:
+                click.echo(f"Delivered {delivered} event(s), {failed} failed")
+            if not loop:
+                break
+            if delivered + failed < app.config['OUTBOX_BATCH_SIZE']:
+                time.sleep(interval)
+
+        stuck = db.session.scalar(
+            db.select(func.count(OutboxEvent.id)).where(
+                OutboxEvent.dispatched_at.is_(None),
+                OutboxEvent.attempts >= app.config['OUTBOX_MAX_ATTEMPTS']))
+        if stuck:
+            click.echo(f"⚠ {stuck} event(s) exceeded OUTBOX_MAX_ATTEMPTS and need attention (see last_error)")
+
+        if purge:
+            removed = purge_dispatched(app.config['OUTBOX_RETENTION_DAYS'])
+            click.echo(f"✓ Purged {removed} dispatched event(s)")
+
+
+@cli.command()
+@click.option('--hours', type=float, help='Delete exports older than this (default: EXPORT_RETENTION_HOURS)')
+def purge_exports(hours):
+    """Delete background export files older than the retention period"""
+    app = get_app()
+    with app.app_context():
+        from app.exports.utils import purge_exports as purge
+
+        removed = purge(app.config['EXPORT_RETENTION_HOURS'] if hours is None else hours)
+        click.echo(f"✓ Removed {removed} export(s)")
+
+
+@cli.command()
+@click.option('--config-name', default=lambda: os.environ.get('FLASK_ENV', 'production'),
+              type=click.Choice(list(config)), help='Configuration to serve (default: FLASK_ENV or production)')
+@click.option('--bind', help='Address to listen on, e.g. 0.0.0.0:5000')
+@click.option('--workers', type=int, help='Number of worker processes')
+@click.option('--threads', type=int, help='Threads per worker process')
+@click.option('--timeout', type=int, help='Seconds before a stuck worker is restarted')
+@click.option('--keepalive', type=int, help='Seconds to hold idle keep-alive connections')
+@click.option('--preload/--no-preload', default=None, help='Load the app once before forking workers')
+def serve(config_name, bind, workers, threads, timeout, keepalive, preload):
+    """Run the production server (multi-worker, multi-threaded)"""
+    from app import create_app
+    from app.server import run_server, server_options
+    
+    config_class = config[config_name]
+    settings = {key: getattr(config_class, key) for key in dir(config_class) if key.startswith('SERVER_')}
+    options = server_options(settings, bind=bind, workers=workers, threads=threads,
+                             timeout=timeout, keepalive=keepalive, preload_app=preload)
+    
+    # An in-process fragment cache would only see the invalidations of its own worker
+    overrides = {}
+    if options['workers'] > 1 and config_class.FRAGMENT_CACHE_BACKEND == 'lru':
+        if os.environ.get('FRAGMENT_CACHE_BACKEND') == 'lru':
+            raise click.ClickException('FRAGMENT_CACHE_BACKEND=lru is per process and would serve stale pages '
+                                       'with several workers; use filesystem or null, or --workers 1')
+        overrides['FRAGMENT_CACHE_BACKEND'] = 'filesystem'
+    
+    click.echo(f"Serving H2 System ({config_name}) on http://{options['bind']} "
+               f"with {options['workers']} worker(s) x {options['threads']} thread(s)"
+               f"{' [preload]' if options['preload_app'] else ''}")
+    if overrides:
+        click.echo("  - Fragment cache: filesystem (shared by the workers)")
+    
+    try:
+        run_server(lambda: create_app(config_name, overrides=overrides), options)
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+
+
+@cli.command()
+def build_static():
+    """Fingerprint, precompress and convert static files for production"""
+    from app.static_build import build_static as run_build, brotli, Image
+    
+    app = get_app()
+    manifest = run_build(app)
+    
+    click.echo(f"✓ Built {len(manifest['files'])} static file(s) into "
+               f"app/static/{app.config['STATIC_BUILD_DIR']}/")
+    click.echo(f"  - Compression: gzip{' + brotli' if brotli else ' (install brotli for .br files)'}")
+    if Image is None:
+        click.echo("  - WebP variants skipped (install Pillow to enable)")
+    else:
+        click.echo(f"  - WebP variants: {len(manifest['webp'])}")
+
+
+_STARTUP_SCRIPT = """
+import sys, time
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+create_app(sys.argv[1], load_routes=sys.argv[2] == '1')
+print(imported - started, time.perf_counter() - imported)
+"""
+
+
+def _measure_startup(config_name, load_routes):
+    """Run one cold start in a fresh interpreter; return (import_s, create_s, importtime lines)"""
+    import subprocess
+    import sys
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', _STARTUP_SCRIPT, config_name, '1' if load_routes else '0'],
+        capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    import_s, create_s = (float(value) for value in result.stdout.split()[-2:])
+    return import_s, create_s, result.stderr.splitlines()
+
+
+@cli.command()
+@click.option('--runs', default=5, show_default=True, help='Cold starts to measure')
+@click.option('--top', default=10, show_default=True, help='Slowest modules to list')
+@click.option('--config-name', default='testing', type=click.Choice(list(config)), show_default=True)
+@click.option('--max-ms', type=float, help='Fail if median import + create_app() exceeds this')
+def profile_startup(runs, top, config_name, max_ms):
+    """Benchmark cold import and create_app() time"""
+    from statistics import median
+    
+    click.echo(f"\n⏱  Startup profile ({runs} cold run(s), config '{config_name}')")
+    click.echo("=" * 60)
+    
+    totals = {}
+    for load_routes in (True, False):
+        samples = [_measure_startup(config_name, load_routes) for _ in range(runs)]
+        import_ms = median(s[0] for s in samples) * 1000
+        create_ms = median(s[1] for s in samples) * 1000
+        totals[load_routes] = import_ms + create_ms
+        label = 'create_app()' if load_routes else 'create_app(load_routes=False)'
+        click.echo(f"{label:32} import {import_ms:7.1f} ms | build {create_ms:7.1f} ms | "
+                   f"total {import_ms + create_ms:7.1f} ms")
+        if load_routes:
+            importtime_lines = samples[-1][2]
+    
+    # "import time: self [us] | cumulative | imported package"
+    modules = []
+    for line in importtime_lines:
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules.append((int(self_us), int(cumulative_us), name.strip()))
+    
+    click.echo(f"\nSlowest modules by self time (full app):")
+    for self_us, cumulative_us, name in sorted(modules, reverse=True)[:top]:
+        click.echo(f"  {self_us / 1000:7.1f} ms  (cumulative {cumulative_us / 1000:7.1f} ms)  {name}")
+    
+    app_us = sum(self_us for self_us, _, name in modules if name == 'app' or name.startswith('app.'))
+    click.echo(f"\nApplication modules (app.*): {app_us / 1000:.1f} ms self time")
+    click.echo("=" * 60)
+    
+    if max_ms is not None and totals[True] > max_ms:
+        raise click.ClickException(f"Startup took {totals[True]:.1f} ms (limit {max_ms:.1f} ms)")
+
+
 if __name__ == '__main__':
     cli()
@@ -4,6 +4,8 @@ Configuration file for H2 System (Health & Hostel Management System)
 import os
 from datetime import timedelta
 
+basedir = os.path.abspath(os.path.dirname(__file__))
+
 class Config:
     """Base configuration"""
     # Flask settings
@@ -26,12 +28,119 @@ class Config:
     SESSION_COOKIE_SECURE = False  # Set to False for development
     SESSION_COOKIE_HTTPONLY = True
     SESSION_COOKIE_SAMESITE = 'Lax'
+    
+    # Report exports
+    EXPORT_FOLDER = os.environ.get('EXPORT_FOLDER') or os.path.join(basedir, 'exports')
+    EXPORT_BATCH_SIZE = 1000  # Rows fetched per server-side cursor batch
+    EXPORT_BACKGROUND_THRESHOLD = 20000  # Larger exports are written in the background
+    EXPORT_WORKERS = 2
+    EXPORT_RETENTION_HOURS = 24  # Background export files kept before they are deleted
+    
+    # Rendered fragment cache: 'lru' (per process), 'filesystem' (shared by all workers) or 'null'
+    # cli.py serve uses 'filesystem' instead of the default 'lru' when it runs several workers, so
+    # invalidations reach every worker (and refuses an explicit FRAGMENT_CACHE_BACKEND=lru there)
+    FRAGMENT_CACHE_BACKEND = os.environ.get('FRAGMENT_CACHE_BACKEND') or 'lru'
+    FRAGMENT_CACHE_DIR = os.environ.get('FRAGMENT_CACHE_DIR') or os.path.join(basedir, 'cache')
+    FRAGMENT_CACHE_MAX_ENTRIES = 512
+    FRAGMENT_CACHE_TIMEOUT = 3600  # Seconds; entries are also invalidated by table writes
+    
+    # Per-process cache of logged-in users so requests don't query the users table
+    USER_CACHE_TTL = 60  # Seconds before a cached user is reloaded from the database
+    USER_CACHE_MAX_ENTRIES = 1024
+    
+    # Password hashing; existing hashes are upgraded on the next successful login when these change
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD') or 'scrypt:32768:8:1'
+    PASSWORD_SALT_LENGTH = 16
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS') or 4)  # Hashes run concurrently
+    PASSWORD_HASH_QUEUE = 16  # Logins allowed to wait for a hashing worker before being turned away
+    PASSWORD_HASH_TIMEOUT = 10  # Seconds
+    
+    # Login rate limiting (token bucket per username and per client IP)
+    LOGIN_RATE_LIMIT_WINDOW = 60  # Seconds for a bucket to refill completely
+    LOGIN_RATE_LIMIT_PER_USER = 5
+    LOGIN_RATE_LIMIT_PER_IP = 100  # Hostel networks put many students behind one address
+    
+    # Production server (python cli.py serve)
+    SERVER_BIND = os.environ.get('SERVER_BIND') or '0.0.0.0:5000'
+    SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS') or 0)  # 0 = (2 x CPU cores) + 1
+    SERVER_THREADS = int(os.environ.get('SERVER_THREADS') or 8)  # Threads per worker (live streams hold one each)
+    SERVER_KEEPALIVE = 5  # Seconds to hold idle keep-alive connections
+    SERVER_TIMEOUT = 60  # Seconds before a stuck worker is restarted
+    SERVER_GRACEFUL_TIMEOUT = 30  # Seconds workers get to finish requests on restart
+    SERVER_MAX_REQUESTS = 2000  # Recycle workers periodically to bound memory growth
+    SERVER_MAX_REQUESTS_JITTER = 200
+    SERVER_PRELOAD = True  # Import the app once in the master and share it with forked workers
+    SERVER_ACCESS_LOG = os.environ.get('SERVER_ACCESS_LOG') or None  # '-' for stdout
+    
+    # Static asset pipeline (python cli.py build-static)
+    STATIC_USE_MANIFEST = True  # Serve fingerprinted files from the last build when available
+    STATIC_BUILD_DIR = 'build'  # Output folder inside app/static
+    STATIC_MAX_AGE = 31536000  # One year; built file names change whenever their content does
+    STATIC_COMPRESS_MIN_SIZE = 512  # Bytes; smaller text files aren't worth precompressing
+    STATIC_WEBP_MIN_SIZE = 50 * 1024  # Bytes; smaller images are served as they are
+    STATIC_IMAGE_MAX_WIDTH = 800  # Pixels; WebP variants are scaled down to this width
+    STATIC_WEBP_QUALITY = 80
+    
+    # Compression of dynamic responses (brotli is used when installed and preferred by the client)
+    COMPRESS_MIN_SIZE = 500  # Bytes; smaller responses are sent as they are
+    COMPRESS_GZIP_LEVEL = 6
+    COMPRESS_BROTLI_QUALITY = 4  # Fast setting suited to on-the-fly compression
+    
+    # Read-only JSON API (/api/v1)
+    API_PAGE_SIZE = 50
+    API_MAX_PAGE_SIZE = 500
+    
+    # Live dashboard updates over server-sent events (/live/stream)
+    # 'sqlite' shares events between worker processes on one host; 'local' keeps them in-process
+    LIVE_BROKER = os.environ.get('LIVE_BROKER') or 'sqlite'
+    LIVE_BROKER_PATH = os.environ.get('LIVE_BROKER_PATH') or os.path.join(basedir, 'cache', 'live_events.db')
+    LIVE_POLL_INTERVAL = 1.0  # Seconds between checks for new events (sqlite broker)
+    LIVE_HEARTBEAT = 15  # Seconds between keep-alive comments on an idle stream
+    LIVE_STREAM_DURATION = 5  # Seconds a stream stays open (holding a server thread) before it closes
+    LIVE_RECONNECT = 5  # Seconds the browser waits before reopening it; missed events are replayed
+    
+    # Outbox of domain events: 'background' (thread pool after each commit), 'inline' (end of request)
+    # or 'manual' (only python cli.py dispatch-events)
+    OUTBOX_DISPATCH = os.environ.get('OUTBOX_DISPATCH') or 'background'
+    OUTBOX_BATCH_SIZE = 100  # Events claimed per dispatch pass
+    OUTBOX_LEASE_SECONDS = 60  # An interrupted delivery is retried after this long
+    OUTBOX_MAX_ATTEMPTS = 5  # Events failing this often are left for inspection
+    OUTBOX_RETENTION_DAYS = 7  # Dispatched events kept before dispatch-events --purge removes them
+    
+    # Consumption forecasting and reorder suggestions (/stock/reorder)
+    REORDER_HISTORY_DAYS = 90  # Days of dispensing history the demand forecast is based on
+    REORDER_LEAD_TIME_DAYS = 7  # Days between placing an order and receiving it
+    REORDER_REVIEW_DAYS = 30  # Days of demand each order should cover
+    REORDER_SERVICE_FACTOR = 1.65  # Safety stock in standard deviations of demand (1.65 = 95% service level)
+    
+    # Daily rollups behind the trends view (/analytics/trends, python cli.py refresh-rollups)
+    ROLLUP_SETTLE_SECONDS = 60  # Rows stamped this recently wait for the next run, in case still uncommitted
+    
+    # Sick leave approval SLA report (/analytics/sla)
+    SICKLEAVE_STAGE_TARGET_HOURS = 24  # Each approval stage should decide within this many hours
+    SLA_CACHE_SECONDS = 300  # Queue ages are recomputed at least this often
+    
+    # Outbreak surveillance over doctor visits (/analytics/outbreaks, python cli.py surveillance)
+    SURVEILLANCE_BATCH_SIZE = 5000  # Visits streamed per batch while tokenising
+    OUTBREAK_WINDOW_DAYS = 2  # Recent days compared with the baseline
+    OUTBREAK_BASELINE_DAYS = 28  # Days before the window that give the expected daily cases
+    OUTBREAK_MIN_CASES = 5  # Fewer recent cases than this are never flagged
+    OUTBREAK_Z_THRESHOLD = 3.0  # Standard deviations above the baseline that count as a spike
+    
+    # Equipment penalty rules per category (app/equipment/penalties.py); categories not listed use 'default'.
+    # Settings: damage_rate, loss_rate (fractions of unit cost), daily_rate (None: the equipment's daily_penalty),
+    # grace_days, max_late_days and cap (most charged per unit, as a fraction of unit cost)
+    EQUIPMENT_PENALTY_RULES = {
+        'default': {'damage_rate': 0.5, 'loss_rate': 1.0, 'grace_days': 0},
+    }
 
 
 class DevelopmentConfig(Config):
     """Development configuration"""
     DEBUG = True
     TESTING = False
+    STATIC_USE_MANIFEST = False  # Edits to static files show up without rebuilding
+    LIVE_BROKER = 'local'  # The development server runs a single process
     SESSION_COOKIE_SECURE = False
     REMEMBER_COOKIE_SECURE = False
 
@@ -41,6 +150,9 @@ class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     WTF_CSRF_ENABLED = False
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha256:1000'  # Fast hashes keep test setup quick
+    LIVE_BROKER = 'local'
+    OUTBOX_DISPATCH = 'inline'  # The in-memory database can't be shared with a background thread
 
 
 class ProductionConfig(Config):
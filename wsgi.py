@@ -0,0 +1,10 @@
+"""
+WSGI entry point for H2 System
+
+Used by external servers, e.g. ``gunicorn wsgi:app``. ``python cli.py serve``
+runs gunicorn with the tuned settings from config.py.
+"""
+import os
+from app import create_app
+
+app = create_app(os.environ.get('FLASK_ENV', 'production'))